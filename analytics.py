@@ -0,0 +1,174 @@
+import sqlite3
+import threading
+
+import numpy as np
+
+# Numeric columns of company_profile that can be aggregated and filtered on
+METRICS = [
+    'people_count', 'senior_people_count', 'emails_count', 'personal_emails_count', 'phones_count',
+    'addresses_count', 'investors_count', 'clients_count', 'partners_count', 'changes_count',
+    'people_changes_count', 'contact_changes_count',
+]
+
+OPERATORS = {
+    'gt': np.greater,
+    'ge': np.greater_equal,
+    'lt': np.less,
+    'le': np.less_equal,
+    'eq': np.equal,
+    'ne': np.not_equal,
+}
+
+LOAD_BATCH_SIZE = 100000
+
+
+def parse_filters(filters):
+    # "metric:op:value" strings, e.g. "investors_count:gt:5". Raises ValueError on anything else.
+    parsed = []
+    for text in filters or []:
+        parts = text.split(':')
+        if len(parts) != 3 or parts[0] not in METRICS or parts[1] not in OPERATORS:
+            raise ValueError(f"Invalid filter {text!r}, expected metric:op:value with op one of {', '.join(OPERATORS)}")
+        try:
+            value = float(parts[2])
+        except ValueError:
+            raise ValueError(f"Invalid filter value {parts[2]!r}")
+        parsed.append((parts[0], parts[1], value))
+    return parsed
+
+
+class MetricColumns:
+    # Immutable column snapshot of one dataset version. Each metric is a contiguous float32 array in
+    # id order with NaN for NULL; float32 holds every count below 2**24 exactly and halves the memory
+    # of float64. Aggregates accumulate in float64.
+    def __init__(self, version: int, ids, values):
+        self.version = version
+        self.ids = ids
+        self.values = np.ascontiguousarray(values)
+        self.rows = len(ids)
+        self.index = {metric: i for i, metric in enumerate(METRICS)}
+        self.null_counts = np.isnan(values).sum(axis=1)
+
+    @classmethod
+    def load(cls, conn: sqlite3.Connection, version: int):
+        # The count that sizes the arrays and the rows that fill them are read in one transaction, so
+        # an import committing in between cannot change the row count under the loader
+        own_transaction = not conn.in_transaction
+        if own_transaction:
+            conn.execute("BEGIN")
+        try:
+            rows = conn.execute("SELECT COUNT(*) FROM company_profile").fetchone()[0]
+            ids = np.empty(rows, dtype=np.int64)
+            values = np.empty((len(METRICS), rows), dtype=np.float32)
+            cursor = conn.execute(f"SELECT id, {', '.join(METRICS)} FROM company_profile ORDER BY id")
+            start = 0
+            while True:
+                batch = cursor.fetchmany(LOAD_BATCH_SIZE)
+                if not batch:
+                    break
+                # None becomes NaN when the batch is converted to a float array
+                block = np.array(batch, dtype=np.float64)
+                end = start + len(batch)
+                ids[start:end] = block[:, 0]
+                values[:, start:end] = block[:, 1:].T
+                start = end
+        finally:
+            if own_transaction:
+                conn.rollback()
+        return cls(version, ids[:start], values[:, :start])
+
+    def column(self, metric: str):
+        return self.values[self.index[metric]]
+
+    def mask(self, filters):
+        # Rows matching every filter; comparisons against NULL (NaN) are always false
+        mask = np.ones(self.rows, dtype=bool)
+        for metric, op, value in filters:
+            mask &= OPERATORS[op](self.column(metric), value)
+        return mask
+
+    def selected(self, metric: str, mask):
+        values = self.column(metric)
+        if mask is not None:
+            values = values[mask]
+        elif not self.null_counts[self.index[metric]]:
+            return values
+        return values[~np.isnan(values)]
+
+    def aggregate(self, metric: str, mask=None, percentiles=()):
+        values = self.selected(metric, mask)
+        if not len(values):
+            result = {"count": 0, "sum": 0, "mean": None, "std": None, "min": None, "max": None}
+            if percentiles:
+                result["percentiles"] = {f"{p:g}": None for p in percentiles}
+            return result
+        # One float64 copy serves the sum and the sum of squares; np.std would make several temporaries
+        wide = values.astype(np.float64)
+        total = wide.sum()
+        mean = total / len(wide)
+        variance = max(float(np.dot(wide, wide)) / len(wide) - mean * mean, 0.0)
+        result = {
+            "count": int(len(values)),
+            "sum": int(total),
+            "mean": float(mean),
+            "std": float(variance ** 0.5),
+            "min": int(values.min()),
+            "max": int(values.max()),
+        }
+        if percentiles:
+            points = np.percentile(values, percentiles)
+            result["percentiles"] = {f"{p:g}": float(v) for p, v in zip(percentiles, points)}
+        return result
+
+    def histogram(self, metric: str, mask=None, bins: int = 20, lower: float = None, upper: float = None,
+                  log: bool = False):
+        values = self.selected(metric, mask)
+        explicit = lower is not None or upper is not None
+        if lower is None:
+            lower = float(values.min()) if len(values) else 0.0
+        if upper is None:
+            upper = float(values.max()) if len(values) else lower
+        if upper <= lower:
+            # A range the caller asked for must be valid; one taken from the data is only empty when
+            # every selected value is the same, and is widened to a single bin width
+            if explicit:
+                raise ValueError(f"upper ({upper:g}) must be greater than lower ({lower:g})")
+            upper = lower + 1
+        if log:
+            # Counts are heavily skewed, so log-spaced bins starting at 1 are usually more useful
+            edges = np.concatenate(([lower], np.geomspace(max(lower, 1), upper, bins)))
+            edges = np.unique(edges)
+        else:
+            edges = np.linspace(lower, upper, bins + 1)
+        counts, edges = np.histogram(values, bins=edges)
+        return {"edges": edges.tolist(), "counts": counts.tolist(), "count": int(len(values))}
+
+
+class MetricStore:
+    # Holds the current snapshot; a reload builds a new one and swaps it in, so readers never see
+    # a partly loaded dataset
+    def __init__(self):
+        self.columns = None
+        self._lock = threading.Lock()
+
+    @property
+    def version(self):
+        return self.columns.version if self.columns else None
+
+    def load(self, conn: sqlite3.Connection, version: int):
+        with self._lock:
+            if self.version == version:
+                return False
+            self.columns = MetricColumns.load(conn, version)
+            return True
+
+    def snapshot(self):
+        columns = self.columns
+        if columns is None:
+            return {"loaded": False}
+        return {
+            "loaded": True,
+            "version": columns.version,
+            "rows": columns.rows,
+            "bytes": int(columns.ids.nbytes + columns.values.nbytes),
+        }
@@ -0,0 +1,108 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+
+import config
+
+
+class AuthBusy(Exception):
+    pass
+
+
+class AuthTimeout(Exception):
+    pass
+
+
+# The functions below run in the worker processes, so this module only imports what they need
+
+def lower_priority(niceness: int):
+    # Worker initializer: let request handling win when hashing and serving share CPUs
+    if niceness and hasattr(os, "nice"):
+        os.nice(niceness)
+
+
+def hash_password(password: str, rounds: int):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def hash_rounds(password_hash: str):
+    # bcrypt hashes look like $2b$12$<salt><hash>; the third field is the cost
+    try:
+        return int(password_hash.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def verify_password(password: str, password_hash: str, rounds: int):
+    # Returns whether the password matches and, if the stored hash was made with a different cost,
+    # a replacement hash at the configured cost so the caller can upgrade it
+    try:
+        valid = bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+    except ValueError:
+        return False, None
+    if valid and hash_rounds(password_hash) != rounds:
+        return True, hash_password(password, rounds)
+    return valid, None
+
+
+class PasswordHasher:
+    # bcrypt is deliberately slow, so hashing runs in its own worker processes instead of the
+    # database executor. Like DatabaseExecutor, at most `workers` hashes run at once and at most
+    # `max_queue` wait; anything beyond that is rejected so a login burst cannot pile up.
+    def __init__(self, workers: int = config.auth_workers, max_queue: int = config.auth_max_queue,
+                 timeout: float = config.auth_timeout, rounds: int = config.bcrypt_rounds):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.rounds = rounds
+        # spawn keeps the workers free of the server's threads and open connections
+        self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                             initializer=lower_priority, initargs=(config.auth_worker_nice,))
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.stats = {"completed": 0, "rejected": 0, "timeouts": 0, "rehashed": 0}
+
+    def _done(self, future):
+        with self._lock:
+            self.in_flight -= 1
+            self.stats["completed"] += 1
+
+    async def _run(self, func, *args):
+        with self._lock:
+            if self.in_flight >= self.workers + self.max_queue:
+                self.stats["rejected"] += 1
+                raise AuthBusy(f"{self.in_flight} password hashes already pending")
+            self.in_flight += 1
+
+        future = self._executor.submit(func, *args)
+        future.add_done_callback(self._done)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            raise AuthTimeout(f"Password hashing took longer than {self.timeout}s")
+
+    async def hash(self, password: str):
+        return await self._run(hash_password, password, self.rounds)
+
+    async def verify(self, password: str, password_hash: str):
+        valid, new_hash = await self._run(verify_password, password, password_hash, self.rounds)
+        if new_hash is not None:
+            self.stats["rehashed"] += 1
+        return valid, new_hash
+
+    def health(self):
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "rounds": self.rounds,
+            "in_flight": self.in_flight,
+            **self.stats
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
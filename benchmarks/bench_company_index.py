@@ -0,0 +1,81 @@
+# Memory and lookup latency of the in-process company index, against SQLite and against the plain
+# dict of profile tuples a naive in-memory cache would hold.
+# Usage:
+#   python -m benchmarks.bench_company_index --db Final_Project.db
+import argparse
+import json
+import os
+import sqlite3
+import time
+import tracemalloc
+
+import company_index
+import company_profile
+from benchmarks.common import sample_company_ids, summarize, timed
+from serialization import encode_json
+
+
+def loaded(func):
+    # Result, seconds, bytes still allocated afterwards and the peak while it ran. tracemalloc slows
+    # allocation-heavy code several times over, so the timing comes from a separate untraced run.
+    start = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    result = func()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, retained, peak
+
+
+def load_tuples(conn: sqlite3.Connection):
+    return {row[0]: row for row in conn.execute(f"SELECT {', '.join(company_profile.COLUMNS)} FROM company_profile")}
+
+
+def mib(value: int):
+    return round(value / 1024 / 1024, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Company index memory and lookup benchmark")
+    parser.add_argument("--db", default="Final_Project.db")
+    parser.add_argument("--lookups", type=int, default=20000)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_PATH"] = args.db
+    import main as api
+
+    conn = sqlite3.connect(args.db)
+    index, load_s, retained, peak = loaded(lambda: company_index.CompanyIndex.load(conn, 0))
+    results = {
+        "rows": index.rows,
+        "index": {"load_s": round(load_s, 2), "mib": mib(index.nbytes()), "traced_mib": mib(retained),
+                  "load_peak_mib": mib(peak), "bytes_per_company": round(index.nbytes() / max(index.rows, 1), 1)},
+    }
+    tuples, load_s, retained, peak = loaded(lambda: load_tuples(conn))
+    results["tuple_dict"] = {"load_s": round(load_s, 2), "traced_mib": mib(retained),
+                             "bytes_per_company": round(retained / max(len(tuples), 1), 1)}
+    conn.close()
+
+    company_ids = sample_company_ids(args.db, args.lookups)
+    routes = {
+        "people": (api.get_people, company_profile.people_view),
+        "contact": (api.get_contact, company_profile.contact_view),
+        "change": (api.get_change, company_profile.change_view),
+    }
+    for name, (func, view) in routes.items():
+        # Every side includes building and encoding the response body, as the routes do
+        results[name] = {
+            "sqlite": summarize([timed(lambda i: encode_json(func(i)), i) for i in company_ids]),
+            "index": summarize([timed(lambda i: encode_json(view(index.get(i))), i) for i in company_ids]),
+            "tuple_dict": summarize([timed(lambda i: encode_json(view(tuples[i])), i) for i in company_ids]),
+        }
+        results[name]["p50_speedup"] = round(
+            results[name]["sqlite"]["p50_ms"] / max(results[name]["index"]["p50_ms"], 1e-6), 1)
+    api.pool.close()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# Bytes on the wire and latency of repeated polls: identity, each content coding, and conditional
+# requests revalidating with the ETag of the previous response.
+# Usage:
+#   python -m benchmarks.bench_conditional --db Final_Project.db
+import argparse
+import json
+import time
+
+import httpx
+
+import http_cache
+from benchmarks.common import summarize
+from benchmarks.load_test import local_server
+
+PATHS = ["/all_detail", "/top_investment/100", "/stats", "/companies?limit=1000", "/companies"]
+
+
+def poll(client: httpx.Client, path: str, headers: dict, repeat: int):
+    latencies = []
+    response = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with client.stream("GET", path, headers=headers) as response:
+            for _ in response.iter_raw():
+                pass
+        latencies.append(time.perf_counter() - start)
+    return response, {"status": response.status_code, "wire_bytes": response.num_bytes_downloaded,
+                      **summarize(latencies)}
+
+
+def wait_for_validators(client: httpx.Client, timeout: float = 60):
+    # ETags are only sent once the API has read the dataset version
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if client.get("/all_detail").headers.get("etag"):
+            return
+        time.sleep(0.2)
+    raise SystemExit("The API sent no ETag")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Conditional GET and compression benchmark")
+    parser.add_argument("--db", default="Final_Project.db")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--path", action="append", help="route to poll; may be repeated")
+    args = parser.parse_args()
+
+    results = {}
+    with local_server(args.db, 1) as url, httpx.Client(base_url=url, timeout=300) as client:
+        wait_for_validators(client)
+        for path in args.path or PATHS:
+            results[path] = {}
+            for coding in ("identity",) + http_cache.ENCODINGS:
+                response, stats = poll(client, path, {"Accept-Encoding": coding}, args.repeat)
+                results[path][coding] = stats
+                # A dashboard polling again with the tag it was sent
+                _, stats = poll(client, path, {"Accept-Encoding": coding, "If-None-Match": response.headers["etag"]},
+                                args.repeat)
+                results[path][f"{coding}_revalidated"] = stats
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
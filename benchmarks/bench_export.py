@@ -0,0 +1,64 @@
+# Stream /export in each format from a local server and report rows, bytes, throughput and the
+# server's memory before and after, which should not grow with the size of the export.
+# Usage:
+#   python -m benchmarks.bench_export --db Final_Project.db
+import argparse
+import json
+import time
+
+import httpx
+
+from benchmarks.load_test import server_process
+from benchmarks.suite import process_memory
+
+# Keep the in-memory stores out of the picture so memory reflects the export alone
+SERVER_ENV = {"ANALYTICS_ENABLED": "0", "SIMILAR_ENABLED": "0", "COMPANY_INDEX_ENABLED": "0", "SLOW_QUERY_MS": "0"}
+
+
+def anonymous_mib(pid: int):
+    # RSS counts the database pages SQLite maps (DB_MMAP_SIZE); RssAnon is the process's own memory
+    with open(f"/proc/{pid}/status") as file:
+        for line in file:
+            if line.startswith("RssAnon:"):
+                return round(int(line.split()[1]) / 1024, 1)
+    return 0.0
+
+
+def memory(pid: int):
+    return {**process_memory(pid), "anonymous_mib": anonymous_mib(pid)}
+
+
+def pull(client: httpx.Client, params: dict, headers: dict):
+    start = time.perf_counter()
+    lines = 0
+    with client.stream("GET", "/export", params=params, headers=headers) as response:
+        response.raise_for_status()
+        for chunk in response.iter_bytes():
+            lines += chunk.count(b"\n")
+        wire_bytes = response.num_bytes_downloaded
+    seconds = time.perf_counter() - start
+    return {"lines": lines, "wire_mib": round(wire_bytes / 1024 / 1024, 1), "seconds": round(seconds, 2),
+            "lines_per_s": round(lines / seconds)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="/export streaming benchmark")
+    parser.add_argument("--db", default="Final_Project.db")
+    parser.add_argument("--format", action="append", choices=["csv", "ndjson", "parquet"])
+    args = parser.parse_args()
+
+    results = {}
+    with server_process(args.db, 1, env=SERVER_ENV) as (url, process), httpx.Client(base_url=url, timeout=None) as client:
+        results["memory_before"] = memory(process.pid)
+        for output in args.format or ["csv", "ndjson"]:
+            for coding in ("identity", "gzip"):
+                results[f"{output}_{coding}"] = pull(client, {"format": output}, {"Accept-Encoding": coding})
+                results[f"{output}_{coding}"]["memory"] = memory(process.pid)
+        results["filtered_csv"] = pull(client, {"format": "csv", "filter": "investors_count:gt:0"},
+                                       {"Accept-Encoding": "identity"})
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
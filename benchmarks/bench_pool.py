@@ -0,0 +1,75 @@
+# Compare connect-per-call against the shared connection pool.
+# Usage: python -m benchmarks.bench_pool --db Final_Project.db --requests 5000 --threads 8
+import argparse
+import json
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import sample_company_ids, summarize, timed
+from db_pool import ConnectionPool
+
+QUERY = """
+    SELECT c.id, p.people_count, p.senior_people_count, ct.emails_count, ct.personal_emails_count,
+           ct.phones_count, ct.addresses_count, i.investors_count, cl.clients_count, pn.partners_count,
+           ch.changes_count, ch.people_changes_count, ch.contact_changes_count
+    FROM Company AS c
+    LEFT JOIN People AS p ON c.id = p.company_id
+    LEFT JOIN Contacts AS ct ON c.id = ct.company_id
+    LEFT JOIN Investments AS i ON c.id = i.company_id
+    LEFT JOIN Clients AS cl ON c.id = cl.company_id
+    LEFT JOIN Partners AS pn ON c.id = pn.company_id
+    LEFT JOIN Changes AS ch ON c.id = ch.company_id
+    WHERE c.id = ?
+"""
+
+
+def connect_per_call(database_path):
+    def query(company_id):
+        conn = sqlite3.connect(database_path)
+        cursor = conn.cursor()
+        try:
+            cursor.execute(QUERY, (company_id,))
+            return cursor.fetchone()
+        finally:
+            cursor.close()
+            conn.close()
+    return query
+
+
+def pooled(pool):
+    def query(company_id):
+        with pool.connection() as conn:
+            return conn.execute(QUERY, (company_id,)).fetchone()
+    return query
+
+
+def run(query, company_ids, threads):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        latencies = list(executor.map(lambda company_id: timed(query, company_id), company_ids))
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Connection pool latency benchmark")
+    parser.add_argument("--db", default="Final_Project.db")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--pool-size", type=int, default=8)
+    args = parser.parse_args()
+
+    company_ids = sample_company_ids(args.db, args.requests)
+    pool = ConnectionPool(args.db, size=args.pool_size)
+    try:
+        results = {
+            "connect_per_call": run(connect_per_call(args.db), company_ids, args.threads),
+            "pool": run(pooled(pool), company_ids, args.threads),
+        }
+    finally:
+        pool.close()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+# Compare the six-join detail queries with reads from the denormalized company_profile table.
+# Usage:
+#   python -m benchmarks.bench_profile --db Final_Project.db
+import argparse
+import json
+import os
+import random
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Join vs company_profile benchmark")
+    parser.add_argument("--db", default="Final_Project.db")
+    parser.add_argument("--lookups", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+
+    # main builds its pool from the environment at import time
+    os.environ["DATABASE_PATH"] = args.db
+    import config
+    import main as api
+    from benchmarks.common import sample_company_ids, summarize, timed
+
+    company_ids = sample_company_ids(args.db, args.lookups)
+    rng = random.Random(42)
+    batches = [rng.sample(company_ids, min(args.batch_size, len(company_ids))) for _ in range(args.lookups // 50)]
+
+    results = {}
+    for label, use_company_profile in (("join", False), ("company_profile", True)):
+        config.use_company_profile = use_company_profile
+        results[label] = {
+            "company_details": summarize([timed(api.get_company_details, i) for i in company_ids]),
+            "more_detail": summarize([timed(api.get_more_detail, i) for i in company_ids]),
+            "batch": summarize([timed(api.get_company_details_batch, batch) for batch in batches]),
+            "all_detail": summarize([timed(api.get_all_detail) for _ in range(len(company_ids))]),
+        }
+    api.pool.close()
+
+    results["p50_speedup"] = {
+        name: round(results["join"][name]["p50_ms"] / max(results["company_profile"][name]["p50_ms"], 1e-6), 2)
+        for name in results["join"]
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# Compare FTS5 search against a LIKE '%term%' scan.
+# Usage:
+#   python -m benchmarks.bench_search --db Final_Project.db
+#   python -m benchmarks.bench_search --db Final_Project.db --synthetic-rows 1000000
+import argparse
+import json
+import os
+import random
+import re
+import sqlite3
+import tempfile
+
+import migrations
+import search
+from benchmarks.common import summarize, timed
+
+LIKE_QUERY = """
+    SELECT id, name, website FROM Company
+    WHERE name LIKE ? OR website LIKE ? OR description_short LIKE ?
+    LIMIT 20
+"""
+
+
+def build_synthetic(source_path: str, rows: int, path: str):
+    # Repeat the source companies with shifted ids until the table holds `rows` companies
+    conn = sqlite3.connect(path)
+    migrations.migrate(conn)
+    conn.execute("ATTACH DATABASE ? AS source", (source_path,))
+    source_rows, max_id = conn.execute("SELECT COUNT(*), MAX(id) FROM source.Company").fetchone()
+    copies = -(-rows // source_rows)
+    conn.execute(f"""
+        WITH RECURSIVE copy(n) AS (SELECT 0 UNION ALL SELECT n + 1 FROM copy WHERE n + 1 < {copies})
+        INSERT INTO Company (id, url, name, website, description_short)
+        SELECT c.id + copy.n * {max_id + 1}, c.url, c.name, c.website, c.description_short
+        FROM copy, source.Company AS c
+        LIMIT {rows}
+    """)
+    conn.commit()
+    conn.execute("DETACH DATABASE source")
+    for statement in search.REBUILD_STATEMENTS:
+        conn.execute(statement)
+    conn.commit()
+    return conn
+
+
+def sample_terms(conn: sqlite3.Connection, count: int, seed: int = 42):
+    rng = random.Random(seed)
+    words = set()
+    for (text,) in conn.execute("SELECT description_short FROM Company WHERE description_short IS NOT NULL LIMIT 2000"):
+        words.update(word.lower() for word in re.findall(r"[A-Za-z]{5,}", text))
+    words = sorted(words)
+    return [rng.choice(words) for _ in range(count)]
+
+
+def run(conn: sqlite3.Connection, queries: int):
+    terms = sample_terms(conn, queries)
+    fts = [timed(search.search, conn, term, 20) for term in terms]
+    prefix = [timed(search.search, conn, term[:4], 20, 0, True) for term in terms]
+    like = [timed(lambda term: conn.execute(LIKE_QUERY, (f"%{term}%",) * 3).fetchall(), term) for term in terms]
+    return {
+        "companies": conn.execute("SELECT COUNT(*) FROM Company").fetchone()[0],
+        "fts": summarize(fts),
+        "fts_prefix": summarize(prefix),
+        "like_scan": summarize(like),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FTS5 vs LIKE search benchmark")
+    parser.add_argument("--db", default="Final_Project.db")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--synthetic-rows", type=int, default=0, help="also benchmark a scaled copy of this size")
+    args = parser.parse_args()
+
+    results = {}
+    conn = sqlite3.connect(args.db)
+    results["dataset"] = run(conn, args.queries)
+    conn.close()
+
+    if args.synthetic_rows:
+        with tempfile.TemporaryDirectory() as directory:
+            conn = build_synthetic(args.db, args.synthetic_rows, os.path.join(directory, "synthetic.db"))
+            results["synthetic"] = run(conn, args.queries)
+            conn.close()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
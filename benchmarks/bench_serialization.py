@@ -0,0 +1,88 @@
+# Compare the old response path (tuple rows copied into dicts, jsonable_encoder, json.dumps) with
+# the dict_row + orjson path the routes use now.
+# Usage:
+#   python -m benchmarks.bench_serialization --db Final_Project.db
+import argparse
+import json
+import sqlite3
+
+from fastapi.encoders import jsonable_encoder
+
+from benchmarks.common import summarize, timed
+from serialization import dict_row, encode_json
+
+# Queries behind the list endpoints, with columns aliased to the response keys
+QUERIES = {
+    "top_investment": "SELECT company_id, value AS investors_count, name FROM Leaderboard "
+                      "WHERE metric = 'investors_count' ORDER BY rank LIMIT 100",
+    "top_change": "SELECT company_id, value AS changes_count, name FROM Leaderboard "
+                  "WHERE metric = 'changes_count' ORDER BY rank LIMIT 100",
+    "companies_page": "SELECT id, url, name, website, description_short FROM Company ORDER BY id LIMIT 1000",
+    "all_detail": """
+        SELECT c.id AS company_id, c.url, c.name, c.website, c.description_short, p.people_count,
+               p.senior_people_count, ct.emails_count, ct.personal_emails_count, ct.phones_count,
+               ct.addresses_count, i.investors_count, cl.clients_count, pn.partners_count, ch.changes_count,
+               ch.people_changes_count, ch.contact_changes_count
+        FROM Company AS c
+        LEFT JOIN People AS p ON c.id = p.company_id
+        LEFT JOIN Contacts AS ct ON c.id = ct.company_id
+        LEFT JOIN Investments AS i ON c.id = i.company_id
+        LEFT JOIN Clients AS cl ON c.id = cl.company_id
+        LEFT JOIN Partners AS pn ON c.id = pn.company_id
+        LEFT JOIN Changes AS ch ON c.id = ch.company_id
+        LIMIT 1000
+    """,
+    "search": """
+        SELECT c.id AS company_id, c.name, c.website,
+               snippet(company_fts, -1, '<b>', '</b>', '...', 16) AS snippet,
+               bm25(company_fts, 10.0, 5.0, 1.0) AS score
+        FROM company_fts
+        JOIN Company AS c ON c.id = company_fts.rowid
+        WHERE company_fts MATCH 'data'
+        ORDER BY score
+        LIMIT 100
+    """,
+}
+
+
+def old_path(conn: sqlite3.Connection, sql: str):
+    cursor = conn.cursor()
+    cursor.execute(sql)
+    columns = [column[0] for column in cursor.description]
+    result = []
+    for row in cursor.fetchall():
+        result.append({column: row[index] for index, column in enumerate(columns)})
+    return json.dumps(jsonable_encoder(result)).encode("utf-8")
+
+
+def new_path(conn: sqlite3.Connection, sql: str):
+    cursor = conn.cursor()
+    cursor.row_factory = dict_row
+    return encode_json(cursor.execute(sql).fetchall())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Response serialization benchmark")
+    parser.add_argument("--db", default="Final_Project.db")
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    results = {}
+    for name, sql in QUERIES.items():
+        # Both paths must produce the same document
+        assert json.loads(old_path(conn, sql)) == json.loads(new_path(conn, sql)), name
+        old = [timed(old_path, conn, sql) for _ in range(args.iterations)]
+        new = [timed(new_path, conn, sql) for _ in range(args.iterations)]
+        results[name] = {
+            "rows": len(conn.execute(sql).fetchall()),
+            "old": summarize(old),
+            "new": summarize(new),
+            "speedup_p50": round(summarize(old)["p50_ms"] / max(summarize(new)["p50_ms"], 1e-6), 2),
+        }
+    conn.close()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
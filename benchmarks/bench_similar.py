@@ -0,0 +1,71 @@
+# Latency of /companies/{id}/similar lookups on the dataset's similarity index and on copies
+# resampled up to larger company counts.
+# Usage:
+#   python -m benchmarks.bench_similar --db Final_Project.db --scale 1000000
+import argparse
+import json
+import sqlite3
+import time
+
+import numpy as np
+
+import config
+import similarity
+from benchmarks.common import summarize, timed
+
+
+def resample(index: similarity.SimilarityIndex, rows: int, seed: int = 42):
+    # Draw companies with replacement, keeping each one's metric vector and TF-IDF terms
+    picks = np.random.default_rng(seed).integers(0, index.rows, rows)
+    lengths = np.diff(index.indptr)[picks]
+    indptr = np.zeros(rows + 1, dtype=np.int64)
+    np.cumsum(lengths, out=indptr[1:])
+    positions = np.repeat(index.indptr[picks] - indptr[:-1], lengths) + np.arange(indptr[-1])
+    terms = index.terms[positions]
+    weights = index.weights[positions]
+    term_indptr, term_rows, term_weights = similarity.transpose(indptr, terms, weights, len(index.term_indptr) - 1)
+    return similarity.SimilarityIndex(
+        index.version, ids=np.arange(rows, dtype=np.int64), metrics=np.ascontiguousarray(index.metrics[picks]),
+        indptr=indptr, terms=terms, weights=weights, term_indptr=term_indptr, term_rows=term_rows,
+        term_weights=term_weights
+    )
+
+
+def run(index: similarity.SimilarityIndex, queries: int, k: int, batch: int):
+    rows = np.random.default_rng(7).integers(0, index.rows, queries)
+    single = [timed(index.similar_rows, [row], k, config.similar_metric_weight) for row in rows]
+    start = time.perf_counter()
+    for i in range(0, len(rows), batch):
+        index.similar_rows(rows[i:i + batch], k, config.similar_metric_weight)
+    elapsed = time.perf_counter() - start
+    return {
+        "companies": index.rows,
+        "bytes": index.nbytes(),
+        "single": summarize(single),
+        "batched_ms_per_query": round(elapsed / len(rows) * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Similar-companies latency benchmark")
+    parser.add_argument("--db", default="Final_Project.db")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=similarity.BATCH_SIZE)
+    parser.add_argument("--scale", type=int, action="append", default=[], help="also time a resampled copy of this size")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    start = time.perf_counter()
+    index = similarity.SimilarityIndex.build(conn, 0)
+    build_seconds = time.perf_counter() - start
+    conn.close()
+
+    results = {"build_s": round(build_seconds, 2), "dataset": run(index, args.queries, args.k, args.batch)}
+    for rows in args.scale:
+        results[f"resampled_{rows}"] = run(resample(index, rows), args.queries, args.k, args.batch)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# Compare single-company lookups through SQLite with lookups in the memory-mapped snapshot, and
+# check that worker processes share the snapshot's pages instead of each holding a copy.
+# Usage:
+#   python -m benchmarks.bench_snapshot --db Final_Project.db
+import argparse
+import json
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+
+import company_profile
+import snapshot
+from benchmarks.common import sample_company_ids, summarize, timed
+from serialization import encode_json
+
+
+def memory_kib(field: str):
+    # Rss counts shared pages in full; Pss splits them between the processes mapping them
+    with open("/proc/self/smaps_rollup") as file:
+        for line in file:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return 0
+
+
+def touch_snapshot(path: str, results):
+    current = snapshot.Snapshot(path)
+    before = memory_kib("Rss")
+    for row in range(current.rows):
+        current.record(row)
+    results.append({"rss_kib": memory_kib("Rss") - before, "pss_kib": memory_kib("Pss")})
+    time.sleep(1)  # keep every mapping alive while the others read their Pss
+
+
+def sharing(path: str, workers: int):
+    with multiprocessing.Manager() as manager:
+        results = manager.list()
+        processes = [multiprocessing.Process(target=touch_snapshot, args=(path, results)) for _ in range(workers)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        return list(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite vs snapshot lookup benchmark")
+    parser.add_argument("--db", default="Final_Project.db")
+    parser.add_argument("--lookups", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=4, help="processes mapping the snapshot at once")
+    args = parser.parse_args()
+
+    os.environ["DATABASE_PATH"] = args.db
+    import main as api
+
+    company_ids = sample_company_ids(args.db, args.lookups)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.snapshot")
+        conn = sqlite3.connect(args.db)
+        start = time.perf_counter()
+        rows = snapshot.write(conn, 0, path)
+        build_s = time.perf_counter() - start
+        conn.close()
+
+        current = snapshot.Snapshot(path)
+        views = {
+            "company_details": (api.get_company_details, company_profile.details_view),
+            "people": (api.get_people, company_profile.people_view),
+            "change": (api.get_change, company_profile.change_view),
+        }
+        results = {"rows": rows, "snapshot_mib": round(os.path.getsize(path) / 1024 / 1024, 1),
+                   "build_s": round(build_s, 2), "database_mib": round(os.path.getsize(args.db) / 1024 / 1024, 1)}
+        for name, (func, view) in views.items():
+            results[name] = {
+                # Both sides include encoding the response body, as the routes do
+                "sqlite": summarize([timed(lambda i: encode_json(func(i)), i) for i in company_ids]),
+                "snapshot": summarize([timed(lambda i: encode_json(view(current.get(i))), i) for i in company_ids]),
+            }
+            results[name]["p50_speedup"] = round(
+                results[name]["sqlite"]["p50_ms"] / max(results[name]["snapshot"]["p50_ms"], 1e-6), 1)
+        results["sharing"] = sharing(path, args.workers)
+        api.pool.close()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
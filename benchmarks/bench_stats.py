@@ -0,0 +1,79 @@
+# Time the /stats computations on the NumPy metric columns against the equivalent SQL, and on
+# columns resampled up to larger row counts.
+# Usage:
+#   python -m benchmarks.bench_stats --db Final_Project.db --scale 1000000 --scale 10000000
+import argparse
+import json
+import sqlite3
+
+import numpy as np
+
+import analytics
+from benchmarks.common import summarize, timed
+
+FILTERS = analytics.parse_filters(["investors_count:gt:0", "people_count:lt:50"])
+
+
+def sql_stats(conn: sqlite3.Connection):
+    conn.execute(
+        "SELECT COUNT(*) FROM company_profile WHERE investors_count > 0 AND people_count < 50"
+    ).fetchone()
+    conn.execute(f"SELECT {', '.join(f'COUNT({m}), SUM({m}), AVG({m}), MIN({m}), MAX({m})' for m in analytics.METRICS)} "
+                 f"FROM company_profile").fetchone()
+    # SQLite has no percentile function, so the median needs a sort
+    count = conn.execute("SELECT COUNT(people_count) FROM company_profile").fetchone()[0]
+    conn.execute("SELECT people_count FROM company_profile WHERE people_count IS NOT NULL "
+                 "ORDER BY people_count LIMIT 1 OFFSET ?", (count // 2,)).fetchone()
+
+
+def column_stats(columns: analytics.MetricColumns):
+    columns.mask(FILTERS).sum()
+    for metric in analytics.METRICS:
+        columns.aggregate(metric)
+    columns.aggregate("people_count", None, (50, 90, 99))
+
+
+def resample(columns: analytics.MetricColumns, rows: int, seed: int = 42):
+    picks = np.random.default_rng(seed).integers(0, columns.rows, rows)
+    return analytics.MetricColumns(columns.version, np.arange(rows, dtype=np.int64), columns.values[:, picks])
+
+
+def run(columns: analytics.MetricColumns, repeats: int):
+    return {
+        "rows": columns.rows,
+        "bytes": int(columns.ids.nbytes + columns.values.nbytes),
+        "filtered_count": summarize([timed(lambda: columns.mask(FILTERS).sum()) for _ in range(repeats)]),
+        "aggregates_all_metrics": summarize([
+            timed(lambda: [columns.aggregate(m) for m in analytics.METRICS]) for _ in range(repeats)
+        ]),
+        "percentiles": summarize([timed(columns.aggregate, "people_count", None, (50, 90, 99)) for _ in range(repeats)]),
+        "histogram": summarize([timed(columns.histogram, "changes_count", None, 50) for _ in range(repeats)]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NumPy metric columns vs SQL aggregates")
+    parser.add_argument("--db", default="Final_Project.db")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--scale", type=int, action="append", default=[], help="also time a resampled copy of this size")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    load = []
+    for _ in range(3):
+        load.append(timed(analytics.MetricColumns.load, conn, 0))
+    columns = analytics.MetricColumns.load(conn, 0)
+    results = {
+        "load": summarize(load),
+        "sql": summarize([timed(sql_stats, conn) for _ in range(args.repeats)]),
+        "columns": summarize([timed(column_stats, columns) for _ in range(args.repeats)]),
+        "dataset": run(columns, args.repeats),
+    }
+    conn.close()
+    for rows in args.scale:
+        results[f"resampled_{rows}"] = run(resample(columns, rows), args.repeats)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+# Cost of checking an access token versus re-verifying the password with bcrypt.
+# Usage:
+#   python -m benchmarks.bench_tokens --rounds 12
+import argparse
+import json
+import secrets
+import time
+
+import auth
+import tokens
+from benchmarks.common import summarize, timed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Token verification vs bcrypt benchmark")
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--tokens", type=int, default=10000)
+    parser.add_argument("--passwords", type=int, default=10)
+    args = parser.parse_args()
+
+    secret = secrets.token_bytes(32)
+    now = int(time.time())
+    token = tokens.issue(secret, {"sub": "user", "sid": secrets.token_urlsafe(16), "iat": now, "exp": now + 3600})
+    password_hash = auth.hash_password("password", args.rounds)
+
+    token_checks = [timed(tokens.verify, secret, token) for _ in range(args.tokens)]
+    password_checks = [timed(auth.verify_password, "password", password_hash, args.rounds)
+                       for _ in range(args.passwords)]
+    token_summary = summarize(token_checks)
+    password_summary = summarize(password_checks)
+    print(json.dumps({
+        "rounds": args.rounds,
+        "token_verify": {**token_summary, "p50_us": round(token_summary["p50_ms"] * 1000, 1)},
+        "bcrypt_verify": password_summary,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
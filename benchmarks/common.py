@@ -0,0 +1,42 @@
+import random
+import sqlite3
+import statistics
+import time
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(latencies, elapsed=None):
+    # Latencies are in seconds, reported in milliseconds
+    result = {
+        "count": len(latencies),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+    if elapsed:
+        result["throughput_per_s"] = round(len(latencies) / elapsed, 1)
+    return result
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def sample_company_ids(database_path, count, seed=42):
+    conn = sqlite3.connect(database_path)
+    try:
+        ids = [row[0] for row in conn.execute("SELECT id FROM Company")]
+    finally:
+        conn.close()
+    rng = random.Random(seed)
+    return [rng.choice(ids) for _ in range(count)]
@@ -0,0 +1,133 @@
+# Drive many concurrent HTTP clients against one or more running servers and report throughput
+# and latency. Without --url a local uvicorn is started on main:app.
+# Usage:
+#   python -m benchmarks.load_test --db Final_Project.db --concurrency 500 --requests 20000
+#   python -m benchmarks.load_test --db Final_Project.db --url old=http://127.0.0.1:8001 --url new=http://127.0.0.1:8000
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+import httpx
+
+from benchmarks.common import sample_company_ids, summarize
+
+ROUTES = [
+    "/companies/{id}",
+    "/more_detail/{id}",
+    "/people/{id}",
+    "/contact/{id}",
+    "/investment/{id}",
+    "/client/{id}",
+    "/partner/{id}",
+    "/change/{id}",
+    "/top_investment/10",
+    "/top_change/10/1",
+]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def server_process(database_path: str, workers: int, app: str = "main:app", env: dict = None, startup_timeout: float = 30):
+    # Yields the base url and the uvicorn process, e.g. to read its memory use
+    port = free_port()
+    env = dict(os.environ, **(env or {}), DATABASE_PATH=database_path)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        env=env
+    )
+    url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + startup_timeout
+        while time.monotonic() < deadline:
+            try:
+                httpx.get(url + "/health", timeout=1)
+                break
+            except httpx.HTTPError:
+                time.sleep(0.2)
+        yield url, process
+    finally:
+        process.terminate()
+        process.wait()
+
+
+@contextmanager
+def local_server(database_path: str, workers: int, app: str = "main:app", env: dict = None):
+    with server_process(database_path, workers, app, env) as (url, _):
+        yield url
+
+
+async def run_load(url: str, paths, concurrency: int):
+    latencies = []
+    statuses = {}
+    queue = asyncio.Queue()
+    for path in paths:
+        queue.put_nowait(path)
+
+    async def client_loop(client):
+        while True:
+            try:
+                path = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            start = time.perf_counter()
+            try:
+                response = await client.get(path)
+                status = response.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return {**summarize(latencies, elapsed), "statuses": {str(k): v for k, v in statuses.items()}}
+
+
+def build_paths(database_path: str, count: int, seed: int = 42):
+    rng = random.Random(seed)
+    company_ids = sample_company_ids(database_path, count, seed)
+    return [rng.choice(ROUTES).format(id=company_id) for company_id in company_ids]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent HTTP load test")
+    parser.add_argument("--db", default="Final_Project.db")
+    parser.add_argument("--url", action="append", default=[], help="label=url of a running server, repeatable")
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the local server")
+    args = parser.parse_args()
+
+    paths = build_paths(args.db, args.requests)
+    results = {}
+    if args.url:
+        for target in args.url:
+            label, sep, url = target.partition("=")
+            if not sep:
+                label, url = target, target
+            results[label] = asyncio.run(run_load(url, paths, args.concurrency))
+    else:
+        with local_server(args.db, args.workers) as url:
+            results["local"] = asyncio.run(run_load(url, paths, args.concurrency))
+
+    print(json.dumps({"concurrency": args.concurrency, "requests": args.requests, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
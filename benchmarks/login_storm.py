@@ -0,0 +1,101 @@
+# Measure read latency on its own and again while a storm of logins runs against the same server.
+# Hashing runs in the auth process pool, so the read percentiles should barely move.
+# Usage:
+#   python -m benchmarks.login_storm --db Final_Project.db --logins 500 --login-concurrency 100
+#   python -m benchmarks.login_storm --db Final_Project.db --rate-limit   # keep the default limits
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from benchmarks.common import summarize
+from benchmarks.load_test import build_paths, local_server, run_load
+
+PASSWORD = "storm-password"
+
+# Limits high enough that every storm login reaches the hasher
+NO_RATE_LIMIT = {
+    "AUTH_RATE_PER_IP": "1000000",
+    "AUTH_BURST_PER_IP": "1000000",
+    "LOGIN_RATE_PER_USER": "1000000",
+    "LOGIN_BURST_PER_USER": "1000000",
+}
+
+
+async def register_users(url: str, count: int):
+    usernames = [f"storm-{int(time.time())}-{i}" for i in range(count)]
+    async with httpx.AsyncClient(base_url=url, timeout=60) as client:
+        for username in usernames:
+            await client.post("/register", json={"username": username, "password": PASSWORD})
+    return usernames
+
+
+async def run_logins(url: str, usernames, logins: int, concurrency: int):
+    latencies = []
+    statuses = {}
+    queue = asyncio.Queue()
+    for i in range(logins):
+        queue.put_nowait(usernames[i % len(usernames)])
+
+    async def client_loop(client):
+        while True:
+            try:
+                username = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            start = time.perf_counter()
+            try:
+                response = await client.post("/login", json={"username": username, "password": PASSWORD})
+                status = response.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return {**summarize(latencies, elapsed), "statuses": {str(k): v for k, v in statuses.items()}}
+
+
+async def storm(url: str, paths, concurrency: int, usernames, logins: int, login_concurrency: int):
+    reads, logins = await asyncio.gather(
+        run_load(url, paths, concurrency),
+        run_logins(url, usernames, logins, login_concurrency)
+    )
+    return {"reads": reads, "logins": logins}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read latency during a login storm")
+    parser.add_argument("--db", default="Final_Project.db")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--logins", type=int, default=500)
+    parser.add_argument("--login-concurrency", type=int, default=100)
+    parser.add_argument("--rate-limit", action="store_true", help="keep the configured login rate limits")
+    args = parser.parse_args()
+
+    paths = build_paths(args.db, args.requests)
+    with local_server(args.db, 1, env=None if args.rate_limit else NO_RATE_LIMIT) as url:
+        usernames = asyncio.run(register_users(url, args.users))
+        baseline = asyncio.run(run_load(url, paths, args.concurrency))
+        during = asyncio.run(storm(url, paths, args.concurrency, usernames, args.logins, args.login_concurrency))
+        auth = httpx.get(url + "/health").json().get("auth")
+
+    print(json.dumps({
+        "reads_baseline": baseline,
+        "reads_during_storm": during["reads"],
+        "logins": during["logins"],
+        "auth": auth
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# Minimal local scraper for /metrics: polls a server and prints, per interval, request rates and
+# latency quantiles per route (estimated from histogram buckets the way Prometheus'
+# histogram_quantile does) and the SQL statements that took the most time.
+# Usage:
+#   python -m benchmarks.scrape_metrics --url http://127.0.0.1:8000 --interval 5
+#   python -m benchmarks.scrape_metrics --db Final_Project.db --interval 5 --count 3
+import argparse
+import json
+import re
+import time
+from collections import defaultdict
+
+import httpx
+
+from benchmarks.load_test import local_server
+
+SAMPLE = re.compile(r'^([a-zA-Z_:][\w:]*)(?:\{(.*)\})? (\S+)$')
+LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def parse(text: str):
+    # {(name, frozenset(labels)): value}
+    samples = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        match = SAMPLE.match(line)
+        if not match:
+            continue
+        name, labels, value = match.groups()
+        labels = {key: value.replace('\\"', '"').replace("\\n", "\n").replace("\\\\", "\\")
+                  for key, value in LABEL.findall(labels or "")}
+        samples[(name, frozenset(labels.items()))] = float(value)
+    return samples
+
+
+def delta(current, previous):
+    return {key: value - previous.get(key, 0.0) for key, value in current.items()}
+
+
+def quantile(q: float, buckets):
+    # buckets: [(upper bound, cumulative count)] sorted by bound
+    if not buckets or buckets[-1][1] <= 0:
+        return None
+    rank = q * buckets[-1][1]
+    lower, below = 0.0, 0.0
+    for bound, count in buckets:
+        if count >= rank:
+            if bound == float("inf"):
+                return lower
+            return lower + (bound - lower) * (rank - below) / max(count - below, 1e-12)
+        lower, below = bound, count
+    return lower
+
+
+def histogram_by(samples, name: str, label: str):
+    grouped = defaultdict(list)
+    for (sample, labels), value in samples.items():
+        if sample == name + "_bucket":
+            labels = dict(labels)
+            grouped[labels[label]].append((float(labels["le"]), value))
+    return {key: sorted(buckets) for key, buckets in grouped.items()}
+
+
+def summary(samples, elapsed: float, top: int):
+    requests = defaultdict(float)
+    statuses = defaultdict(float)
+    for (name, labels), value in samples.items():
+        if name == "http_requests_total":
+            labels = dict(labels)
+            requests[labels["route"]] += value
+            statuses[labels["status"]] += value
+    routes = {}
+    for route, buckets in histogram_by(samples, "http_request_duration_seconds", "route").items():
+        if requests.get(route):
+            routes[route] = {
+                "rate_per_s": round(requests[route] / elapsed, 2),
+                **{f"p{int(q * 100)}_ms": round(quantile(q, buckets) * 1000, 3) for q in (0.5, 0.95, 0.99)},
+            }
+    statements = []
+    for (name, labels), value in samples.items():
+        if name == "db_statement_duration_seconds_sum" and value > 0:
+            statement = dict(labels)["statement"]
+            key = frozenset({"statement": statement}.items())
+            statements.append({
+                "statement": statement[:160],
+                "executions": int(samples.get(("db_statement_duration_seconds_count", key), 0)),
+                "execute_ms": round(value * 1000, 3),
+                "fetch_ms": round(samples.get(("db_statement_fetch_seconds_total", key), 0.0) * 1000, 3),
+                "rows": int(samples.get(("db_statement_rows_total", key), 0)),
+            })
+    statements.sort(key=lambda item: -(item["execute_ms"] + item["fetch_ms"]))
+    return {"statuses": dict(statuses), "routes": routes, "statements": statements[:top]}
+
+
+def scrape(url: str, interval: float, count: int, top: int):
+    previous, started = parse(httpx.get(url + "/metrics").text), time.monotonic()
+    for _ in range(count):
+        time.sleep(interval)
+        current, now = parse(httpx.get(url + "/metrics").text), time.monotonic()
+        print(json.dumps(summary(delta(current, previous), now - started, top), indent=2))
+        previous, started = current, now
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scrape /metrics and summarize each interval")
+    parser.add_argument("--url", help="running server; without it a local uvicorn is started")
+    parser.add_argument("--db", default="Final_Project.db")
+    parser.add_argument("--interval", type=float, default=5)
+    parser.add_argument("--count", type=int, default=1000000, help="number of intervals to report")
+    parser.add_argument("--top", type=int, default=5, help="statements to list per interval")
+    args = parser.parse_args()
+
+    if args.url:
+        scrape(args.url, args.interval, args.count, args.top)
+    else:
+        with local_server(args.db, 1) as url:
+            scrape(url, args.interval, args.count, args.top)
+
+
+if __name__ == "__main__":
+    main()
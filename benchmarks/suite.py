@@ -0,0 +1,391 @@
+# Reproducible end-to-end benchmark. For every dataset size it generates a synthetic CSV from
+# aihitdata-uk-10k.csv (benchmarks/synthetic.py), imports it with import_data.py, then drives every
+# API route with a weighted request mix at one or more concurrency levels and reports throughput,
+# p50/p95/p99 latency per route and the server's memory use as JSON.
+#
+# The server is either a local uvicorn (--target uvicorn, the default) or the app itself behind an
+# in-process ASGI client (--target asgi). In-process runs include the client's own CPU time in the
+# latencies, and the reported RSS covers client and server together.
+#
+# Usage:
+#   python -m benchmarks.suite --sizes 100k,1M --concurrency 1,32,128 --requests 5000 --out results.json
+#   python -m benchmarks.suite --sizes 10M --import-arg=--no-similarity-index --env SIMILAR_ENABLED=0
+#   python -m benchmarks.suite --db Final_Project.db --target asgi --mix search=10,all_detail=1
+#
+# Every size runs in its own process, so runs don't share caches or memory. Datasets are written to
+# --workdir and reused by later runs unless --regenerate is given.
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import random
+import re
+import sqlite3
+import subprocess
+import sys
+import time
+
+import httpx
+
+import snapshot
+from benchmarks.bench_search import sample_terms
+from benchmarks.common import summarize
+from benchmarks.load_test import server_process
+from benchmarks.synthetic import generate, parse_rows
+
+QUERY_SHAPES = [
+    "sort=id",
+    "filter=investors_count:gt:0&sort=-investors_count",
+    "filter=people_count:ge:10&sort=-people_count,emails_count",
+    "filter=changes_count:gt:100&filter=partners_count:gt:0&sort=-changes_count",
+]
+STATS_FILTERS = ["", "filter=people_count:gt:5", "filter=investors_count:gt:0&filter=changes_count:lt:200"]
+METRICS = ['people_count', 'emails_count', 'investors_count', 'clients_count', 'partners_count', 'changes_count']
+RANKED_METRICS = ['investors_count', 'clients_count', 'partners_count', 'changes_count']
+
+# name: (default weight, method, route template, request builder). Unbounded responses such as
+# /all_detail and the write-heavy auth routes are off by default; enable them with --mix name=weight.
+# POST /logout is left out because it would revoke the token the run is using.
+ROUTES = {
+    "company": (10, "GET", "/companies/{company_id}", lambda s: f"/companies/{s.company_id()}"),
+    "more_detail": (6, "GET", "/more_detail/{company_id}", lambda s: f"/more_detail/{s.company_id()}"),
+    "people": (3, "GET", "/people/{company_id}", lambda s: f"/people/{s.company_id()}"),
+    "contact": (3, "GET", "/contact/{company_id}", lambda s: f"/contact/{s.company_id()}"),
+    "investment": (2, "GET", "/investment/{company_id}", lambda s: f"/investment/{s.company_id()}"),
+    "client": (2, "GET", "/client/{company_id}", lambda s: f"/client/{s.company_id()}"),
+    "partner": (2, "GET", "/partner/{company_id}", lambda s: f"/partner/{s.company_id()}"),
+    "change": (2, "GET", "/change/{company_id}", lambda s: f"/change/{s.company_id()}"),
+    "companies_page": (2, "GET", "/companies", lambda s: f"/companies?after_id={s.company_id()}&limit=100"),
+    "companies_query": (2, "GET", "/companies/query",
+                        lambda s: f"/companies/query?{s.rng.choice(QUERY_SHAPES)}&limit=50"),
+    "companies_batch": (1, "POST", "/companies/batch", lambda s: ("/companies/batch", {"ids": s.company_ids(50)})),
+    "similar": (2, "GET", "/companies/{company_id}/similar", lambda s: f"/companies/{s.company_id()}/similar?k=10"),
+    "top_investment": (1, "GET", "/top_investment/{top}", lambda s: f"/top_investment/{s.rng.choice([10, 50, 100])}"),
+    "top_client": (1, "GET", "/top_client/{top}", lambda s: f"/top_client/{s.rng.choice([10, 50, 100])}"),
+    "top_partner": (1, "GET", "/top_partner/{toprank}", lambda s: f"/top_partner/{s.rng.choice([10, 50, 100])}"),
+    "top_change": (1, "GET", "/top_change/{toprank}/{mode}",
+                   lambda s: f"/top_change/{s.rng.choice([10, 50, 100])}/{s.rng.randint(1, 3)}"),
+    "rank": (1, "GET", "/rank/{metric}/{company_id}",
+             lambda s: f"/rank/{s.rng.choice(RANKED_METRICS)}/{s.company_id()}"),
+    "search": (3, "GET", "/search", lambda s: f"/search?q={s.term()}"),
+    "suggest": (3, "GET", "/search/suggest", lambda s: f"/search/suggest?q={s.term()[:3]}"),
+    "stats": (1, "GET", "/stats", lambda s: f"/stats?{s.rng.choice(STATS_FILTERS)}"),
+    "stats_count": (1, "GET", "/stats/count", lambda s: f"/stats/count?{s.rng.choice(STATS_FILTERS)}"),
+    "metric_stats": (1, "GET", "/stats/{metric}", lambda s: f"/stats/{s.rng.choice(METRICS)}?{s.rng.choice(STATS_FILTERS)}"),
+    "histogram": (1, "GET", "/stats/{metric}/histogram",
+                  lambda s: f"/stats/{s.rng.choice(METRICS)}/histogram?bins=20&log=true"),
+    "export": (0.5, "GET", "/export",
+               lambda s: f"/export?format={s.rng.choice(['csv', 'ndjson'])}&after_id={s.company_id()}&limit=500"),
+    "me": (1, "GET", "/me", lambda s: "/me"),
+    "health": (0.5, "GET", "/health", lambda s: "/health"),
+    "metrics": (0.2, "GET", "/metrics", lambda s: "/metrics"),
+    "cache_stats": (0.2, "GET", "/cache/stats", lambda s: "/cache/stats"),
+    "slow_queries": (0.2, "GET", "/debug/slow_queries", lambda s: "/debug/slow_queries"),
+    "all_detail": (0, "GET", "/all_detail", lambda s: "/all_detail"),
+    "login": (0, "POST", "/login", lambda s: ("/login", s.credentials)),
+    "register": (0, "POST", "/register", lambda s: ("/register", s.new_user())),
+    "reset_slow_queries": (0, "DELETE", "/debug/slow_queries", lambda s: "/debug/slow_queries"),
+}
+
+ROUTE_DECORATOR = re.compile(r'^@app\.(get|post|put|patch|delete)\("([^"]+)"', re.MULTILINE)
+
+
+def uncovered_routes(main_path: str = "main.py"):
+    # Routes declared in main.py that have no entry in ROUTES, so new endpoints are not silently skipped
+    with open(main_path, encoding="utf-8") as file:
+        declared = {(method.upper(), path) for method, path in ROUTE_DECORATOR.findall(file.read())}
+    covered = {(method, template) for _, method, template, _ in ROUTES.values()}
+    return sorted(f"{method} {path}" for method, path in declared - covered)
+
+
+class Sampler:
+    # Request parameters drawn from the database being benchmarked, with a fixed seed
+    def __init__(self, database_path: str, seed: int, count: int = 2000):
+        self.rng = random.Random(seed)
+        conn = sqlite3.connect(f"file:{database_path}?mode=ro", uri=True)
+        try:
+            # Probe random points of the id range instead of reading every id of a large table
+            low, high = conn.execute("SELECT MIN(id), MAX(id) FROM Company").fetchone()
+            ids = set()
+            for _ in range(count):
+                row = conn.execute("SELECT id FROM Company WHERE id >= ? ORDER BY id LIMIT 1",
+                                   (self.rng.randint(low, high),)).fetchone()
+                ids.add(row[0])
+            self.ids = sorted(ids)
+            self.terms = sample_terms(conn, 200, seed)
+        finally:
+            conn.close()
+        self.credentials = {"username": f"bench-{seed}", "password": "bench-password"}
+        self.users = 0
+
+    def company_id(self):
+        return self.rng.choice(self.ids)
+
+    def company_ids(self, count: int):
+        return self.rng.sample(self.ids, min(count, len(self.ids)))
+
+    def term(self):
+        return self.rng.choice(self.terms)
+
+    def new_user(self):
+        self.users += 1
+        return {"username": f"bench-{os.getpid()}-{self.users}", "password": "bench-password"}
+
+
+def parse_mix(items):
+    weights = {name: weight for name, (weight, _, _, _) in ROUTES.items()}
+    for item in items:
+        for part in item.split(","):
+            name, _, weight = part.partition("=")
+            if name not in ROUTES:
+                raise SystemExit(f"Unknown route {name!r}; known routes: {', '.join(ROUTES)}")
+            weights[name] = float(weight)
+    return {name: weight for name, weight in weights.items() if weight > 0}
+
+
+def build_requests(sampler: Sampler, mix: dict, count: int):
+    names = sampler.rng.choices(list(mix), weights=list(mix.values()), k=count)
+    requests = []
+    for name in names:
+        _, method, _, builder = ROUTES[name]
+        request = builder(sampler)
+        path, body = request if isinstance(request, tuple) else (request, None)
+        requests.append((name, method, path, body))
+    return requests
+
+
+def process_memory(pid: int):
+    # Current and peak RSS in MiB of a process and all its descendants (uvicorn workers), from /proc
+    rss = peak = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/status") as file:
+                for line in file:
+                    if line.startswith("VmRSS:"):
+                        rss += int(line.split()[1])
+                    elif line.startswith("VmHWM:"):
+                        peak += int(line.split()[1])
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as file:
+                    pending.extend(int(child) for child in file.read().split())
+        except (FileNotFoundError, ProcessLookupError):
+            continue
+    return {"rss_mib": round(rss / 1024, 1), "peak_rss_mib": round(peak / 1024, 1)}
+
+
+async def authenticate(client: httpx.AsyncClient, sampler: Sampler):
+    # One user per run; the token is sent with every request, so AUTH_REQUIRED=1 servers work too
+    await client.post("/register", json=sampler.credentials)
+    response = await client.post("/login", json=sampler.credentials)
+    if response.status_code != 200:
+        raise SystemExit(f"Login failed with {response.status_code}: {response.text}")
+    client.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+
+
+async def wait_ready(client: httpx.AsyncClient, env: dict, timeout: float):
+    # The API loads metric columns and the similarity index in the background after startup
+    waiting_for = [name for name, flag in (("analytics", "ANALYTICS_ENABLED"), ("similar", "SIMILAR_ENABLED"))
+                   if env.get(flag, "1") == "1"]
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            response = await client.get("/health")
+            if response.status_code == 200 and all(response.json().get(name, {}).get("loaded") for name in waiting_for):
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.5)
+    raise SystemExit(f"Server not ready after {timeout}s")
+
+
+async def drive(client: httpx.AsyncClient, requests, concurrency: int):
+    latencies = {}
+    statuses = {}
+    queue = asyncio.Queue()
+    for request in requests:
+        queue.put_nowait(request)
+
+    async def client_loop():
+        while True:
+            try:
+                name, method, path, body = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.setdefault(name, []).append(time.perf_counter() - start)
+            route_statuses = statuses.setdefault(name, {})
+            route_statuses[status] = route_statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    overall = [latency for values in latencies.values() for latency in values]
+    totals = {}
+    for route_statuses in statuses.values():
+        for status, count in route_statuses.items():
+            totals[status] = totals.get(status, 0) + count
+    return {
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 3),
+        **summarize(overall, elapsed),
+        "statuses": totals,
+        "routes": {name: {**summarize(values), "statuses": statuses[name]} for name, values in sorted(latencies.items())},
+    }
+
+
+async def run_levels(client: httpx.AsyncClient, args, env: dict, memory):
+    sampler = Sampler(args.db, args.seed)
+    mix = parse_mix(args.mix)
+    await wait_ready(client, env, args.startup_timeout)
+    await authenticate(client, sampler)
+    levels = []
+    if args.warmup:
+        await drive(client, build_requests(sampler, mix, args.warmup), max(args.concurrency))
+    for concurrency in args.concurrency:
+        result = await drive(client, build_requests(sampler, mix, args.requests), concurrency)
+        result.update(memory())
+        levels.append(result)
+    return {"mix": mix, "levels": levels}
+
+
+def run_database(args):
+    env = dict(item.split("=", 1) for item in args.env)
+    if args.target == "asgi":
+        # config reads the environment at import time
+        os.environ.update(env, DATABASE_PATH=args.db)
+        import main
+
+        async def run():
+            # The app prints progress messages; keep stdout for the JSON result
+            with contextlib.redirect_stdout(sys.stderr):
+                async with main.app.router.lifespan_context(main.app):
+                    transport = httpx.ASGITransport(app=main.app)
+                    async with httpx.AsyncClient(transport=transport, base_url="http://asgi", timeout=300) as client:
+                        return await run_levels(client, args, env, lambda: process_memory(os.getpid()))
+        return asyncio.run(run())
+
+    with server_process(args.db, args.workers, env=env, startup_timeout=args.startup_timeout) as (url, process):
+        async def run():
+            limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+            async with httpx.AsyncClient(base_url=url, limits=limits, timeout=300) as client:
+                return await run_levels(client, args, env, lambda: process_memory(process.pid))
+        return asyncio.run(run())
+
+
+def import_dataset(csv_path: str, database_path: str, import_args):
+    # import_data.py in a child process; wait4 gives that child's own peak RSS. The sidecar files
+    # go too, or a snapshot left by an earlier run could match the new dataset version.
+    for suffix in ("", "-wal", "-shm", ".similar.npz"):
+        if os.path.exists(database_path + suffix):
+            os.remove(database_path + suffix)
+    for _, path in snapshot.snapshot_files(database_path):
+        os.remove(path)
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "import_data.py", "--csv", csv_path, "--db", database_path, *import_args],
+                               stdout=subprocess.DEVNULL)
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode:
+        raise SystemExit(f"import_data.py failed with exit code {process.returncode}")
+    return {"elapsed_s": round(time.perf_counter() - start, 1), "peak_rss_mib": round(usage.ru_maxrss / 1024, 1),
+            "db_mib": round(os.path.getsize(database_path) / 1024 / 1024, 1)}
+
+
+def driver_argv(args):
+    # The options a per-dataset run needs
+    argv = ["--target", args.target, "--workers", str(args.workers), "--requests", str(args.requests),
+            "--warmup", str(args.warmup), "--seed", str(args.seed), "--startup-timeout", str(args.startup_timeout),
+            "--concurrency", ",".join(map(str, args.concurrency))]
+    for item in args.env:
+        argv += ["--env", item]
+    for item in args.mix:
+        argv += ["--mix", item]
+    return argv
+
+
+def run_sizes(args):
+    os.makedirs(args.workdir, exist_ok=True)
+    datasets = []
+    for rows in args.sizes:
+        csv_path = os.path.join(args.workdir, f"synthetic-{rows}.csv")
+        database_path = os.path.join(args.workdir, f"synthetic-{rows}.db")
+        dataset = {"rows": rows, "csv": csv_path, "db": database_path}
+        if args.regenerate or not os.path.exists(csv_path):
+            start = time.perf_counter()
+            generate(rows, csv_path, seed=args.seed)
+            dataset["generate_s"] = round(time.perf_counter() - start, 1)
+        if args.regenerate or not os.path.exists(database_path):
+            dataset["import"] = import_dataset(csv_path, database_path, args.import_arg)
+        print(f"Benchmarking {rows} rows", file=sys.stderr)
+        # Each dataset is driven by a fresh process running this script with --db. The result comes
+        # back through a file because the server's own output shares the child's stdout.
+        result_path = database_path + ".result.json"
+        subprocess.run([sys.executable, "-m", "benchmarks.suite", "--db", database_path, "--dataset-run",
+                        "--out", result_path, *driver_argv(args)], check=True, stdout=sys.stderr)
+        with open(result_path, encoding="utf-8") as file:
+            dataset.update(json.load(file))
+        datasets.append(dataset)
+    return datasets
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic dataset and full-route benchmark suite")
+    parser.add_argument("--sizes", type=lambda text: [parse_rows(size) for size in text.split(",")],
+                        help="dataset sizes to generate, import and benchmark, e.g. 100k,1M,10M")
+    parser.add_argument("--db", help="benchmark an existing database instead of generating datasets")
+    parser.add_argument("--workdir", default="benchmark-data")
+    parser.add_argument("--regenerate", action="store_true", help="rebuild CSVs and databases that already exist")
+    parser.add_argument("--import-arg", action="append", default=[], help="extra import_data.py argument, repeatable")
+    parser.add_argument("--target", choices=["uvicorn", "asgi"], default="uvicorn")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    parser.add_argument("--env", action="append", default=[], help="KEY=VALUE server setting, repeatable")
+    parser.add_argument("--concurrency", type=lambda text: [int(level) for level in text.split(",")], default=[1, 16, 64])
+    parser.add_argument("--requests", type=int, default=2000, help="requests per concurrency level")
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--mix", action="append", default=[], help="route=weight overrides, e.g. search=5,all_detail=1")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--startup-timeout", type=float, default=600)
+    parser.add_argument("--out", help="also write the JSON result to this file")
+    parser.add_argument("--dataset-run", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.dataset_run:
+        with open(args.out, "w", encoding="utf-8") as file:
+            json.dump(run_database(args), file)
+        return
+    if args.db:
+        result = {"db": args.db, **run_database(args)}
+    elif args.sizes:
+        result = {"datasets": run_sizes(args)}
+    else:
+        parser.error("either --sizes or --db is required")
+
+    result = {
+        "target": args.target,
+        "workers": args.workers if args.target == "uvicorn" else None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "seed": args.seed,
+        "uncovered_routes": uncovered_routes(),
+        **result,
+    }
+    text = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as file:
+            file.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# Generate an aihitdata-style CSV of any size from aihitdata-uk-10k.csv.
+# Every synthetic row takes its twelve metric columns from one randomly chosen source row, so the
+# joint distribution of the metrics (including which of them are missing) matches the source. Name,
+# website and description come from two other random rows, so text and metrics are recombined rather
+# than copied as whole companies. Ids are unique random positive 31-bit integers and urls are
+# rebuilt from them.
+# Usage:
+#   python -m benchmarks.synthetic --rows 1000000 --out synthetic-1m.csv
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from import_data import CSV_COLUMNS, INTEGER_COLUMNS, TEXT_COLUMNS
+
+METRIC_COLUMNS = [column for column in INTEGER_COLUMNS if column != 'id']
+SOURCE_CSV = "aihitdata-uk-10k.csv"
+MAX_ID = 2 ** 31 - 1
+
+
+def parse_rows(text: str):
+    # 100k, 1M, 10M or a plain number
+    text = text.strip().lower()
+    scale = {"k": 1000, "m": 1000000}.get(text[-1:], 1)
+    return int(float(text[:-1] if scale > 1 else text) * scale)
+
+
+def read_source(csv_path: str):
+    dtypes = {column: 'Int64' for column in INTEGER_COLUMNS}
+    dtypes.update({column: object for column in TEXT_COLUMNS})
+    return pd.read_csv(csv_path, dtype=dtypes)
+
+
+def unique_ids(rng: np.random.Generator, rows: int):
+    # Draw a few more than needed, drop duplicates and shuffle, so ids arrive in random order like the source
+    ids = np.unique(rng.integers(1, MAX_ID, size=int(rows * 1.05) + 100))
+    while len(ids) < rows:
+        ids = np.unique(np.concatenate([ids, rng.integers(1, MAX_ID, size=rows)]))
+    ids = ids[rng.permutation(len(ids))[:rows]]
+    return ids
+
+
+def synthetic_chunks(source: pd.DataFrame, rows: int, seed: int = 42, chunk_size: int = 100000):
+    rng = np.random.default_rng(seed)
+    ids = unique_ids(rng, rows)
+    slugs = source['url'].str.extract(r"/company/[^/]+/([^/]+)/", expand=False).fillna("company")
+    for start in range(0, rows, chunk_size):
+        count = min(chunk_size, rows - start)
+        metric_rows = rng.integers(0, len(source), count)
+        name_rows = rng.integers(0, len(source), count)
+        description_rows = rng.integers(0, len(source), count)
+        chunk_ids = ids[start:start + count]
+        frame = pd.DataFrame({
+            'id': chunk_ids,
+            'url': [f"https://www.aihitdata.com/company/{company_id:08X}/{slug}/overview"
+                    for company_id, slug in zip(chunk_ids, slugs.to_numpy()[name_rows])],
+            'name': source['name'].to_numpy()[name_rows],
+            'website': source['website'].to_numpy()[name_rows],
+            'description_short': source['description_short'].to_numpy()[description_rows],
+        })
+        for column in METRIC_COLUMNS:
+            frame[column] = source[column].array[metric_rows]
+        yield frame[list(source.columns)]
+
+
+def generate(rows: int, out_path: str, source_csv: str = SOURCE_CSV, seed: int = 42, chunk_size: int = 100000):
+    source = read_source(source_csv)
+    missing = set(CSV_COLUMNS) - set(source.columns)
+    if missing:
+        raise ValueError(f"{source_csv} is missing columns {sorted(missing)}")
+    with open(out_path, "w", encoding="utf-8", newline="") as file:
+        for i, chunk in enumerate(synthetic_chunks(source, rows, seed, chunk_size)):
+            chunk.to_csv(file, header=i == 0, index=False)
+    return out_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic aihitdata CSV")
+    parser.add_argument("--rows", type=parse_rows, required=True, help="e.g. 100k, 1M, 10M")
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--source", default=SOURCE_CSV)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    generate(args.rows, args.out, args.source, args.seed)
+    print(f"Wrote {args.rows} rows to {args.out} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
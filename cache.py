@@ -0,0 +1,112 @@
+import threading
+import time
+from collections import OrderedDict
+
+import config
+
+
+class ResponseCache:
+    # LRU cache of encoded response bodies. Entries are tagged with the dataset generation they were
+    # built from, so bumping the generation invalidates everything without walking the cache. An
+    # entry also keeps the compressed variants of its body that have been served, which count
+    # towards max_bytes and are dropped with it.
+    def __init__(self, max_bytes: int = config.cache_max_bytes, max_entries: int = config.cache_max_entries,
+                 ttls: dict = None):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.ttls = config.cache_ttls if ttls is None else ttls
+        self.generation = 0
+        self.last_modified = None
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0, "compressions": 0}
+        self.route_stats = {}
+
+    def _count(self, route: str, outcome: str):
+        self.stats[outcome] += 1
+        counters = self.route_stats.setdefault(route, {"hits": 0, "misses": 0})
+        counters[outcome] += 1
+
+    def _remove(self, key):
+        _, _, body, variants = self._entries.pop(key)
+        self.size -= len(body) + sum(len(variant) for variant in variants.values())
+
+    def _evict(self):
+        while self.size > self.max_bytes or len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.stats["evictions"] += 1
+
+    def get(self, route: str, key):
+        with self._lock:
+            entry = self._entries.get((route, key))
+            if entry is None:
+                self._count(route, "misses")
+                return None
+            generation, expires_at, body, _ = entry
+            if generation != self.generation or expires_at < time.monotonic():
+                self._remove((route, key))
+                self._count(route, "misses")
+                return None
+            self._entries.move_to_end((route, key))
+            self._count(route, "hits")
+            return body
+
+    def put(self, route: str, key, body: bytes, generation: int = None):
+        ttl = self.ttls.get(route, self.ttls.get("default", 0))
+        if ttl <= 0 or len(body) > self.max_bytes:
+            return
+        with self._lock:
+            # A response built before an invalidation must not be stored under the new generation
+            if generation is not None and generation != self.generation:
+                return
+            if (route, key) in self._entries:
+                self._remove((route, key))
+            self._entries[(route, key)] = (self.generation, time.monotonic() + ttl, body, {})
+            self.size += len(body)
+            self._evict()
+
+    def get_variant(self, route: str, key, encoding: str):
+        # A compressed body stored by put_variant; lookups are already counted by get
+        with self._lock:
+            entry = self._entries.get((route, key))
+            if entry is None or entry[0] != self.generation:
+                return None
+            return entry[3].get(encoding)
+
+    def put_variant(self, route: str, key, encoding: str, body: bytes, generation: int):
+        with self._lock:
+            self.stats["compressions"] += 1
+            entry = self._entries.get((route, key))
+            if entry is None or entry[0] != generation or generation != self.generation:
+                return
+            variants = entry[3]
+            if encoding in variants:
+                return
+            variants[encoding] = body
+            self.size += len(body)
+            self._evict()
+
+    def set_generation(self, generation: int, last_modified: str = None):
+        with self._lock:
+            self.last_modified = last_modified
+            if generation == self.generation:
+                return False
+            self.generation = generation
+            self._entries.clear()
+            self.size = 0
+            self.stats["invalidations"] += 1
+            return True
+
+    def snapshot(self):
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                "generation": self.generation,
+                "entries": len(self._entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "hit_ratio": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+                **self.stats,
+                "routes": {route: dict(counters) for route, counters in self.route_stats.items()}
+            }
@@ -0,0 +1,105 @@
+# Run every endpoint query against a database and fail if any of them does a full table scan.
+# Usage: python check_query_plans.py [path/to/Final_Project.db]
+import sqlite3
+import sys
+
+import analytics
+import company_query
+import config
+import main
+import migrations
+from db_pool import ConnectionPool, StreamConnections
+
+
+class TracingPool(ConnectionPool):
+    # Records every statement the endpoint functions send, with parameters already bound
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.statements = []
+
+    def connect(self):
+        conn = super().connect()
+        conn.set_trace_callback(self.statements.append)
+        return conn
+
+
+def list_companies(after_id: int, limit: int):
+    return main.get_companies_page(after_id, limit)
+
+
+def export_companies(filters, after_id: int, max_id: int):
+    _, batches = main.open_export(tuple(analytics.parse_filters(filters)), after_id, max_id, 100, None)
+    return list(batches)
+
+
+def endpoint_calls(company_id: int):
+    # (function, args, tables it may scan on purpose)
+    return [
+        (list_companies, (company_id, 100), set()),
+        (main.get_company_details, (company_id,), set()),
+        (main.get_company_details_batch, ([company_id, company_id + 1],), set()),
+        (main.get_people, (company_id,), set()),
+        (main.get_more_detail, (company_id,), set()),
+        (main.get_contact, (company_id,), set()),
+        (main.get_investment, (company_id,), set()),
+        (main.get_top_investment, (10,), set()),
+        (main.get_top_client, (10,), set()),
+        (main.get_client, (company_id,), set()),
+        (main.get_partner, (company_id,), set()),
+        (main.get_top_partner, (10,), set()),
+        (main.get_change, (company_id,), set()),
+        (main.get_top_change, (10, 1), set()),
+        (main.get_top_change, (10, 2), set()),
+        (main.get_top_change, (10, 3), set()),
+        (main.get_top_change, (10, 1, 20), set()),
+        (main.get_rank, ('investors_count', company_id), set()),
+        (main.get_all_detail, (), {'c'}),
+        (export_companies, ([], company_id, None), set()),
+        (export_companies, (['investors_count:gt:0'], None, company_id + 1000), set()),
+        (main.get_search, ('school', 20, 0, True), set()),
+        (main.get_suggestions, ('lag', 10), set()),
+        (main.query_companies, ((), company_query.parse_sort('-investors_count'), 20, None), set()),
+        (main.query_companies, (tuple(analytics.parse_filters(['investors_count:gt:0', 'people_count:lt:50'])),
+                                company_query.parse_sort('-investors_count'), 20, None), set()),
+        (main.query_companies, (tuple(analytics.parse_filters(['people_count:ge:10'])),
+                                company_query.parse_sort('people_count'), 20, None), set()),
+    ]
+
+
+def main_check(database_path: str):
+    conn = sqlite3.connect(database_path)
+    migrations.migrate(conn)
+    row = conn.execute("SELECT id FROM Company LIMIT 1").fetchone()
+    company_id = row[0] if row else 1
+
+    main.pool.close()
+    main.pool = TracingPool(database_path)
+    main.streams = StreamConnections(main.pool)
+    failures = []
+    # Check the join queries and the company_profile queries
+    for use_company_profile in (False, True):
+        config.use_company_profile = use_company_profile
+        for func, args, allowed in endpoint_calls(company_id):
+            del main.pool.statements[:]
+            func(*args)
+            for sql in list(main.pool.statements):
+                # Skip pool pings and the statements FTS5 runs internally against its own shadow tables
+                if not sql.lstrip().upper().startswith("SELECT") or sql.strip() == "SELECT 1" or "'main'." in sql:
+                    continue
+                scans = [
+                    scan for scan in migrations.full_scans(conn, sql)
+                    if scan.split()[1] not in allowed
+                ]
+                if scans:
+                    failures.append((func.__name__, args, scans))
+    main.pool.close()
+    conn.close()
+
+    for name, args, scans in failures:
+        print(f"{name}{args}: {', '.join(scans)}")
+    print("OK" if not failures else f"{len(failures)} endpoint queries do full scans")
+    return not failures
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main_check(sys.argv[1] if len(sys.argv) > 1 else main.database_path) else 1)
@@ -60,3 +60,18 @@ CREATE TABLE users (
     username VARCHAR(50) UNIQUE NOT NULL,
     password_hash VARCHAR(255) NOT NULL
 );
+
+-- Indexes: one row per company in every satellite table, plus covering indexes for the top-N rankings
+CREATE UNIQUE INDEX ux_people_company_id ON People(company_id);
+CREATE UNIQUE INDEX ux_contacts_company_id ON Contacts(company_id);
+CREATE UNIQUE INDEX ux_investments_company_id ON Investments(company_id);
+CREATE UNIQUE INDEX ux_clients_company_id ON Clients(company_id);
+CREATE UNIQUE INDEX ux_partners_company_id ON Partners(company_id);
+CREATE UNIQUE INDEX ux_changes_company_id ON Changes(company_id);
+
+CREATE INDEX ix_investments_rank ON Investments(investors_count DESC) INCLUDE (company_id);
+CREATE INDEX ix_clients_rank ON Clients(clients_count DESC) INCLUDE (company_id);
+CREATE INDEX ix_partners_rank ON Partners(partners_count DESC) INCLUDE (company_id);
+CREATE INDEX ix_changes_rank ON Changes(changes_count DESC) INCLUDE (company_id, people_changes_count, contact_changes_count);
+CREATE INDEX ix_changes_people_rank ON Changes(people_changes_count DESC) INCLUDE (company_id, changes_count, contact_changes_count);
+CREATE INDEX ix_changes_contact_rank ON Changes(contact_changes_count DESC) INCLUDE (company_id, changes_count, people_changes_count);
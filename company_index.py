@@ -0,0 +1,139 @@
+import sqlite3
+import threading
+from bisect import bisect_left
+
+import numpy as np
+
+from company_profile import COLUMNS, FLAG_COLUMNS, METRIC_COLUMNS, P
+
+LOAD_BATCH_SIZE = 100000
+NAME = P['name']
+FLAG_POSITIONS = [P[column] for column in FLAG_COLUMNS]
+METRIC_POSITIONS = [P[column] for column in METRIC_COLUMNS]
+
+
+class CompanyIndex:
+    # In-process copy of the company_profile columns behind the satellite routes (/people, /contact,
+    # /investment, /client, /partner, /change and /more_detail), built from SQLite for one dataset
+    # version. Rows are in id order and found by binary search on ids, so no per-company Python
+    # objects are kept:
+    #   ids      int64[rows]
+    #   metrics  int32 or int64[rows, 12], NULL stored as the type's minimum
+    #   flags    uint8[rows], bit i = has_* column i
+    #   offsets  uint32 or uint64[rows + 1] into names, a UTF-8 heap; an empty span is a NULL name
+    # url, website and description_short are not held; /companies/{id} reads them from SQLite.
+    # Lookups go through memoryviews of the arrays, whose items are plain ints: indexing a NumPy
+    # array per field costs several times more than the lookup itself.
+    __slots__ = ('version', 'ids', 'metrics', 'flags', 'offsets', 'names', 'null', 'rows',
+                 '_ids', '_metrics', '_flags', '_offsets')
+
+    def __init__(self, version: int, ids, metrics, flags, offsets, names: bytes):
+        self.version = version
+        self.ids = ids
+        self.metrics = metrics
+        self.flags = flags
+        self.offsets = offsets
+        self.names = names
+        self.null = int(np.iinfo(metrics.dtype).min)
+        self.rows = len(ids)
+        self._ids = memoryview(ids)
+        self._metrics = memoryview(metrics.reshape(-1))
+        self._flags = memoryview(flags)
+        self._offsets = memoryview(offsets)
+
+    @classmethod
+    def load(cls, conn: sqlite3.Connection, version: int):
+        rows = conn.execute("SELECT COUNT(*) FROM company_profile").fetchone()[0]
+        bounds = conn.execute(
+            "SELECT " + ", ".join(f"MIN({column}), MAX({column})" for column in METRIC_COLUMNS) + " FROM company_profile"
+        ).fetchone()
+        int32 = np.iinfo(np.int32)
+        metric_dtype = np.int32 if all(value is None or int32.min < value <= int32.max for value in bounds) else np.int64
+        null = np.iinfo(metric_dtype).min
+
+        ids = np.empty(rows, dtype=np.int64)
+        metrics = np.empty((rows, len(METRIC_COLUMNS)), dtype=metric_dtype)
+        flags = np.zeros(rows, dtype=np.uint8)
+        lengths = np.zeros(rows + 1, dtype=np.uint64)
+        names = []
+        cursor = conn.execute(
+            f"SELECT id, name, {', '.join(FLAG_COLUMNS)}, {', '.join(METRIC_COLUMNS)} FROM company_profile ORDER BY id")
+        start = 0
+        while True:
+            batch = cursor.fetchmany(LOAD_BATCH_SIZE)
+            if not batch:
+                break
+            end = start + len(batch)
+            if end > rows:
+                raise sqlite3.DatabaseError("company_profile changed while loading the company index")
+            ids[start:end] = [row[0] for row in batch]
+            # None becomes NaN when the batch is converted to a float array
+            block = np.array([row[2:] for row in batch], dtype=np.float64)
+            present = block[:, :len(FLAG_COLUMNS)] != 0
+            flags[start:end] = (present << np.arange(len(FLAG_COLUMNS), dtype=np.uint8)).sum(axis=1, dtype=np.uint8)
+            values = block[:, len(FLAG_COLUMNS):]
+            metrics[start:end] = np.where(np.isnan(values), null, values)
+            encoded = [(row[1] or "").encode("utf-8") for row in batch]
+            lengths[start + 1:end + 1] = [len(name) for name in encoded]
+            names.append(b"".join(encoded))
+            start = end
+        if start != rows:
+            raise sqlite3.DatabaseError(f"company_profile changed while loading the company index ({start} of {rows} rows)")
+
+        offsets = np.cumsum(lengths)
+        if offsets[-1] <= np.iinfo(np.uint32).max:
+            offsets = offsets.astype(np.uint32)
+        return cls(version, ids, metrics, flags, offsets, b"".join(names))
+
+    def row_of(self, company_id: int):
+        row = bisect_left(self._ids, company_id)
+        return row if row < self.rows and self._ids[row] == company_id else None
+
+    def record(self, row: int):
+        # One profile row in COLUMNS order for the company_profile views, with the text columns that
+        # are not held left as None
+        values = [None] * len(COLUMNS)
+        values[0] = self._ids[row]
+        start, end = self._offsets[row], self._offsets[row + 1]
+        if end > start:
+            values[NAME] = self.names[start:end].decode("utf-8")
+        flags = self._flags[row]
+        for bit, position in enumerate(FLAG_POSITIONS):
+            values[position] = flags >> bit & 1
+        first = row * len(METRIC_POSITIONS)
+        null = self.null
+        for position, value in zip(METRIC_POSITIONS, self._metrics[first:first + len(METRIC_POSITIONS)]):
+            values[position] = None if value == null else value
+        return tuple(values)
+
+    def get(self, company_id: int):
+        row = self.row_of(company_id)
+        return None if row is None else self.record(row)
+
+    def nbytes(self):
+        return int(self.ids.nbytes + self.metrics.nbytes + self.flags.nbytes + self.offsets.nbytes + len(self.names))
+
+
+class CompanyIndexStore:
+    # Holds the current index; a reload builds a new one and swaps it in, so readers never see a
+    # partly loaded dataset
+    def __init__(self):
+        self.index = None
+        self._lock = threading.Lock()
+
+    @property
+    def version(self):
+        return self.index.version if self.index else None
+
+    def load(self, conn: sqlite3.Connection, version: int):
+        with self._lock:
+            if self.version == version:
+                return False
+            self.index = CompanyIndex.load(conn, version)
+            return True
+
+    def snapshot(self):
+        index = self.index
+        if index is None:
+            return {"loaded": False}
+        return {"loaded": True, "version": index.version, "rows": index.rows, "bytes": index.nbytes()}
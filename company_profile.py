@@ -0,0 +1,136 @@
+import sqlite3
+
+# One wide row per company with every CSV column, so the detail routes read a single primary key
+# instead of joining six satellite tables. The has_* flags record which satellite rows exist.
+COLUMNS = [
+    'id', 'url', 'name', 'website', 'description_short',
+    'has_people', 'people_count', 'senior_people_count',
+    'has_contacts', 'emails_count', 'personal_emails_count', 'phones_count', 'addresses_count',
+    'has_investments', 'investors_count',
+    'has_clients', 'clients_count',
+    'has_partners', 'partners_count',
+    'has_changes', 'changes_count', 'people_changes_count', 'contact_changes_count',
+]
+
+SELECT_SQL = """
+    SELECT c.id, c.url, c.name, c.website, c.description_short,
+           p.company_id IS NOT NULL, p.people_count, p.senior_people_count,
+           ct.company_id IS NOT NULL, ct.emails_count, ct.personal_emails_count, ct.phones_count, ct.addresses_count,
+           i.company_id IS NOT NULL, i.investors_count,
+           cl.company_id IS NOT NULL, cl.clients_count,
+           pn.company_id IS NOT NULL, pn.partners_count,
+           ch.company_id IS NOT NULL, ch.changes_count, ch.people_changes_count, ch.contact_changes_count
+    FROM Company AS c
+    LEFT JOIN People AS p ON c.id = p.company_id
+    LEFT JOIN Contacts AS ct ON c.id = ct.company_id
+    LEFT JOIN Investments AS i ON c.id = i.company_id
+    LEFT JOIN Clients AS cl ON c.id = cl.company_id
+    LEFT JOIN Partners AS pn ON c.id = pn.company_id
+    LEFT JOIN Changes AS ch ON c.id = ch.company_id
+"""
+
+INSERT_SQL = f"INSERT INTO company_profile ({', '.join(COLUMNS)})"
+
+REBUILD_STATEMENTS = [
+    "DELETE FROM company_profile",
+    INSERT_SQL + SELECT_SQL,
+]
+
+
+def remove(conn: sqlite3.Connection, ids_sql: str):
+    conn.execute(f"DELETE FROM company_profile WHERE id IN ({ids_sql})")
+
+
+def add(conn: sqlite3.Connection, ids_sql: str):
+    # Must run after the base tables hold the new values
+    conn.execute(INSERT_SQL + SELECT_SQL + f" WHERE c.id IN ({ids_sql})")
+
+
+# Responses of the single-company routes built from one profile row in COLUMNS order, for stores that
+# hold profile rows outside SQLite. Keys and their order match the SQL queries in main.py. A route
+# whose satellite row is missing returns None.
+P = {column: i for i, column in enumerate(COLUMNS)}
+TEXT_COLUMNS = COLUMNS[1:5]
+FLAG_COLUMNS = [column for column in COLUMNS if column.startswith('has_')]
+METRIC_COLUMNS = [column for column in COLUMNS[5:] if column not in FLAG_COLUMNS]
+
+
+def details_view(row):
+    return {
+        "company": {
+            "id": row[0],
+            "url": row[1],
+            "name": row[2],
+            "website": row[3],
+            "description_short": row[4]
+        },
+        "people": {
+            "people_count": row[6],
+            "senior_people_count": row[7]
+        } if row[5] else None,
+        "contacts": {
+            "emails_count": row[9],
+            "personal_emails_count": row[10],
+            "phones_count": row[11],
+            "addresses_count": row[12]
+        } if row[8] else None,
+        "investments": {
+            "investors_count": row[14]
+        } if row[13] else None,
+        "clients": {
+            "clients_count": row[16]
+        } if row[15] else None,
+        "partners": {
+            "partners_count": row[18]
+        } if row[17] else None,
+        "changes": {
+            "changes_count": row[20],
+            "people_changes_count": row[21],
+            "contact_changes_count": row[22]
+        } if row[19] else None
+    }
+
+
+def more_detail_view(row):
+    return {"more_detail": {"company_id": row[0], **{column: row[P[column]] for column in METRIC_COLUMNS}}}
+
+
+def people_view(row):
+    if not row[P['has_people']]:
+        return None
+    return {"people": {"company_id": row[0], "company_name": row[2], "people_count": row[P['people_count']],
+                       "senior_people_count": row[P['senior_people_count']]}}
+
+
+def contact_view(row):
+    if not row[P['has_contacts']]:
+        return None
+    return {"contact": {"company_id": row[0], "addresses_count": row[P['addresses_count']],
+                        "emails_count": row[P['emails_count']], "personal_emails_count": row[P['personal_emails_count']],
+                        "phones_count": row[P['phones_count']], "company_name": row[2]}}
+
+
+def investment_view(row):
+    if not row[P['has_investments']]:
+        return None
+    return {"investment": {"company_id": row[0], "investors_count": row[P['investors_count']], "company_name": row[2]}}
+
+
+def client_view(row):
+    if not row[P['has_clients']]:
+        return None
+    return {"client": {"company_id": row[0], "clients_count": row[P['clients_count']], "company_name": row[2]}}
+
+
+def partner_view(row):
+    if not row[P['has_partners']]:
+        return None
+    return {"partner": {"company_id": row[0], "partners_count": row[P['partners_count']], "company_name": row[2]}}
+
+
+def change_view(row):
+    if not row[P['has_changes']]:
+        return None
+    return {"change": {"company_id": row[0], "changes_count": row[P['changes_count']],
+                       "people_changes_count": row[P['people_changes_count']],
+                       "contact_changes_count": row[P['contact_changes_count']], "name": row[2]}}
@@ -0,0 +1,150 @@
+import base64
+import sqlite3
+import threading
+from functools import lru_cache
+
+import orjson
+
+import analytics
+
+# Generic filtered, sorted and paged reads of company_profile. Only whitelisted columns and
+# operators ever reach the SQL text; every value is a bound parameter.
+
+RESULT_COLUMNS = ['id', 'name', 'website'] + analytics.METRICS
+SORT_COLUMNS = ['id'] + analytics.METRICS
+OPERATORS = {'gt': '>', 'ge': '>=', 'lt': '<', 'le': '<=', 'eq': '=', 'ne': '!='}
+MAX_SORT_KEYS = 3
+
+
+class QueryRejected(ValueError):
+    pass
+
+
+def parse_sort(text: str):
+    # "-investors_count,people_count" -> (("investors_count", True), ("people_count", False));
+    # id is always added as the final tiebreaker in the direction of the last key
+    keys = []
+    for part in filter(None, (text or "").split(",")):
+        descending = part.startswith("-")
+        column = part.lstrip("-+")
+        if column not in SORT_COLUMNS or any(column == key for key, _ in keys):
+            raise ValueError(f"Invalid sort column {column!r}")
+        keys.append((column, descending))
+    if len(keys) > MAX_SORT_KEYS:
+        raise ValueError(f"At most {MAX_SORT_KEYS} sort columns")
+    if not keys or keys[-1][0] != "id":
+        keys.append(("id", keys[-1][1] if keys else False))
+    return tuple(keys)
+
+
+def encode_cursor(row, sort):
+    # Rows may be dicts from a dict row factory or plain tuples in RESULT_COLUMNS order
+    if isinstance(row, dict):
+        values = [row[column] for column, _ in sort]
+    else:
+        values = [row[RESULT_COLUMNS.index(column)] for column, _ in sort]
+    return base64.urlsafe_b64encode(orjson.dumps(values)).decode("ascii")
+
+
+def decode_cursor(cursor: str, sort):
+    try:
+        values = orjson.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, UnicodeError, orjson.JSONDecodeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != len(sort) or not all(isinstance(v, int) for v in values):
+        raise ValueError("Cursor does not match the sort order")
+    return values
+
+
+@lru_cache(maxsize=256)
+def compile_query(filter_shape, sort, has_cursor: bool):
+    # The SQL depends only on the shape of the request, so equal shapes share one SQL string and
+    # therefore one prepared statement in each connection's statement cache
+    where = [f"{column} {OPERATORS[op]} ?" for column, op in filter_shape]
+    # Rows with NULL in a sort column have no place in the keyset order and are left out
+    where += [f"{column} IS NOT NULL" for column, _ in sort if column != "id"]
+    if has_cursor:
+        directions = {descending for _, descending in sort}
+        if len(directions) == 1:
+            # Row value comparison lets SQLite turn the cursor into an index range
+            columns = ", ".join(column for column, _ in sort)
+            where.append(f"({columns}) {'<' if sort[0][1] else '>'} ({', '.join('?' * len(sort))})")
+        else:
+            terms = []
+            for i, (column, descending) in enumerate(sort):
+                equal = [f"{previous} = ?" for previous, _ in sort[:i]]
+                terms.append("(" + " AND ".join(equal + [f"{column} {'<' if descending else '>'} ?"]) + ")")
+            where.append("(" + " OR ".join(terms) + ")")
+    order = ", ".join(f"{column} {'DESC' if descending else 'ASC'}" for column, descending in sort)
+    return (
+        f"SELECT {', '.join(RESULT_COLUMNS)} FROM company_profile"
+        + (f" WHERE {' AND '.join(where)}" if where else "")
+        + f" ORDER BY {order} LIMIT ?"
+    )
+
+
+def cursor_params(sort, values):
+    if len({descending for _, descending in sort}) == 1:
+        return list(values)
+    params = []
+    for i in range(len(sort)):
+        params += values[:i + 1]
+    return params
+
+
+_plans = {}
+_plans_lock = threading.Lock()
+
+
+def forced_scan(conn: sqlite3.Connection, sql: str, params, filtered: bool):
+    # A shape forces a full read when it walks the whole table or an index and then has to sort, or
+    # scans the table without an index while filtering. Ordered index walks stop at LIMIT.
+    with _plans_lock:
+        if sql in _plans:
+            return _plans[sql]
+    plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+    scans = [line for line in plan if line.startswith("SCAN ")]
+    sorts = [line for line in plan if "TEMP B-TREE" in line]
+    reason = None
+    if scans and sorts:
+        reason = f"{scans[0]} followed by {sorts[0]}"
+    elif filtered and any(" USING " not in line for line in scans):
+        reason = f"{scans[0]} while filtering"
+    with _plans_lock:
+        if len(_plans) >= 1024:
+            _plans.clear()
+        _plans[sql] = reason
+    return reason
+
+
+def table_rows(conn: sqlite3.Connection):
+    # Row count recorded by the last ANALYZE; cheaper than COUNT(*) on a large table
+    row = conn.execute("SELECT CAST(stat AS INTEGER) FROM sqlite_stat1 WHERE tbl = 'company_profile' LIMIT 1").fetchone()
+    if row:
+        return row[0]
+    return conn.execute("SELECT COUNT(*) FROM company_profile").fetchone()[0]
+
+
+def run(conn: sqlite3.Connection, filters, sort, limit: int, cursor: str = None, scan_max_rows: int = None,
+        row_factory=None):
+    # filters are analytics.parse_filters() tuples and sort comes from parse_sort()
+    values = decode_cursor(cursor, sort) if cursor else None
+    sql = compile_query(tuple((column, op) for column, op, _ in filters), sort, values is not None)
+    params = [value for _, _, value in filters]
+    if values is not None:
+        params += cursor_params(sort, values)
+    params.append(limit + 1)
+
+    if scan_max_rows is not None:
+        reason = forced_scan(conn, sql, params, bool(filters) or values is not None)
+        if reason and table_rows(conn) > scan_max_rows:
+            raise QueryRejected(f"Query would read the whole table ({reason}); add a filter or sort on an indexed metric")
+
+    cur = conn.cursor()
+    cur.row_factory = row_factory
+    rows = cur.execute(sql, params).fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1], sort)
+    return rows, next_cursor
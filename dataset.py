@@ -0,0 +1,14 @@
+import sqlite3
+
+
+# The dataset version identifies one import of the company data. The importer bumps it after every
+# commit so API workers can drop anything derived from the previous data.
+def get_version(conn: sqlite3.Connection):
+    row = conn.execute("SELECT version, updated_at FROM dataset_version WHERE id = 1").fetchone()
+    return row if row else (0, None)
+
+
+def bump_version(conn: sqlite3.Connection):
+    # Runs inside the caller's transaction so the new version is published together with the data
+    conn.execute("UPDATE dataset_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1")
+    return get_version(conn)
@@ -0,0 +1,68 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+
+
+class DatabaseBusy(Exception):
+    pass
+
+
+class DatabaseTimeout(Exception):
+    pass
+
+
+class DatabaseExecutor:
+    # Runs blocking sqlite3 calls on a dedicated set of threads so async endpoints never block the
+    # event loop or Starlette's shared threadpool. At most `workers` calls run at once and at most
+    # `max_queue` wait behind them; anything beyond that is rejected straight away.
+    def __init__(self, workers: int = config.db_workers, max_queue: int = config.db_max_queue,
+                 timeout: float = config.db_request_timeout):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db")
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.stats = {"completed": 0, "rejected": 0, "timeouts": 0}
+
+    def _done(self, future):
+        with self._lock:
+            self.in_flight -= 1
+            self.stats["completed"] += 1
+
+    async def run(self, func, *args, timeout: float = None):
+        with self._lock:
+            if self.in_flight >= self.workers + self.max_queue:
+                self.stats["rejected"] += 1
+                raise DatabaseBusy(f"{self.in_flight} database calls already pending")
+            self.in_flight += 1
+
+        future = self._executor.submit(func, *args)
+        future.add_done_callback(self._done)
+        try:
+            # A call still waiting in the queue is cancelled on timeout; a running one finishes in the background
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            raise DatabaseTimeout(f"Database call took longer than {timeout or self.timeout}s")
+
+    def submit(self, func, *args):
+        # Cleanup that has to run even when the request that needed it is gone, so it is neither
+        # counted against the queue limit nor cancelled; after shutdown it runs inline
+        try:
+            self._executor.submit(func, *args)
+        except RuntimeError:
+            func(*args)
+
+    def health(self):
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            **self.stats
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,190 @@
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import config
+
+
+# Deliberately not a sqlite3.Error: the query functions turn those into None, and running out of
+# connections has to reach the API as an overload, not as a missing row
+class PoolTimeout(Exception):
+    pass
+
+
+# Raised like PoolTimeout when every streaming connection is in use
+class StreamsBusy(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, database_path: str, size: int = config.pool_size, timeout: float = config.pool_timeout,
+                 pragmas: dict = None, health_check_interval: float = config.pool_health_check_interval,
+                 factory=sqlite3.Connection, on_release=None):
+        self.database_path = database_path
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = config.pool_pragmas if pragmas is None else pragmas
+        self.health_check_interval = health_check_interval
+        self.factory = factory
+        # Called with each connection as it is released, still on the thread that used it
+        self.on_release = on_release
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._last_used = {}
+        # Updated by every request thread, so only under _lock
+        self.stats = {"created": 0, "checkouts": 0, "discarded": 0, "timeouts": 0}
+
+    def connect(self):
+        # A new connection with the pool's settings, owned and closed by the caller
+        conn = sqlite3.connect(self.database_path, check_same_thread=False, timeout=self.timeout,
+                               cached_statements=config.pool_statement_cache, factory=self.factory)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def _connect(self):
+        conn = self.connect()
+        with self._lock:
+            self.stats["created"] += 1
+        return conn
+
+    def _is_healthy(self, conn):
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, conn):
+        self._last_used.pop(id(conn), None)
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._created -= 1
+            self.stats["discarded"] += 1
+
+    def acquire(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    can_create = self._created < self.size
+                    if can_create:
+                        self._created += 1
+                if can_create:
+                    try:
+                        conn = self._connect()
+                    except sqlite3.Error:
+                        with self._lock:
+                            self._created -= 1
+                        raise
+                else:
+                    try:
+                        conn = self._idle.get(timeout=self.timeout)
+                    except queue.Empty:
+                        with self._lock:
+                            self.stats["timeouts"] += 1
+                        raise PoolTimeout(f"No database connection available after {self.timeout}s")
+
+            # Only ping connections that have been idle for a while
+            idle_for = time.monotonic() - self._last_used.get(id(conn), time.monotonic())
+            if idle_for > self.health_check_interval and not self._is_healthy(conn):
+                self._discard(conn)
+                continue
+
+            with self._lock:
+                self.stats["checkouts"] += 1
+            return conn
+
+    def release(self, conn):
+        try:
+            if self.on_release is not None:
+                self.on_release(conn)
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        self._last_used[id(conn)] = time.monotonic()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def snapshot(self):
+        # Counters only, without touching a connection; cheap enough for every metrics scrape
+        with self._lock:
+            return {
+                "size": self.size,
+                "open": self._created,
+                "idle": self._idle.qsize(),
+                **self.stats
+            }
+
+    def health(self):
+        with self.connection() as conn:
+            healthy = self._is_healthy(conn)
+        return {"healthy": healthy, **self.snapshot()}
+
+    def close(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+
+class StreamConnections:
+    # Dedicated read connections for responses that last as long as the client keeps reading, such
+    # as the full-table stream and /export. They are opened outside the pool, so slow clients never
+    # hold pooled connections, and capped, since every open reader also holds back WAL checkpoints.
+    def __init__(self, pool: ConnectionPool, limit: int = config.stream_max_connections):
+        self.pool = pool
+        self.limit = limit
+        self._slots = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+        self.open = 0
+        self.stats = {"opened": 0, "rejected": 0}
+
+    def acquire(self):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.stats["rejected"] += 1
+            raise StreamsBusy(f"{self.limit} streaming responses already open")
+        try:
+            conn = self.pool.connect()
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.open += 1
+            self.stats["opened"] += 1
+        return conn
+
+    def release(self, conn):
+        try:
+            if self.pool.on_release is not None:
+                self.pool.on_release(conn)
+            conn.close()
+        except sqlite3.Error:
+            pass
+        finally:
+            with self._lock:
+                self.open -= 1
+            self._slots.release()
+
+    def snapshot(self):
+        with self._lock:
+            return {"limit": self.limit, "open": self.open, **self.stats}
@@ -0,0 +1,170 @@
+import csv
+import io
+import sqlite3
+
+import orjson
+
+import analytics
+import company_query
+import dataset
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Bulk export of the joined company dataset, the columns of /all_detail for every company. Rows
+# are read in id order inside one read transaction, so a single export is a consistent snapshot of
+# one dataset version however long it streams. An interrupted export resumes with after_id set to
+# the last company_id received and version set to the X-Dataset-Version it was sent.
+
+COLUMNS = ['company_id', 'url', 'name', 'website', 'description_short'] + analytics.METRICS
+
+# Where each column comes from in the seven-table join and in company_profile
+JOIN_SOURCES = {
+    'company_id': 'c.id', 'url': 'c.url', 'name': 'c.name', 'website': 'c.website',
+    'description_short': 'c.description_short',
+    'people_count': 'p.people_count', 'senior_people_count': 'p.senior_people_count',
+    'emails_count': 'ct.emails_count', 'personal_emails_count': 'ct.personal_emails_count',
+    'phones_count': 'ct.phones_count', 'addresses_count': 'ct.addresses_count',
+    'investors_count': 'i.investors_count', 'clients_count': 'cl.clients_count', 'partners_count': 'pn.partners_count',
+    'changes_count': 'ch.changes_count', 'people_changes_count': 'ch.people_changes_count',
+    'contact_changes_count': 'ch.contact_changes_count',
+}
+JOIN_FROM = """
+    FROM Company AS c
+    LEFT JOIN People AS p ON c.id = p.company_id
+    LEFT JOIN Contacts AS ct ON c.id = ct.company_id
+    LEFT JOIN Investments AS i ON c.id = i.company_id
+    LEFT JOIN Clients AS cl ON c.id = cl.company_id
+    LEFT JOIN Partners AS pn ON c.id = pn.company_id
+    LEFT JOIN Changes AS ch ON c.id = ch.company_id
+"""
+PROFILE_SOURCES = {column: 'c.id' if column == 'company_id' else f'c.{column}' for column in COLUMNS}
+PROFILE_FROM = "FROM company_profile AS c"
+
+MIN_ID = -2 ** 63
+MAX_ID = 2 ** 63 - 1
+
+
+# The requested format needs an optional package that is not installed; a server limitation (501),
+# not a bad request
+class ExportUnavailable(Exception):
+    pass
+
+
+def build_query(filter_shape, use_company_profile: bool):
+    # Only whitelisted columns and operators reach the SQL text; the id bounds, filter values and
+    # limit are bound parameters
+    sources = PROFILE_SOURCES if use_company_profile else JOIN_SOURCES
+    where = ["c.id > ?", "c.id <= ?"] + [f"{sources[metric]} {company_query.OPERATORS[op]} ?" for metric, op in filter_shape]
+    return (f"SELECT {', '.join(sources[column] for column in COLUMNS)} "
+            f"{PROFILE_FROM if use_company_profile else JOIN_FROM} "
+            f"WHERE {' AND '.join(where)} ORDER BY c.id LIMIT ?")
+
+
+def open_cursor(conn: sqlite3.Connection, filters, after_id: int = None, max_id: int = None, limit: int = None,
+                use_company_profile: bool = False):
+    # Starts the read transaction the whole export runs in and returns the dataset version it sees
+    # with the executed cursor. The caller ends the transaction when it is done with the cursor.
+    conn.execute("BEGIN")
+    version, _ = dataset.get_version(conn)
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute(
+        build_query(tuple((metric, op) for metric, op, _ in filters), use_company_profile),
+        [MIN_ID if after_id is None else after_id, MAX_ID if max_id is None else max_id]
+        + [value for _, _, value in filters] + [-1 if limit is None else limit]
+    )
+    return version, cursor
+
+
+class CsvEncoder:
+    media_type = "text/csv; charset=utf-8"
+    extension = "csv"
+    compressible = True
+
+    def header(self):
+        return self.encode([COLUMNS])
+
+    def encode(self, rows):
+        # NULL becomes an empty field
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue().encode("utf-8")
+
+    def finish(self):
+        return b""
+
+
+class NdjsonEncoder:
+    media_type = "application/x-ndjson"
+    extension = "ndjson"
+    compressible = True
+
+    def header(self):
+        return b""
+
+    def encode(self, rows):
+        return b"".join(orjson.dumps(dict(zip(COLUMNS, row))) + b"\n" for row in rows)
+
+    def finish(self):
+        return b""
+
+
+class _Sink(io.RawIOBase):
+    # Write-only file for ParquetWriter that hands the bytes written so far to the response
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class ParquetEncoder:
+    # One row group per fetched batch; the file footer is written by finish, so a Parquet export is
+    # only readable once it is complete. Pipelines resuming Parquet exports should pull id ranges.
+    media_type = "application/vnd.apache.parquet"
+    extension = "parquet"
+    compressible = False
+
+    def __init__(self):
+        if pa is None:
+            raise ExportUnavailable("Parquet export needs the pyarrow package")
+        self.schema = pa.schema([(column, pa.string() if column in ('url', 'name', 'website', 'description_short')
+                                  else pa.int64()) for column in COLUMNS])
+        self._sink = _Sink()
+        self._writer = pq.ParquetWriter(self._sink, self.schema)
+
+    def header(self):
+        return b""
+
+    def encode(self, rows):
+        columns = list(zip(*rows))
+        self._writer.write_table(pa.Table.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(columns, self.schema)], schema=self.schema))
+        return self._sink.drain()
+
+    def finish(self):
+        self._writer.close()
+        return self._sink.drain()
+
+
+ENCODERS = {"csv": CsvEncoder, "ndjson": NdjsonEncoder, "parquet": ParquetEncoder}
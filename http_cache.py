@@ -0,0 +1,109 @@
+import zlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+import config
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Content codings the API can produce, most preferred first. brotli is optional.
+ENCODINGS = (("br",) if brotli is not None else ()) + ("gzip",)
+
+
+def negotiate(accept_encoding: str):
+    # Best coding the client accepts per Accept-Encoding, or None for the identity body
+    if not config.compression_enabled or not accept_encoding:
+        return None
+    weights = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        weight = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding.strip().lower()] = weight
+    for coding in ENCODINGS:
+        if weights.get(coding, weights.get("*", 0.0)) > 0:
+            return coding
+    return None
+
+
+def compress(body: bytes, encoding: str, cached: bool = True):
+    # Bodies kept in the response cache are compressed once per dataset version and can afford a
+    # slower, tighter setting than bodies compressed on every request
+    if encoding == "br":
+        return brotli.compress(body, quality=config.brotli_quality if cached else config.brotli_fast_quality)
+    return zlib.compress(body, config.gzip_level if cached else config.gzip_fast_level, wbits=31)
+
+
+async def compress_stream(chunks, encoding: str):
+    # Compresses a streamed body chunk by chunk, so memory stays bounded by the compressor window
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=config.brotli_fast_quality)
+        process, finish = compressor.process, compressor.finish
+    else:
+        compressor = zlib.compressobj(config.gzip_fast_level, wbits=31)
+        process, finish = compressor.compress, compressor.flush
+    async for chunk in chunks:
+        data = process(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+def etag(version: int, encoding: str = None):
+    # Strong validator: a dataset version yields the same bytes for a URL, and each content coding
+    # of those bytes is a representation of its own
+    return f'"v{version}-{encoding}"' if encoding else f'"v{version}"'
+
+
+def last_modified(updated_at: str):
+    # dataset_version.updated_at is CURRENT_TIMESTAMP text, in UTC
+    if not updated_at:
+        return None
+    try:
+        moment = datetime.strptime(updated_at, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+    return format_datetime(moment, usegmt=True)
+
+
+def not_modified(headers, version: int, modified: str = None):
+    # The If-None-Match tag the request matched, "date" for an If-Modified-Since match, or None.
+    # If-None-Match wins over If-Modified-Since, and tags compare weakly as RFC 9110 requires for
+    # GET. "*" is not honoured: telling whether the resource exists needs the database.
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        current = etag(version)[:-1]
+        for tag in if_none_match.split(","):
+            tag = tag.strip()
+            if tag.startswith("W/"):
+                tag = tag[2:]
+            if tag == current + '"' or tag.startswith(current + "-"):
+                return tag
+        return None
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since and modified:
+        try:
+            if parsedate_to_datetime(if_modified_since) >= parsedate_to_datetime(modified):
+                return "date"
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+def validator_headers(version: int, modified: str = None, encoding: str = None):
+    # Version 0 means the dataset version has not been read yet, so no validators are sent
+    headers = {"Vary": "Accept-Encoding"} if config.compression_enabled else {}
+    if version:
+        headers["ETag"] = etag(version, encoding)
+        if modified:
+            headers["Last-Modified"] = modified
+    return headers
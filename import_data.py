@@ -1,55 +1,286 @@
+import argparse
+import hashlib
 import sqlite3
+import time
+
 import pandas as pd
-from sqlalchemy import create_engine
-import urllib
+
+import migrations
+import dataset
+import leaderboard
+import company_profile
+import search
+import similarity
+import snapshot
 
 # โหลดข้อมูลจากไฟล์ CSV
 file_path = r'D:\งาน\Database\Final Project\aihitdata-uk-10k.csv'
-data = pd.read_csv(file_path)
-
 database_path = r'D:\งาน\Database\Final Project\database\Final_Project.db'
-connection_string = f'sqlite:///{database_path}'
-
-# สร้าง engine สำหรับการเชื่อมต่อ
-engine = create_engine(
-    connection_string,
-    connect_args={'check_same_thread': False, 'timeout': 30}
-)
-
-# เตรียมข้อมูลและโหลดลงฐานข้อมูลทีละตาราง
-# Insert data into Company table
-companies_df = data[['id', 'url', 'name', 'website', 'description_short']]
-companies_df.columns = ['id', 'url', 'name', 'website', 'description_short']
-companies_df.to_sql('Company', con=engine, if_exists='append', index=False)
-
-# Insert data into People table
-people_df = data[['id', 'people_count', 'senior_people_count']]
-people_df.columns = ['company_id', 'people_count', 'senior_people_count']
-people_df.to_sql('People', con=engine, if_exists='append', index=False)
-
-# Insert data into Contacts table
-contacts_df = data[['id', 'emails_count', 'personal_emails_count', 'phones_count', 'addresses_count']]
-contacts_df.columns = ['company_id', 'emails_count', 'personal_emails_count', 'phones_count', 'addresses_count']
-contacts_df.to_sql('Contacts', con=engine, if_exists='append', index=False)
-
-# Insert data into Investments table
-investments_df = data[['id', 'investors_count']]
-investments_df.columns = ['company_id', 'investors_count']
-investments_df.to_sql('Investments', con=engine, if_exists='append', index=False)
-
-# Insert data into Clients table
-clients_df = data[['id', 'clients_count']]
-clients_df.columns = ['company_id', 'clients_count']
-clients_df.to_sql('Clients', con=engine, if_exists='append', index=False)
-
-# Insert data into Partners table
-partners_df = data[['id', 'partners_count']]
-partners_df.columns = ['company_id', 'partners_count']
-partners_df.to_sql('Partners', con=engine, if_exists='append', index=False)
-
-# Insert data into Changes table
-changes_df = data[['id', 'changes_count', 'people_changes_count', 'contact_changes_count']]
-changes_df.columns = ['company_id', 'changes_count', 'people_changes_count', 'contact_changes_count']
-changes_df.to_sql('Changes', con=engine, if_exists='append', index=False)
-
-print("Data imported successfully!")
+
+# Table name -> list of (CSV column, table column)
+TABLES = {
+    'Company': [('id', 'id'), ('url', 'url'), ('name', 'name'), ('website', 'website'),
+                ('description_short', 'description_short')],
+    'People': [('id', 'company_id'), ('people_count', 'people_count'), ('senior_people_count', 'senior_people_count')],
+    'Contacts': [('id', 'company_id'), ('emails_count', 'emails_count'), ('personal_emails_count', 'personal_emails_count'),
+                 ('phones_count', 'phones_count'), ('addresses_count', 'addresses_count')],
+    'Investments': [('id', 'company_id'), ('investors_count', 'investors_count')],
+    'Clients': [('id', 'company_id'), ('clients_count', 'clients_count')],
+    'Partners': [('id', 'company_id'), ('partners_count', 'partners_count')],
+    'Changes': [('id', 'company_id'), ('changes_count', 'changes_count'), ('people_changes_count', 'people_changes_count'),
+                ('contact_changes_count', 'contact_changes_count')],
+}
+
+CSV_COLUMNS = ['id', 'url', 'name', 'website', 'description_short', 'people_count', 'senior_people_count',
+               'emails_count', 'personal_emails_count', 'phones_count', 'addresses_count', 'investors_count',
+               'clients_count', 'partners_count', 'changes_count', 'people_changes_count', 'contact_changes_count']
+TEXT_COLUMNS = ['url', 'name', 'website', 'description_short']
+INTEGER_COLUMNS = ['id', 'people_count', 'senior_people_count', 'emails_count', 'personal_emails_count', 'phones_count',
+                   'addresses_count', 'investors_count', 'clients_count', 'partners_count', 'changes_count',
+                   'people_changes_count', 'contact_changes_count']
+
+# Trade durability for speed while loading; everything still happens in one transaction
+BULK_PRAGMAS = {
+    'synchronous': 'OFF',
+    'cache_size': -262144,  # 256 MiB
+    'temp_store': 'FILE',  # keeps index builds and the staging table out of RAM on large files
+    'analysis_limit': 1000,
+}
+
+
+def read_chunks(csv_path: str, chunk_size: int):
+    # Integers are read as nullable Int64 so missing values become NULL instead of turning the column into floats
+    dtypes = {column: 'Int64' for column in INTEGER_COLUMNS}
+    dtypes.update({column: object for column in TEXT_COLUMNS})
+    for chunk in pd.read_csv(csv_path, dtype=dtypes, chunksize=chunk_size):
+        yield chunk.astype(object).where(chunk.notna(), None)
+
+
+def insert_statement(table: str):
+    columns = [column for _, column in TABLES[table]]
+    return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+
+def table_rows(chunk, table: str):
+    return chunk[[column for column, _ in TABLES[table]]].itertuples(index=False, name=None)
+
+
+def row_hash(row):
+    return hashlib.blake2b(repr(row).encode('utf-8'), digest_size=16).digest()
+
+
+def hashed_rows(chunk):
+    for row in chunk[CSV_COLUMNS].itertuples(index=False, name=None):
+        yield row + (row_hash(row),)
+
+
+def hash_rows(chunk):
+    for row in chunk[CSV_COLUMNS].itertuples(index=False, name=None):
+        yield row[0], row_hash(row)
+
+
+def drop_indexes(conn: sqlite3.Connection, tables):
+    # Drop the secondary indexes on the given tables and return the SQL to recreate them
+    rows = conn.execute(
+        f"SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL "
+        f"AND tbl_name IN ({', '.join('?' * len(tables))})",
+        list(tables)
+    ).fetchall()
+    for name, _ in rows:
+        conn.execute(f"DROP INDEX {name}")
+    return [sql for _, sql in rows]
+
+
+def rebuild_derived(conn: sqlite3.Connection):
+    # Everything computed from the base tables; runs inside the load transaction
+    for statement in leaderboard.rebuild_statements():
+        conn.execute(statement)
+
+
+def write_similarity_index(conn: sqlite3.Connection, version: int, index_path: str):
+    # Built from the uncommitted data and renamed into place before COMMIT, so by the time API workers
+    # see the new dataset version the matching index file is already there
+    if index_path:
+        start = time.perf_counter()
+        similarity.SimilarityIndex.build(conn, version).save(index_path)
+        print(f"  similarity index written in {time.perf_counter() - start:.1f}s")
+
+
+def write_snapshot(conn: sqlite3.Connection, version: int, snapshot_database: str):
+    # Same ordering as the similarity index: the file for the new version exists before it is visible
+    if snapshot_database:
+        start = time.perf_counter()
+        snapshot.write(conn, version, snapshot.snapshot_path(snapshot_database, version))
+        print(f"  snapshot written in {time.perf_counter() - start:.1f}s")
+
+
+def load_full(conn: sqlite3.Connection, csv_path: str, chunk_size: int, index_path: str = None,
+              snapshot_database: str = None):
+    rows = 0
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        index_sql = drop_indexes(conn, TABLES)
+        profile_index_sql = drop_indexes(conn, ['company_profile'])
+        for table in TABLES:
+            conn.execute(f"DELETE FROM {table}")
+        conn.execute("DELETE FROM company_hash")
+
+        for chunk in read_chunks(csv_path, chunk_size):
+            for table in TABLES:
+                conn.executemany(insert_statement(table), table_rows(chunk, table))
+            conn.executemany("INSERT INTO company_hash (id, row_hash) VALUES (?, ?)", hash_rows(chunk))
+            rows += len(chunk)
+            print(f"  {rows} rows loaded")
+
+        # Recreating the unique indexes also rejects duplicate ids in the file
+        for sql in index_sql:
+            conn.execute(sql)
+        rebuild_derived(conn)
+        for statement in search.REBUILD_STATEMENTS + company_profile.REBUILD_STATEMENTS:
+            conn.execute(statement)
+        # The profile is rebuilt from joins on the satellite indexes, so its own indexes come last
+        for sql in profile_index_sql:
+            conn.execute(sql)
+        conn.execute("ANALYZE")
+        version, _ = dataset.bump_version(conn)
+        write_similarity_index(conn, version, index_path)
+        write_snapshot(conn, version, snapshot_database)
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return {"rows": rows, "version": version}
+
+
+def upsert_statement(table: str):
+    columns = [column for _, column in TABLES[table]]
+    sources = [f"s.{column}" for column, _ in TABLES[table]]
+    updates = ', '.join(f"{column} = excluded.{column}" for column in columns[1:])
+    return f"""
+        INSERT INTO {table} ({', '.join(columns)})
+        SELECT {', '.join(sources)} FROM import_staging AS s WHERE s.status != 'unchanged'
+        ON CONFLICT({columns[0]}) DO UPDATE SET {updates}
+    """
+
+
+def load_incremental(conn: sqlite3.Connection, csv_path: str, chunk_size: int, index_path: str = None,
+                     snapshot_database: str = None):
+    # Stage the new file, compare row hashes by id and only touch companies that were added,
+    # changed or removed
+    rows = 0
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(f"""
+            CREATE TEMP TABLE import_staging (
+                id INTEGER PRIMARY KEY,
+                {', '.join(CSV_COLUMNS[1:])},
+                row_hash BLOB NOT NULL,
+                status TEXT
+            )
+        """)
+        staging_insert = (f"INSERT INTO import_staging ({', '.join(CSV_COLUMNS)}, row_hash) "
+                          f"VALUES ({', '.join('?' * (len(CSV_COLUMNS) + 1))})")
+        for chunk in read_chunks(csv_path, chunk_size):
+            conn.executemany(staging_insert, hashed_rows(chunk))
+            rows += len(chunk)
+            print(f"  {rows} rows staged")
+
+        conn.execute("""
+            UPDATE import_staging SET status = CASE
+                WHEN NOT EXISTS (SELECT 1 FROM Company AS c WHERE c.id = import_staging.id) THEN 'inserted'
+                WHEN (SELECT h.row_hash FROM company_hash AS h WHERE h.id = import_staging.id) IS import_staging.row_hash
+                    THEN 'unchanged'
+                ELSE 'updated'
+            END
+        """)
+        changes = dict(conn.execute("SELECT status, COUNT(*) FROM import_staging GROUP BY status").fetchall())
+        changes["deleted"] = conn.execute(
+            "SELECT COUNT(*) FROM Company WHERE id NOT IN (SELECT id FROM import_staging)"
+        ).fetchone()[0]
+
+        if changes.get("inserted") or changes.get("updated") or changes["deleted"]:
+            # Only re-index the companies that changed
+            search.remove(conn, "SELECT id FROM import_staging WHERE status = 'updated' "
+                                "UNION ALL SELECT id FROM Company WHERE id NOT IN (SELECT id FROM import_staging)")
+            company_profile.remove(conn, "SELECT id FROM import_staging WHERE status = 'updated' "
+                                   "UNION ALL SELECT id FROM company_profile WHERE id NOT IN (SELECT id FROM import_staging)")
+            for table in TABLES:
+                key = TABLES[table][0][1]
+                conn.execute(f"DELETE FROM {table} WHERE {key} NOT IN (SELECT id FROM import_staging)")
+                conn.execute(upsert_statement(table))
+            conn.execute("DELETE FROM company_hash WHERE id NOT IN (SELECT id FROM import_staging)")
+            conn.execute("""
+                INSERT INTO company_hash (id, row_hash)
+                SELECT id, row_hash FROM import_staging WHERE status != 'unchanged'
+                ON CONFLICT(id) DO UPDATE SET row_hash = excluded.row_hash
+            """)
+            search.add(conn, "SELECT id FROM import_staging WHERE status != 'unchanged'")
+            company_profile.add(conn, "SELECT id FROM import_staging WHERE status != 'unchanged'")
+            rebuild_derived(conn)
+            version, _ = dataset.bump_version(conn)
+            # Document frequencies and metric scaling are global, so the index is always rebuilt whole
+            write_similarity_index(conn, version, index_path)
+            write_snapshot(conn, version, snapshot_database)
+        else:
+            version, _ = dataset.get_version(conn)
+
+        conn.execute("DROP TABLE import_staging")
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return {
+        "rows": rows,
+        "version": version,
+        "inserted": changes.get("inserted", 0),
+        "updated": changes.get("updated", 0),
+        "deleted": changes["deleted"],
+        "unchanged": changes.get("unchanged", 0)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load the aihitdata CSV export into the SQLite database")
+    parser.add_argument("--csv", default=file_path)
+    parser.add_argument("--db", default=database_path)
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    parser.add_argument("--mode", choices=["full", "incremental"], default="full",
+                        help="full replaces every row; incremental only applies the differences by company id")
+    parser.add_argument("--no-similarity-index", action="store_true",
+                        help="skip writing the similar-companies index; the API then builds it on startup")
+    parser.add_argument("--no-snapshot", action="store_true",
+                        help="skip writing the read-only snapshot; SNAPSHOT_MODE workers then read SQLite")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    try:
+        # Create tables and indexes before loading
+        migrations.migrate(conn)
+        for name, value in BULK_PRAGMAS.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+
+        index_path = None if args.no_similarity_index else similarity.index_path(args.db)
+        snapshot_database = None if args.no_snapshot else args.db
+        start = time.perf_counter()
+        if args.mode == "incremental":
+            result = load_incremental(conn, args.csv, args.chunk_size, index_path, snapshot_database)
+        else:
+            result = load_full(conn, args.csv, args.chunk_size, index_path, snapshot_database)
+        elapsed = time.perf_counter() - start
+    finally:
+        conn.close()
+
+    rows = result["rows"]
+    print(f"Data imported successfully! {rows} rows in {elapsed:.1f}s ({rows / elapsed:.0f} rows/s), "
+          f"dataset version {result['version']}")
+    if args.mode == "incremental":
+        print(f"  inserted {result['inserted']}, updated {result['updated']}, deleted {result['deleted']}, "
+              f"unchanged {result['unchanged']}")
+    # SNAPSHOT_MODE workers delete older snapshots once they have remapped; without such workers
+    # the files would pile up, so anything before the previous version goes here too
+    if snapshot_database:
+        snapshot.remove_older(snapshot_database, result["version"] - 1)
+
+
+if __name__ == "__main__":
+    main()
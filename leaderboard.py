@@ -0,0 +1,58 @@
+import sqlite3
+
+# Ranked metrics and the satellite table each one lives in
+METRICS = {
+    'investors_count': 'Investments',
+    'clients_count': 'Clients',
+    'partners_count': 'Partners',
+    'changes_count': 'Changes',
+    'people_changes_count': 'Changes',
+    'contact_changes_count': 'Changes',
+}
+
+
+def rebuild_statements():
+    # Rank 1 is the highest value; ties keep the company_id order the covering indexes return
+    statements = ["DELETE FROM Leaderboard"]
+    for metric, table in METRICS.items():
+        statements.append(f"""
+            INSERT INTO Leaderboard (metric, rank, company_id, value, name)
+            SELECT '{metric}', ROW_NUMBER() OVER (ORDER BY t.{metric} DESC, t.company_id), t.company_id, t.{metric}, cp.name
+            FROM {table} AS t
+            LEFT JOIN Company AS cp ON t.company_id = cp.id
+        """)
+    return statements
+
+
+def top(conn: sqlite3.Connection, metric: str, limit: int, offset: int = 0, row_factory=None):
+    # Ranks are contiguous, so a page is a primary key range read with no sorting.
+    # The value column is named after the metric so rows can be returned as-is.
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric {metric}")
+    cursor = conn.cursor()
+    cursor.row_factory = row_factory
+    return cursor.execute(
+        f"SELECT company_id, value AS {metric}, name FROM Leaderboard WHERE metric = ? AND rank > ? ORDER BY rank LIMIT ?",
+        (metric, offset, limit)
+    ).fetchall()
+
+
+def rank_of(conn: sqlite3.Connection, metric: str, company_id: int):
+    row = conn.execute(
+        """
+        SELECT lb.rank, lb.value, lb.name, (SELECT MAX(rank) FROM Leaderboard WHERE metric = lb.metric)
+        FROM Leaderboard AS lb
+        WHERE lb.metric = ? AND lb.company_id = ?
+        """,
+        (metric, company_id)
+    ).fetchone()
+    if not row:
+        return None
+    return {
+        "company_id": company_id,
+        "company_name": row[2],
+        "metric": metric,
+        "rank": row[0],
+        "value": row[1],
+        "out_of": row[3]
+    }
@@ -1,16 +1,49 @@
+import asyncio
+import json
+import logging
+import math
 import sqlite3
+import threading
+from typing import List, Optional
 from fastapi.middleware.cors import CORSMiddleware
 import pyodbc
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from pydantic import BaseModel
 from sqlalchemy import create_engine, Column, Integer, String
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
-import bcrypt
 
-
-
-app = FastAPI()
+import config
+from db_pool import ConnectionPool, PoolTimeout, StreamConnections, StreamsBusy
+from db_executor import DatabaseBusy, DatabaseExecutor, DatabaseTimeout
+import migrations
+import dataset
+import leaderboard
+import search
+import company_profile
+import analytics
+import company_query
+import similarity
+import snapshot
+import company_index
+import http_cache
+import export
+import repository
+from cache import ResponseCache
+from auth import AuthBusy, AuthTimeout, PasswordHasher
+from rate_limit import RateLimiter
+import sessions
+import tokens
+import metrics
+import slow_queries
+from serialization import ORJSONResponse, dict_row, encode_json
+import schemas
+
+
+app = FastAPI(default_response_class=ORJSONResponse)
+logger = logging.getLogger(__name__)
 
 app.add_middleware(
     CORSMiddleware,
@@ -20,696 +53,1288 @@ app.add_middleware(
     allow_headers=["*"],  
 )
 
+# Added last so it is the outermost layer and times everything, CORS and error handling included
+if config.metrics_enabled:
+    app.add_middleware(metrics.MetricsMiddleware)
+
 # SQL Connection
 # Local host
 # server = 'LAPTOP-1A7RJNVJ\SQLEXPRESS'
 # database = 'Final_Project'
 # connection_string = f'DRIVER={{ODBC Driver 17 for SQL Server}};SERVER={server};DATABASE={database};Trusted_Connection=yes;'
 
-database_path = 'Final_Project.db'
+database_path = config.database_path
+
+# Lowest possible SQLite integer, used as the starting point for keyset pagination
+MIN_COMPANY_ID = -2 ** 63
+
+# Shared connection pool used by every query function
+# Statements are timed for /metrics and the slow query log
+instrument_queries = config.metrics_enabled or config.slow_query_ms > 0
+pool = ConnectionPool(database_path,
+                      factory=metrics.InstrumentedConnection if instrument_queries else sqlite3.Connection,
+                      on_release=metrics.InstrumentedConnection.finish_statements if instrument_queries else None)
+
+# Full-table streams and exports read on their own connections, at most stream_max_connections at once
+streams = StreamConnections(pool)
+
+# Blocking database calls from async endpoints go through this executor
+db = DatabaseExecutor()
+
+# Password hashing runs in its own process pool, separate from the database executor
+hasher = PasswordHasher()
+
+# Login attempts are limited per client address and per username
+auth_ip_limiter = RateLimiter(config.auth_rate_per_ip / 60, config.auth_burst_per_ip)
+login_user_limiter = RateLimiter(config.login_rate_per_user / 60, config.login_burst_per_user)
+
+@app.exception_handler(DatabaseBusy)
+@app.exception_handler(PoolTimeout)
+@app.exception_handler(StreamsBusy)
+@app.exception_handler(AuthBusy)
+async def database_busy_handler(request: Request, exc: DatabaseBusy):
+    return JSONResponse(status_code=503, content={"detail": "Server busy, try again later"},
+                        headers={"Retry-After": "1"})
+
+@app.exception_handler(DatabaseTimeout)
+@app.exception_handler(AuthTimeout)
+async def database_timeout_handler(request: Request, exc: DatabaseTimeout):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
+
+# Bring the schema and indexes up to date before serving requests
+@app.on_event("startup")
+def apply_migrations():
+    with pool.connection() as conn:
+        for version, description in migrations.migrate(conn):
+            print(f"Applied migration {version}: {description}")
+
+# Token signing key: AUTH_SECRET if set, otherwise the key every worker shares through the database
+@app.on_event("startup")
+def load_auth_secret():
+    with pool.connection() as conn:
+        app.state.auth_secret = config.auth_secret or sessions.get_secret(conn)
+
+# Encoded bodies of the read-only routes, dropped whenever the importer publishes a new dataset version
+response_cache = ResponseCache()
+
+def read_dataset_version():
+    with pool.connection() as conn:
+        return dataset.get_version(conn)
+
+# NumPy copies of the metric columns behind /stats
+metric_store = analytics.MetricStore()
+
+def load_metric_columns(version: int):
+    with pool.connection() as conn:
+        if metric_store.load(conn, version):
+            print(f"Loaded {metric_store.columns.rows} rows of metric columns for dataset version {version}")
+
+# Nearest-neighbour index behind /companies/{id}/similar
+similar_store = similarity.SimilarityStore(similarity.index_path(database_path))
+
+def load_similarity_index(version: int):
+    with pool.connection() as conn:
+        if similar_store.load(conn, version):
+            print(f"Loaded similarity index of {similar_store.index.rows} companies for dataset version {version}")
+
+# Memory-mapped company store behind the single-company routes in snapshot mode
+snapshot_store = snapshot.SnapshotStore(database_path)
+
+def load_snapshot(version: int):
+    if snapshot_store.load(version):
+        print(f"Mapped snapshot of {snapshot_store.current.rows} companies for dataset version {version}")
+    else:
+        print(f"No snapshot for dataset version {version}, company routes read SQLite")
+
+# Compact in-process copy of the satellite route columns
+company_index_store = company_index.CompanyIndexStore()
+
+def load_company_index(version: int):
+    with pool.connection() as conn:
+        if company_index_store.load(conn, version):
+            index = company_index_store.index
+            print(f"Loaded company index of {index.rows} companies ({index.nbytes() // 1024} KiB) for dataset version {version}")
+
+async def watch_dataset_version():
+    while True:
+        try:
+            version, updated_at = await db.run(read_dataset_version)
+            # Load the new columns before invalidating, so cached /stats bodies always match them
+            if config.analytics_enabled and metric_store.version != version:
+                await db.run(load_metric_columns, version, timeout=config.analytics_load_timeout)
+            if config.similar_enabled and similar_store.version != version:
+                await db.run(load_similarity_index, version, timeout=config.similar_load_timeout)
+            if storage.name == 'sqlite' and config.snapshot_mode and snapshot_store.checked_version != version:
+                await db.run(load_snapshot, version)
+            if snapshot_store.stale:
+                await db.run(snapshot_store.remove_stale)
+            if storage.name == 'sqlite' and config.company_index_enabled and company_index_store.version != version:
+                await db.run(load_company_index, version, timeout=config.company_index_load_timeout)
+            response_cache.set_generation(version, http_cache.last_modified(updated_at))
+        except (sqlite3.Error, PoolTimeout, DatabaseBusy, DatabaseTimeout) as e:
+            print("Error reading dataset version:", e)
+        except Exception:
+            # A failed reload must not end the loop, or the cache generation would never move again
+            logger.exception("Error reloading dataset version")
+        await asyncio.sleep(config.dataset_version_poll_interval)
+
+def watcher_stopped(task: asyncio.Task):
+    # The watchers only end when shutdown cancels them; anything else means reloads have stopped
+    if task.cancelled():
+        return
+    logger.error("Background task %s stopped", task.get_name(), exc_info=task.exception())
+
+@app.on_event("startup")
+async def start_dataset_watcher():
+    app.state.dataset_watcher = asyncio.create_task(watch_dataset_version(), name="dataset watcher")
+    app.state.dataset_watcher.add_done_callback(watcher_stopped)
+
+# Access tokens are checked in memory; only revocations are read back from the sessions table
+session_store = sessions.SessionStore()
+
+def refresh_sessions():
+    with pool.connection() as conn:
+        session_store.refresh(conn)
+
+async def watch_sessions():
+    while True:
+        try:
+            await db.run(refresh_sessions)
+        except (sqlite3.Error, PoolTimeout, DatabaseBusy, DatabaseTimeout) as e:
+            print("Error refreshing sessions:", e)
+        except Exception:
+            logger.exception("Error refreshing sessions")
+        await asyncio.sleep(config.session_poll_interval)
+
+@app.on_event("startup")
+async def start_session_watcher():
+    app.state.session_watcher = asyncio.create_task(watch_sessions(), name="session watcher")
+    app.state.session_watcher.add_done_callback(watcher_stopped)
+
+@app.on_event("shutdown")
+def close_pool():
+    app.state.dataset_watcher.cancel()
+    app.state.session_watcher.cancel()
+    db.close()
+    hasher.close()
+    pool.close()
+    storage.close()
 
 class UserCreate(BaseModel):
     username: str
     password: str
 
-def register_user(user: UserCreate):
-    hashed_password = bcrypt.hashpw(user.password.encode('utf-8'), bcrypt.gensalt())
+class CompanyBatch(BaseModel):
+    ids: List[int]
+
+def register_user(username: str, password_hash: str):
     try:
-        conn = sqlite3.connect(database_path)
-        cursor = conn.cursor()
-        cursor.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)", (user.username, hashed_password.decode('utf-8')))
-        conn.commit()
-        return True
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)", (username, password_hash))
+            conn.commit()
+            return True
     except sqlite3.Error as e:
         print("Error registering user:", e)
         return False
-    finally:
-        cursor.close()
-        conn.close()
 
-def login_user(user: UserCreate):
+def get_password_hash(username: str):
     try:
-        conn = sqlite3.connect(database_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT password_hash FROM users WHERE username = ?", (user.username,))
-        result = cursor.fetchone()
-        if result and bcrypt.checkpw(user.password.encode('utf-8'), result[0].encode('utf-8')):
-            return True
-        else:
-            return False
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT password_hash FROM users WHERE username = ?", (username,))
+            result = cursor.fetchone()
+            return result[0] if result else None
     except sqlite3.Error as e:
         print("Error logging in user:", e)
+        return None
+
+def update_password_hash(username: str, old_hash: str, new_hash: str):
+    # Only replaces the hash that was verified, so a concurrent password change is never overwritten
+    try:
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE users SET password_hash = ? WHERE username = ? AND password_hash = ?",
+                           (new_hash, username, old_hash))
+            conn.commit()
+            return cursor.rowcount == 1
+    except sqlite3.Error as e:
+        print("Error updating password hash:", e)
         return False
-    finally:
-        cursor.close()
-        conn.close()
+
+def create_session(username: str):
+    try:
+        with pool.connection() as conn:
+            return session_store.create(conn, username, config.access_token_ttl)
+    except sqlite3.Error as e:
+        print("Error creating session:", e)
+        return None
+
+def revoke_sessions(session_id: str, username: str = None):
+    # Revokes one session, or every session of `username` when it is given
+    try:
+        with pool.connection() as conn:
+            if username is not None:
+                return session_store.revoke_user(conn, username)
+            return int(session_store.revoke(conn, session_id))
+    except sqlite3.Error as e:
+        print("Error revoking session:", e)
+        return None
+
+COMPANIES_PAGE_SQL = "SELECT id, url, name, website, description_short FROM Company WHERE id > ? ORDER BY id LIMIT ?"
 
 # Function to get data from SQL Server
-def get_companies_all():
+def iter_companies(after_id: Optional[int] = None, limit: Optional[int] = None):
+    # Keyset scan over Company ordered by id. The query runs eagerly so database errors surface
+    # before a response starts; rows are then pulled lazily in fetchmany batches to keep memory flat.
+    # The scan holds one of the stream connections until the last batch, not a pooled one.
+    try:
+        conn = streams.acquire()
+    except sqlite3.Error as e:
+        print("Error accessing database:", e)
+        return None
+
     try:
-        conn = sqlite3.connect(database_path)
         cursor = conn.cursor()
-        cursor.execute("SELECT id, url, name, website, description_short FROM Company")
-        rows = cursor.fetchall()
-        return rows
-    except pyodbc.Error as e:
+        cursor.row_factory = dict_row
+        cursor.execute(COMPANIES_PAGE_SQL,
+                       (MIN_COMPANY_ID if after_id is None else after_id, -1 if limit is None else limit))
+    except sqlite3.Error as e:
+        streams.release(conn)
         print("Error accessing database:", e)
         return None
-    finally:
+
+    def batches():
+        try:
+            while True:
+                batch = cursor.fetchmany(config.stream_batch_size)
+                if not batch:
+                    break
+                yield batch
+        except sqlite3.Error as e:
+            print("Error accessing database:", e)
+        finally:
+            cursor.close()
+            streams.release(conn)
+
+    return batches()
+
+def open_export(filters, after_id: Optional[int], max_id: Optional[int], limit: Optional[int],
+                expected_version: Optional[int]):
+    # Like iter_companies, but the connection stays in one read transaction until the last batch,
+    # and a database error while streaming is raised so the response is cut off rather than ending
+    # as if the export were complete. Returns no batches when the dataset version is not the
+    # expected one. Like the full-table stream it reads on one of the stream connections, since the
+    # transaction lasts as long as the client keeps reading.
+    try:
+        conn = streams.acquire()
+    except sqlite3.Error as e:
+        print("Error accessing database:", e)
+        return None
+
+    try:
+        version, cursor = export.open_cursor(conn, filters, after_id, max_id, limit, config.use_company_profile)
+    except sqlite3.Error as e:
+        streams.release(conn)
+        print("Error accessing database:", e)
+        return None
+    if expected_version is not None and version != expected_version:
         cursor.close()
-        conn.close()
+        streams.release(conn)
+        return version, None
+
+    def batches():
+        try:
+            while True:
+                batch = cursor.fetchmany(config.export_batch_size)
+                if not batch:
+                    break
+                yield batch
+        except sqlite3.Error as e:
+            print("Error accessing database:", e)
+            raise
+        finally:
+            cursor.close()
+            streams.release(conn)
+
+    return version, batches()
+
+# Company joined with its six one-to-one satellite tables. The has_* flag columns mark whether a
+# satellite row exists, so missing sections still come back as None.
+COMPANY_DETAILS_QUERY = company_profile.SELECT_SQL
+
+# The same columns read from the denormalized company_profile table
+PROFILE_DETAILS_QUERY = f"SELECT {', '.join('c.' + column for column in company_profile.COLUMNS)} FROM company_profile AS c"
+
+def company_details_query():
+    return PROFILE_DETAILS_QUERY if config.use_company_profile else COMPANY_DETAILS_QUERY
 
 def get_company_details(company_id: int):
     try:
-        conn = sqlite3.connect(database_path)
-        cursor = conn.cursor()
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+
+            # Query for Company details together with every satellite table
+            cursor.execute(company_details_query() + " WHERE c.id = ?", (company_id,))
+            company = cursor.fetchone()
 
-        # Query for Company details
-        cursor.execute("SELECT * FROM Company WHERE id = ?", (company_id,))
-        company = cursor.fetchone()
-
-        if not company:
-            return None
-
-        # Query for People
-        cursor.execute("SELECT * FROM People WHERE company_id = ?", (company_id,))
-        people = cursor.fetchone()
-
-        # Query for Contacts
-        cursor.execute("SELECT * FROM Contacts WHERE company_id = ?", (company_id,))
-        contacts = cursor.fetchone()
-
-        # Query for Investments
-        cursor.execute("SELECT * FROM Investments WHERE company_id = ?", (company_id,))
-        investments = cursor.fetchone()
-
-        # Query for Clients
-        cursor.execute("SELECT * FROM Clients WHERE company_id = ?", (company_id,))
-        clients = cursor.fetchone()
-
-        # Query for Partners
-        cursor.execute("SELECT * FROM Partners WHERE company_id = ?", (company_id,))
-        partners = cursor.fetchone()
-
-        # Query for Changes
-        cursor.execute("SELECT * FROM Changes WHERE company_id = ?", (company_id,))
-        changes = cursor.fetchone()
-
-        return {
-            "company": {
-                "id": company[0],
-                "url": company[1],
-                "name": company[2],
-                "website": company[3],
-                "description_short": company[4]
-            },
-            "people": {
-                "people_count": people[1],
-                "senior_people_count": people[2]
-            } if people else None,
-            "contacts": {
-                "emails_count": contacts[1],
-                "personal_emails_count": contacts[2],
-                "phones_count": contacts[3],
-                "addresses_count": contacts[4]
-            } if contacts else None,
-            "investments": {
-                "investors_count": investments[1]
-            } if investments else None,
-            "clients": {
-                "clients_count": clients[1]
-            } if clients else None,
-            "partners": {
-                "partners_count": partners[1]
-            } if partners else None,
-            "changes": {
-                "changes_count": changes[1],
-                "people_changes_count": changes[2],
-                "contact_changes_count": changes[3]
-            } if changes else None
-        }
+            if not company:
+                return None
+
+            return company_profile.details_view(company)
 
     except sqlite3.Error as e:
         print("Error accessing database:", e)
         return None
-    finally:
-        cursor.close()
-        conn.close()
 
-def get_people(company_id: int):
+def get_company_details_batch(company_ids: List[int]):
     try:
-        conn = sqlite3.connect(database_path)
-        cursor = conn.cursor()
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+
+            # One statement for the whole batch: the ids are passed as a single JSON array parameter
+            cursor.execute(
+                company_details_query() + " WHERE c.id IN (SELECT value FROM json_each(?))",
+                (json.dumps(company_ids),)
+            )
+            rows = cursor.fetchall()
+
+            return {row[0]: company_profile.details_view(row) for row in rows}
 
-        # Query for People and Company details
-        cursor.execute("""
-            SELECT p.company_id, p.people_count, p.senior_people_count, c.name
-            FROM People p
-            LEFT JOIN Company c
-            ON p.company_id = c.id
-            WHERE p.company_id = ?
-        """, (company_id,))  
-
-        people = cursor.fetchone()
-        if not people:
-            return None
-
-        return {
-            "people": {
-                "company_id": people[0],
-                "company_name": people[3],
-                "people_count": people[1],
-                "senior_people_count": people[2]
-            }
-        }
     except sqlite3.Error as e:
         print("Error accessing database:", e)
         return None
-    finally:
-        cursor.close()
-        conn.close()
-    
-def get_more_detail(company_id: int):
+
+def get_people(company_id: int):
     try:
-        conn = sqlite3.connect(database_path)
-        cursor = conn.cursor()
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = dict_row
+
+            # Query for People and Company details
+            cursor.execute("""
+                SELECT p.company_id, c.name AS company_name, p.people_count, p.senior_people_count
+                FROM People p
+                LEFT JOIN Company c
+                ON p.company_id = c.id
+                WHERE p.company_id = ?
+            """, (company_id,))
+            people = cursor.fetchone()
+
+            if not people:
+                return None
+
+            return {"people": people}
+    except sqlite3.Error as e:
+        print("Error accessing database:", e)
+        return None
 
-        # Query for more details about the Company
-        cursor.execute("""
-            SELECT c.id, p.people_count, p.senior_people_count, ct.emails_count, ct.personal_emails_count,
-                   ct.phones_count, ct.addresses_count, i.investors_count, cl.clients_count, pn.partners_count,
-                   ch.changes_count, ch.people_changes_count, ch.contact_changes_count
-            FROM Company AS c
-            LEFT JOIN People AS p ON c.id = p.company_id
-            LEFT JOIN Contacts AS ct ON c.id = ct.company_id
-            LEFT JOIN Investments AS i ON c.id = i.company_id
-            LEFT JOIN Clients AS cl ON c.id = cl.company_id
-            LEFT JOIN Partners AS pn ON c.id = pn.company_id
-            LEFT JOIN Changes AS ch ON c.id = ch.company_id
-            WHERE c.id = ?
-        """, (company_id,))
-        more_detail = cursor.fetchone()
-
-        if not more_detail:
-            return None
-
-        return {
-            "more_detail": {
-                "company_id": more_detail[0],
-                "people_count": more_detail[1],
-                "senior_people_count": more_detail[2],
-                "emails_count": more_detail[3],
-                "personal_emails_count": more_detail[4],
-                "phones_count": more_detail[5],
-                "addresses_count": more_detail[6],
-                "investors_count": more_detail[7],
-                "clients_count": more_detail[8],
-                "partners_count": more_detail[9],
-                "changes_count": more_detail[10],
-                "people_changes_count": more_detail[11],
-                "contact_changes_count": more_detail[12]
-            }
-        }
+def get_more_detail(company_id: int):
+    try:
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = dict_row
+
+            # Query for more details about the Company
+            if config.use_company_profile:
+                cursor.execute("""
+                    SELECT id AS company_id, people_count, senior_people_count, emails_count, personal_emails_count,
+                           phones_count, addresses_count, investors_count, clients_count, partners_count,
+                           changes_count, people_changes_count, contact_changes_count
+                    FROM company_profile
+                    WHERE id = ?
+                """, (company_id,))
+            else:
+                cursor.execute("""
+                    SELECT c.id AS company_id, p.people_count, p.senior_people_count, ct.emails_count, ct.personal_emails_count,
+                           ct.phones_count, ct.addresses_count, i.investors_count, cl.clients_count, pn.partners_count,
+                           ch.changes_count, ch.people_changes_count, ch.contact_changes_count
+                    FROM Company AS c
+                    LEFT JOIN People AS p ON c.id = p.company_id
+                    LEFT JOIN Contacts AS ct ON c.id = ct.company_id
+                    LEFT JOIN Investments AS i ON c.id = i.company_id
+                    LEFT JOIN Clients AS cl ON c.id = cl.company_id
+                    LEFT JOIN Partners AS pn ON c.id = pn.company_id
+                    LEFT JOIN Changes AS ch ON c.id = ch.company_id
+                    WHERE c.id = ?
+                """, (company_id,))
+            more_detail = cursor.fetchone()
+
+            if not more_detail:
+                return None
+
+            return {"more_detail": more_detail}
     except sqlite3.Error as e:
         print("Error accessing database:", e)
         return None
-    finally:
-        cursor.close()
-        conn.close()
 
 def get_contact(company_id: int):
     try:
-        conn = sqlite3.connect(database_path)
-        cursor = conn.cursor()
-
-        # Query for Contact details
-        cursor.execute("""
-            SELECT ct.company_id, ct.addresses_count, ct.emails_count, ct.personal_emails_count, ct.phones_count, cp.name
-            FROM Contacts AS ct
-            LEFT JOIN Company AS cp ON ct.company_id = cp.id
-            WHERE ct.company_id = ?
-        """, (company_id,))
-        contact = cursor.fetchone()
-
-        if not contact:
-            return None
-
-        return {
-            "contact": {
-                "company_id": contact[0],
-                'addresses_count': contact[1],
-                "emails_count": contact[2],
-                "personal_emails_count": contact[3],
-                "phones_count": contact[4],
-                "company_name": contact[5]
-            }
-        }
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = dict_row
+
+            # Query for Contact details
+            cursor.execute("""
+                SELECT ct.company_id, ct.addresses_count, ct.emails_count, ct.personal_emails_count, ct.phones_count,
+                       cp.name AS company_name
+                FROM Contacts AS ct
+                LEFT JOIN Company AS cp ON ct.company_id = cp.id
+                WHERE ct.company_id = ?
+            """, (company_id,))
+            contact = cursor.fetchone()
+
+            if not contact:
+                return None
+
+            return {"contact": contact}
     except sqlite3.Error as e:
         print("Error accessing database:", e)
         return None
-    finally:
-        cursor.close()
-        conn.close()
 
 def get_investment(company_id: int):
     try:
-        conn = sqlite3.connect(database_path)
-        cursor = conn.cursor()
-
-        # Query for Investment details
-        cursor.execute("""
-            SELECT i.company_id, i.investors_count, cp.name
-            FROM Investments AS i
-            LEFT JOIN Company AS cp ON i.company_id = cp.id
-            WHERE i.company_id = ?
-        """, (company_id,))
-        investment = cursor.fetchone()
-
-        if not investment:
-            return None
-
-        return {
-            "investment": {
-                "company_id": investment[0],
-                'investors_count': investment[1],
-                "company_name": investment[2]
-            }
-        }
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = dict_row
+
+            # Query for Investment details
+            cursor.execute("""
+                SELECT i.company_id, i.investors_count, cp.name AS company_name
+                FROM Investments AS i
+                LEFT JOIN Company AS cp ON i.company_id = cp.id
+                WHERE i.company_id = ?
+            """, (company_id,))
+            investment = cursor.fetchone()
+
+            if not investment:
+                return None
+
+            return {"investment": investment}
     except sqlite3.Error as e:
         print("Error accessing database:", e)
         return None
-    finally:
-        cursor.close()
-        conn.close()
 
-def get_top_investment(top: int):
+def get_top_investment(top: int, offset: int = 0):
     try:
-        conn = sqlite3.connect(database_path)
-        cursor = conn.cursor()
-
-        # Query for top investments
-        query = f"""
-            SELECT i.company_id, i.investors_count, cp.name
-            FROM Investments AS i
-            LEFT JOIN Company AS cp ON i.company_id = cp.id
-            ORDER BY i.investors_count DESC
-            LIMIT ?
-        """
-        cursor.execute(query, (top,))
-        top_investment = cursor.fetchall()
-
-        # Convert rows to a list of dictionaries
-        result_top_investment = []
-        for row in top_investment:
-            company_data = {
-                "company_id": row[0],
-                "investors_count": row[1],
-                "name": row[2]
-            }
-            result_top_investment.append(company_data)
+        with pool.connection() as conn:
+            # Query for top investments from the precomputed ranking
+            result = leaderboard.top(conn, "investors_count", top, offset, dict_row)
 
-        if not result_top_investment:
-            return None
+            if not result:
+                return None
 
-        return result_top_investment
+            return result
 
     except sqlite3.Error as e:
         print("Error accessing database:", e)
         return None
-    finally:
-        cursor.close()
-        conn.close()
 
-def get_top_client(top: int):
+def get_top_client(top: int, offset: int = 0):
     try:
-        conn = sqlite3.connect(database_path)
-        cursor = conn.cursor()
-        query = f"""
-            SELECT c.company_id, c.clients_count, cp.name
-            FROM Clients AS c
-            LEFT JOIN Company AS cp ON c.company_id = cp.id
-            ORDER BY c.clients_count DESC
-            LIMIT ?
-        """
-        cursor.execute(query, (top,))
-        top_client = cursor.fetchall()
-        
-        result_top_client = []
-        for row in top_client:
-            company_data = {
-                "company_id": row[0],
-                "clients_count": row[1],
-                "name": row[2]
-            }
-            result_top_client.append(company_data)
-        return result_top_client
+        with pool.connection() as conn:
+            # Query for top clients from the precomputed ranking
+            result = leaderboard.top(conn, "clients_count", top, offset, dict_row)
+
+            return result
 
     except sqlite3.Error as e:
         print("Error accessing database:", e)
         return None
-    finally:
-        cursor.close()
-        conn.close()
 
 def get_client(company_id: int):
     try:
-        conn = sqlite3.connect(database_path)
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            SELECT c.company_id, c.clients_count, cp.name
-            FROM Clients AS c
-            LEFT JOIN Company AS cp ON c.company_id = cp.id
-            WHERE c.company_id = ?
-        """, (company_id,))
-        client = cursor.fetchone()
-        if not client:
-            return None
-        return {
-            "client": {
-                "company_id": client[0],
-                "clients_count": client[1],
-                "company_name": client[2]
-            }
-        }
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = dict_row
+
+            # Query for Client details
+            cursor.execute("""
+                SELECT c.company_id, c.clients_count, cp.name AS company_name
+                FROM Clients AS c
+                LEFT JOIN Company AS cp ON c.company_id = cp.id
+                WHERE c.company_id = ?
+            """, (company_id,))
+            client = cursor.fetchone()
+
+            if not client:
+                return None
+
+            return {"client": client}
     except sqlite3.Error as e:
         print("Error accessing database:", e)
         return None
-    finally:
-        cursor.close()
-        conn.close()
 
 def get_partner(company_id: int):
     try:
-        conn = sqlite3.connect(database_path)
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            SELECT pn.company_id, pn.partners_count, cp.name
-            FROM Partners AS pn
-            LEFT JOIN Company AS cp ON pn.company_id = cp.id
-            WHERE pn.company_id = ?
-        """, (company_id,))
-        partner = cursor.fetchone()
-        if not partner:
-            return None
-        return {
-            "partner": {
-                "company_id": partner[0],
-                "partners_count": partner[1],
-                "company_name": partner[2]
-            }
-        }
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = dict_row
+
+            # Query for Partner details
+            cursor.execute("""
+                SELECT pn.company_id, pn.partners_count, cp.name AS company_name
+                FROM Partners AS pn
+                LEFT JOIN Company AS cp ON pn.company_id = cp.id
+                WHERE pn.company_id = ?
+            """, (company_id,))
+            partner = cursor.fetchone()
+
+            if not partner:
+                return None
+
+            return {"partner": partner}
     except sqlite3.Error as e:
         print("Error accessing database:", e)
         return None
-    finally:
-        cursor.close()
-        conn.close()
 
-def get_top_partner(top: int):
+def get_top_partner(top: int, offset: int = 0):
     try:
-        conn = sqlite3.connect(database_path)
-        cursor = conn.cursor()
-        query = f"""
-            SELECT p.company_id, p.partners_count, cp.name
-            FROM Partners AS p
-            LEFT JOIN Company AS cp ON p.company_id = cp.id
-            ORDER BY p.partners_count DESC
-            LIMIT ?
-        """
-        cursor.execute(query, (top,))
-        top_partner = cursor.fetchall()
-        
-        result_top_partner = []
-        for row in top_partner:
-            company_data = {
-                "company_id": row[0],
-                "partners_count": row[1],
-                "name": row[2]
-            }
-            result_top_partner.append(company_data)
-        return result_top_partner
+        with pool.connection() as conn:
+            # Query for top partners from the precomputed ranking
+            result = leaderboard.top(conn, "partners_count", top, offset, dict_row)
+
+            return result
 
     except sqlite3.Error as e:
         print("Error accessing database:", e)
         return None
-    finally:
-        cursor.close()
-        conn.close()
 
 def get_change(company_id: int):
     try:
-        conn = sqlite3.connect(database_path)
-        cursor = conn.cursor()
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = dict_row
 
-        cursor.execute("""
-            SELECT ch.company_id, ch.changes_count, ch.people_changes_count, ch.contact_changes_count, cp.name
-            FROM Changes AS ch
-            LEFT JOIN Company AS cp ON ch.company_id = cp.id
-            WHERE ch.company_id = ?
-        """, (company_id,))
-        change = cursor.fetchone()
-        if not change:
-            return None
-        return {
-            "change": {
-                "company_id": change[0],
-                "changes_count": change[1],
-                "people_changes_count": change[2],
-                "contact_changes_count": change[3],
-                "name": change[4]
-            }
-        }
+            # Query for Change details
+            cursor.execute("""
+                SELECT ch.company_id, ch.changes_count, ch.people_changes_count, ch.contact_changes_count, cp.name
+                FROM Changes AS ch
+                LEFT JOIN Company AS cp ON ch.company_id = cp.id
+                WHERE ch.company_id = ?
+            """, (company_id,))
+            change = cursor.fetchone()
+
+            if not change:
+                return None
+
+            return {"change": change}
     except sqlite3.Error as e:
         print("Error accessing database:", e)
         return None
-    finally:
-        cursor.close()
-        conn.close()
 
-def get_top_change(top: int, mode: int):
+# Ranking used by each /top_change mode
+TOP_CHANGE_MODES = {
+    1: "changes_count",
+    2: "people_changes_count",
+    3: "contact_changes_count"
+}
+
+def get_top_change(top: int, mode: int, offset: int = 0):
     try:
-        conn = sqlite3.connect(database_path)
-        cursor = conn.cursor()
-        if mode == 1:
-            query = f"""
-                SELECT ch.company_id, ch.changes_count, ch.people_changes_count, ch.contact_changes_count, cp.name
-                FROM Changes AS ch
-                LEFT JOIN Company AS cp ON ch.company_id = cp.id
-                ORDER BY ch.changes_count DESC
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = dict_row
+
+            # Walk the precomputed ranking and pick up the other change counts by company_id
+            cursor.execute("""
+                SELECT lb.company_id, ch.changes_count, ch.people_changes_count, ch.contact_changes_count, lb.name
+                FROM Leaderboard AS lb
+                JOIN Changes AS ch ON lb.company_id = ch.company_id
+                WHERE lb.metric = ? AND lb.rank > ?
+                ORDER BY lb.rank
                 LIMIT ?
-            """
-        elif mode == 2:
-            query = f"""
-                SELECT ch.company_id, ch.changes_count, ch.people_changes_count, ch.contact_changes_count, cp.name
-                FROM Changes AS ch
-                LEFT JOIN Company AS cp ON ch.company_id = cp.id
-                ORDER BY ch.people_changes_count DESC
-                LIMIT ?
-            """
-        elif mode == 3:
-            query = f"""
-                SELECT ch.company_id, ch.changes_count, ch.people_changes_count, ch.contact_changes_count, cp.name
-                FROM Changes AS ch
-                LEFT JOIN Company AS cp ON ch.company_id = cp.id
-                ORDER BY ch.contact_changes_count DESC
-                LIMIT ?
-            """
-
-        cursor.execute(query, (top,))
-        top_change = cursor.fetchall()
-        
-        result_top_change = []
-        for row in top_change:
-            company_data = {
-                "company_id": row[0],
-                "changes_count": row[1],
-                "people_changes_count": row[2],
-                "contact_changes_count": row[3],
-                "name": row[4]
-            }
-            result_top_change.append(company_data)
-        return result_top_change
+            """, (TOP_CHANGE_MODES[mode], offset, top))
+            return cursor.fetchall()
 
     except sqlite3.Error as e:
         print("Error accessing database:", e)
         return None
-    finally:
-        cursor.close()
-        conn.close()
+
+def get_rank(metric: str, company_id: int):
+    try:
+        with pool.connection() as conn:
+            return leaderboard.rank_of(conn, metric, company_id)
+    except sqlite3.Error as e:
+        print("Error accessing database:", e)
+        return None
 
 def get_all_detail():
     try:
-        conn = sqlite3.connect(database_path)
-        cursor = conn.cursor()
-        query = """
-            SELECT c.id, c.url, c.name, c.website, c.description_short, p.people_count, p.senior_people_count, 
-                   ct.emails_count, ct.personal_emails_count, ct.phones_count, ct.addresses_count, 
-                   i.investors_count, cl.clients_count, pn.partners_count, ch.changes_count, 
-                   ch.people_changes_count, ch.contact_changes_count
-            FROM Company AS c
-            LEFT JOIN People AS p ON c.id = p.company_id
-            LEFT JOIN Contacts AS ct ON c.id = ct.company_id
-            LEFT JOIN Investments AS i ON c.id = i.company_id
-            LEFT JOIN Clients AS cl ON c.id = cl.company_id
-            LEFT JOIN Partners AS pn ON c.id = pn.company_id
-            LEFT JOIN Changes AS ch ON c.id = ch.company_id
-            LIMIT 5
-        """
-        cursor.execute(query)
-        get_all_detail = cursor.fetchall()
-
-        result_all_detail = []
-        for row in get_all_detail:
-            all_detail = {
-                "company_id": row[0],
-                "url": row[1],
-                "name": row[2],
-                "website": row[3],
-                "description_short": row[4],
-                "people_count": row[5],
-                "senior_people_count": row[6],
-                "emails_count": row[7],
-                "personal_emails_count": row[8],
-                "phones_count": row[9],
-                "addresses_count": row[10],
-                "investors_count": row[11],
-                "clients_count": row[12],
-                "partners_count": row[13],
-                "changes_count": row[14],
-                "people_changes_count": row[15],
-                "contact_changes_count": row[16]
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = dict_row
+            if config.use_company_profile:
+                query = """
+                    SELECT id AS company_id, url, name, website, description_short, people_count, senior_people_count,
+                           emails_count, personal_emails_count, phones_count, addresses_count,
+                           investors_count, clients_count, partners_count, changes_count,
+                           people_changes_count, contact_changes_count
+                    FROM company_profile AS c
+                    LIMIT 5
+                """
+            else:
+                query = """
+                    SELECT c.id AS company_id, c.url, c.name, c.website, c.description_short, p.people_count, p.senior_people_count, 
+                           ct.emails_count, ct.personal_emails_count, ct.phones_count, ct.addresses_count, 
+                           i.investors_count, cl.clients_count, pn.partners_count, ch.changes_count, 
+                           ch.people_changes_count, ch.contact_changes_count
+                    FROM Company AS c
+                    LEFT JOIN People AS p ON c.id = p.company_id
+                    LEFT JOIN Contacts AS ct ON c.id = ct.company_id
+                    LEFT JOIN Investments AS i ON c.id = i.company_id
+                    LEFT JOIN Clients AS cl ON c.id = cl.company_id
+                    LEFT JOIN Partners AS pn ON c.id = pn.company_id
+                    LEFT JOIN Changes AS ch ON c.id = ch.company_id
+                    LIMIT 5
+                """
+            cursor.execute(query)
+            return cursor.fetchall()
+    except sqlite3.Error as e:
+        print("Error accessing database:", e)
+        return None
+
+def get_search(q: str, limit: int, offset: int, prefix: bool):
+    try:
+        with pool.connection() as conn:
+            return {
+                "query": q,
+                "limit": limit,
+                "offset": offset,
+                "results": search.search(conn, q, limit, offset, prefix, dict_row)
             }
-            result_all_detail.append(all_detail)
-        return result_all_detail
     except sqlite3.Error as e:
         print("Error accessing database:", e)
         return None
-    finally:
-        cursor.close()
-        conn.close()
+
+def get_suggestions(q: str, limit: int):
+    try:
+        with pool.connection() as conn:
+            return search.suggest(conn, q, limit, dict_row)
+    except sqlite3.Error as e:
+        print("Error accessing database:", e)
+        return None
+
+def query_companies(filters, sort, limit: int, cursor: Optional[str]):
+    # Invalid cursors and query shapes that would read the whole table raise ValueError
+    try:
+        with pool.connection() as conn:
+            rows, next_cursor = company_query.run(conn, filters, sort, limit, cursor, config.query_scan_max_rows,
+                                                  dict_row)
+            return {"results": rows, "next_cursor": next_cursor}
+    except sqlite3.Error as e:
+        print("Error accessing database:", e)
+        return None
+
+def get_similar(company_id: int, k: int, metric_weight: float):
+    index = similar_store.index
+    if index is None:
+        detail = "Similarity index is still loading" if config.similar_enabled else "Similarity index is disabled"
+        raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": "1"})
+    row = index.row_of(company_id)
+    if row is None:
+        return None
+    neighbours = index.similar_rows([row], k, metric_weight)[0]
+    try:
+        with pool.connection() as conn:
+            names = dict(conn.execute(
+                "SELECT id, name FROM Company WHERE id IN (SELECT value FROM json_each(?))",
+                (json.dumps([neighbour[0] for neighbour in neighbours]),)
+            ).fetchall())
+    except sqlite3.Error as e:
+        print("Error accessing database:", e)
+        return None
+    return {
+        "company_id": company_id,
+        "version": index.version,
+        "results": [
+            {"company_id": neighbour_id, "name": names.get(neighbour_id), "score": score,
+             "metric_score": metric_score, "text_score": text_score}
+            for neighbour_id, score, metric_score, text_score in neighbours
+        ]
+    }
+
+def metric_columns():
+    columns = metric_store.columns
+    if columns is None:
+        detail = "Analytics are still loading" if config.analytics_enabled else "Analytics are disabled"
+        raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": "1"})
+    return columns
+
+def get_stats(filters):
+    columns = metric_columns()
+    mask = columns.mask(filters) if filters else None
+    return {
+        "version": columns.version,
+        "rows": int(mask.sum()) if mask is not None else columns.rows,
+        "metrics": {metric: columns.aggregate(metric, mask) for metric in analytics.METRICS}
+    }
+
+def get_stats_count(filters):
+    columns = metric_columns()
+    return {"version": columns.version, "count": int(columns.mask(filters).sum()), "total": columns.rows}
+
+def get_metric_stats(metric: str, filters, percentiles):
+    columns = metric_columns()
+    mask = columns.mask(filters) if filters else None
+    return {
+        "version": columns.version,
+        "metric": metric,
+        "rows": int(mask.sum()) if mask is not None else columns.rows,
+        **columns.aggregate(metric, mask, percentiles)
+    }
+
+def get_metric_histogram(metric: str, filters, bins: int, lower: Optional[float], upper: Optional[float], log: bool):
+    columns = metric_columns()
+    mask = columns.mask(filters) if filters else None
+    return {"version": columns.version, "metric": metric, **columns.histogram(metric, mask, bins, lower, upper, log)}
+
+def not_modified_response(request: Request, generation: int):
+    # 304 for a conditional request that the current dataset version satisfies, else None
+    if not generation:
+        return None
+    tag = http_cache.not_modified(request.headers, generation, response_cache.last_modified)
+    if tag is None:
+        return None
+    headers = http_cache.validator_headers(generation, response_cache.last_modified)
+    if tag != "date":
+        headers["ETag"] = tag
+    return Response(status_code=304, headers=headers)
+
+def json_response(request: Request, body: bytes, generation: int, route: str = None, key=None, headers=None):
+    # Sends body compressed when it is large enough and the client accepts a coding. With a route,
+    # the compressed variant is kept next to the cached body so it is compressed once per version.
+    encoding = None
+    if len(body) >= config.compress_min_bytes:
+        encoding = http_cache.negotiate(request.headers.get("accept-encoding"))
+    if encoding:
+        compressed = response_cache.get_variant(route, key, encoding) if route else None
+        if compressed is None:
+            compressed = http_cache.compress(body, encoding, cached=route is not None)
+            if route:
+                response_cache.put_variant(route, key, encoding, compressed, generation)
+        body = compressed
+    headers = {**(headers or {}), **http_cache.validator_headers(generation, response_cache.last_modified, encoding)}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+async def cached_response(request: Request, route: str, key, func, *args, not_found: str = "name not found",
+                          versioned: bool = True):
+    # Results that do not follow the dataset version are fetched every time and sent without validators
+    if not versioned:
+        result = await db.run(func, *args)
+        if result is None:
+            raise HTTPException(status_code=404, detail=not_found)
+        return json_response(request, encode_json(result), 0)
+    generation = response_cache.generation
+    response = not_modified_response(request, generation)
+    if response is not None:
+        return response
+    body = response_cache.get(route, key)
+    if body is None:
+        result = await db.run(func, *args)
+        if result is None:
+            raise HTTPException(status_code=404, detail=not_found)
+        body = encode_json(result)
+        response_cache.put(route, key, body, generation)
+    return json_response(request, body, generation, route, key)
+
+async def company_response(request: Request, route: str, company_id: int, func, view,
+                           not_found: str = "name not found", indexed: bool = True):
+    # With a snapshot mapped, a single-company response is built straight from it: no executor,
+    # connection or response cache involved. Otherwise the routes the company index covers are
+    # answered from it, and ids it does not hold fall through to SQLite.
+    generation = response_cache.generation
+    current = snapshot_store.current
+    if current is not None:
+        row = current.get(company_id)
+    else:
+        # An index left behind by a failed reload is skipped like a missing one
+        index = company_index_store.index if indexed else None
+        row = index.get(company_id) if index is not None and index.version == generation else None
+        if row is None:
+            return await cached_response(request, route, company_id, func, company_id, not_found=not_found,
+                                         versioned=storage.versioned)
+    result = view(row) if row is not None else None
+    if result is None:
+        raise HTTPException(status_code=404, detail=not_found)
+    return not_modified_response(request, generation) or json_response(request, encode_json(result), generation)
+
+@app.get("/health")
+async def read_health():
+    try:
+        database = await db.run(pool.health)
+    except sqlite3.Error as e:
+        raise HTTPException(status_code=503, detail=f"Database unavailable: {e}")
+    return ORJSONResponse({**database, "executor": db.health(), "auth": hasher.health(),
+                           "analytics": metric_store.snapshot(), "similar": similar_store.snapshot(),
+                           "snapshot": snapshot_store.snapshot(),
+                           "company_index": company_index_store.snapshot(),
+                           "streams": streams.snapshot(), "storage": storage.health()})
+
+@app.get("/cache/stats")
+async def read_cache_stats():
+    return ORJSONResponse(response_cache.snapshot())
+
+# Pool, executor, hasher and cache counters are read when /metrics is scraped
+metrics.REGISTRY.collector(metrics.stats_collector(
+    "db_pool", "SQLite connection pool", pool.snapshot, counters={"created", "checkouts", "discarded", "timeouts"}))
+metrics.REGISTRY.collector(metrics.stats_collector(
+    "db_streams", "Streaming read connections", streams.snapshot, counters={"opened", "rejected"}))
+metrics.REGISTRY.collector(metrics.stats_collector(
+    "db_executor", "Database executor", db.health, counters={"completed", "rejected", "timeouts"}))
+metrics.REGISTRY.collector(metrics.stats_collector(
+    "auth_hasher", "Password hashing pool", hasher.health,
+    counters={"completed", "rejected", "timeouts", "rehashed"}))
+metrics.REGISTRY.collector(metrics.stats_collector(
+    "response_cache", "Response cache", response_cache.snapshot,
+    counters={"hits", "misses", "evictions", "invalidations", "compressions"}))
+
+@metrics.REGISTRY.collector
+def collect_cache_routes():
+    routes = response_cache.snapshot()["routes"]
+    return [
+        (f"response_cache_route_{outcome}_total", "counter", f"Response cache {outcome} per route",
+         [({"route": route}, counters[outcome]) for route, counters in routes.items()])
+        for outcome in ("hits", "misses")
+    ]
+
+@app.get("/metrics", include_in_schema=False)
+async def read_metrics():
+    if not config.metrics_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+bearer = HTTPBearer(auto_error=False)
+
+async def current_session(request: Request, credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer)):
+    # Signature, expiry and revocation are all checked in memory, so this costs microseconds
+    if credentials is None:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    try:
+        claims = tokens.verify(request.app.state.auth_secret, credentials.credentials)
+    except tokens.InvalidToken as e:
+        raise HTTPException(status_code=401, detail=str(e), headers={"WWW-Authenticate": "Bearer"})
+    if session_store.is_revoked(claims["sid"]):
+        raise HTTPException(status_code=401, detail="Session revoked", headers={"WWW-Authenticate": "Bearer"})
+    return claims
+
+async def require_reader(request: Request, credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer)):
+    # The company routes only need a token when AUTH_REQUIRED is set
+    if config.auth_required:
+        return await current_session(request, credentials)
+    return None
+
+read_auth = [Depends(require_reader)]
+
+def check_rate_limit(limiter: RateLimiter, key):
+    retry_after = limiter.acquire(key)
+    if retry_after:
+        raise HTTPException(status_code=429, detail="Too many attempts, try again later",
+                            headers={"Retry-After": str(math.ceil(retry_after))})
+
+def client_address(request: Request):
+    return request.client.host if request.client else "unknown"
 
 @app.post("/register")
-def register(user: UserCreate):
-    success = register_user(user)
+async def register(user: UserCreate, request: Request):
+    check_rate_limit(auth_ip_limiter, client_address(request))
+    password_hash = await hasher.hash(user.password)
+    success = await db.run(register_user, user.username, password_hash)
     if not success:
         raise HTTPException(status_code=400, detail="Registration failed or username already exists")
     return {"message": "User registered successfully"}
 
-@app.post("/login")
-def login(user: UserCreate):
-    success = login_user(user)
-    if not success:
+@app.post("/login", response_model=schemas.LoginResponse)
+async def login(user: UserCreate, request: Request):
+    check_rate_limit(auth_ip_limiter, client_address(request))
+    check_rate_limit(login_user_limiter, user.username)
+    password_hash = await db.run(get_password_hash, user.username)
+    if password_hash is None:
         raise HTTPException(status_code=400, detail="Invalid username or password")
-    return {"message": "Login successful"}
-
-# Route to show data
-@app.get("/companies")
-def read_companies():
-    companies = get_companies_all()
-    if companies is None:
-        raise HTTPException(status_code=500, detail="Error fetching companies from the database")
-
-    result = []
-    for company in companies:
-        result.append({
-            "id": company[0],  # เข้าถึงข้อมูลผ่าน index ของ tuple
-            "url": company[1],
-            "name": company[2],
-            "website": company[3],
-            "description_short": company[4]
-        })
-    return result
-
-# Route to show company details
-@app.get("/companies/{company_id}")
-def read_company_details(company_id: int):
-    company_details = get_company_details(company_id)
-    if company_details is None:
-        raise HTTPException(status_code=404, detail="Company not found")
-    return company_details
-
-@app.get("/more_detail/{company_id}")
-def read_more_detail(company_id: int):
-    company_details = get_more_detail(company_id)
-    if company_details is None:
-        raise HTTPException(status_code=404, detail="Company not found")
-    return company_details
-
-@app.get("/people/{company_id}")
-def read_people(company_id: int):
-    company_details = get_people(company_id)
-    if company_details is None:
-        raise HTTPException(status_code=404, detail="name not found")
-    return company_details
-
-@app.get("/contact/{company_id}")
-def read_contact(company_id: int):
-    company_details = get_contact(company_id)
-    if company_details is None:
-        raise HTTPException(status_code=404, detail="name not found")
-    return company_details
-
-@app.get("/investment/{company_id}")
-def read_investment(company_id: int):
-    company_details = get_investment(company_id)
-    if company_details is None:
-        raise HTTPException(status_code=404, detail="name not found")
-    return company_details
-
-@app.get("/top_investment/{top}")
-def read_top_investment(top: int):
-    company_details = get_top_investment(top)
-    if company_details is None:
-        raise HTTPException(status_code=404, detail="name not found")
-    return company_details
-
-@app.get("/top_client/{top}")
-def read_top_client(top: int):
-    company_details = get_top_client(top)
-    if company_details is None:
-        raise HTTPException(status_code=404, detail="name not found")
-    return company_details
+    valid, new_hash = await hasher.verify(user.password, password_hash)
+    if not valid:
+        raise HTTPException(status_code=400, detail="Invalid username or password")
+    # Hashes made with an older cost factor are upgraded transparently
+    if new_hash is not None:
+        await db.run(update_password_hash, user.username, password_hash, new_hash)
+
+    session = await db.run(create_session, user.username)
+    if session is None:
+        raise HTTPException(status_code=500, detail="Could not create a session")
+    session_id, issued_at, expires_at = session
+    token = tokens.issue(request.app.state.auth_secret,
+                         {"sub": user.username, "sid": session_id, "iat": issued_at, "exp": expires_at})
+    return {
+        "message": "Login successful",
+        "access_token": token,
+        "token_type": "bearer",
+        "expires_in": expires_at - issued_at
+    }
+
+# Revoke the session of the presented token, or every session of the user with all=true
+@app.post("/logout")
+async def logout(all: bool = False, claims: dict = Depends(current_session)):
+    revoked = await db.run(revoke_sessions, claims["sid"], claims["sub"] if all else None)
+    if revoked is None:
+        raise HTTPException(status_code=500, detail="Could not revoke the session")
+    return {"message": "Logged out", "revoked": revoked}
+
+@app.get("/me", response_model=schemas.Me)
+async def read_me(claims: dict = Depends(current_session)):
+    return {"username": claims["sub"], "expires_at": claims["exp"]}
+
+@app.get("/debug/slow_queries", dependencies=read_auth)
+async def read_slow_queries(
+    order: str = Query("total_ms", pattern="^(total_ms|max_ms|mean_ms|count)$"),
+    limit: int = Query(20, ge=1, le=200)
+):
+    return ORJSONResponse(slow_queries.slow_query_log.worst(order, limit))
+
+@app.delete("/debug/slow_queries", dependencies=read_auth)
+async def reset_slow_queries():
+    slow_queries.slow_query_log.reset()
+    return {"message": "Slow query log cleared"}
+
+async def fetch_batches(batches):
+    # Each fetchmany runs on the database executor. If the client goes away or a fetch times out,
+    # the generator may still be running on a worker, so closing it is queued behind the lock the
+    # fetches hold instead of being done here, where it would raise "generator already executing".
+    lock = threading.Lock()
+
+    def fetch():
+        with lock:
+            return next(batches, None)
+
+    def close():
+        with lock:
+            batches.close()
+
+    finished = False
+    try:
+        while True:
+            batch = await db.run(fetch)
+            if batch is None:
+                finished = True
+                break
+            yield batch
+    finally:
+        if not finished:
+            db.submit(close)
+
+async def stream_json_array(batches):
+    yield b"["
+    first = True
+    async for batch in fetch_batches(batches):
+        for company in batch:
+            yield (b"" if first else b",") + encode_json(company)
+            first = False
+    yield b"]"
+
+async def stream_ndjson(batches):
+    async for batch in fetch_batches(batches):
+        yield b"".join(encode_json(company) + b"\n" for company in batch)
+
+def get_companies_page(after_id: Optional[int], limit: int):
+    # One bounded page, read in full on a pooled connection
+    try:
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = dict_row
+            return cursor.execute(COMPANIES_PAGE_SQL,
+                                  (MIN_COMPANY_ID if after_id is None else after_id, limit)).fetchall()
+    except sqlite3.Error as e:
+        print("Error accessing database:", e)
+        return None
 
-@app.get("/client/{company_id}")
-def read_client(company_id: int):
-    company_details = get_client(company_id)
-    if company_details is None:
-        raise HTTPException(status_code=404, detail="name not found")
-    return company_details
+# The company read routes go through storage, which is these functions unless STORAGE_BACKEND
+# names another backend. The snapshot and company index hold SQLite rows, so they are only loaded
+# for the sqlite backend, and responses from a backend that is not versioned by the SQLite dataset
+# version skip the response cache and carry no ETag or Last-Modified.
+storage = repository.create(config.storage_backend, {name: globals()[name] for name in repository.FUNCTIONS})
 
-@app.get("/partner/{company_id}")
-def read_partner(company_id: int):
-    company_details = get_partner(company_id)
-    if company_details is None:
-        raise HTTPException(status_code=404, detail="name not found")
-    return company_details
+# Route to show data
+# Without a limit the whole table is streamed; with a limit one keyset page is returned and the
+# id to continue from is sent in the X-Next-After-Id header.
+@app.get("/companies", response_model=List[schemas.Company], dependencies=read_auth)
+async def read_companies(
+    request: Request,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=config.companies_max_limit),
+    output: str = Query("json", alias="format", pattern="^(json|ndjson)$")
+):
+    # Pages and the streamed table are the same bytes until the next import, so a conditional
+    # request for the current dataset version is answered before any query runs
+    generation = response_cache.generation if storage.versioned else 0
+    response = not_modified_response(request, generation)
+    if response is not None:
+        return response
+
+    if output == "json" and limit is not None:
+        result = await db.run(storage.get_companies_page, after_id, limit)
+        if result is None:
+            raise HTTPException(status_code=500, detail="Error fetching companies from the database")
+        if len(result) == limit:
+            headers = {"X-Next-After-Id": str(result[-1]["id"])}
+        else:
+            headers = None
+        return json_response(request, encode_json(result), generation, headers=headers)
 
-@app.get("/top_partner/{toprank}")
-def read_top_partner(toprank: int):
-    company_details = get_top_partner(toprank)
-    if company_details is None:
-        raise HTTPException(status_code=404, detail="name not found")
-    return company_details
+    batches = await db.run(storage.iter_companies, after_id, limit)
+    if batches is None:
+        raise HTTPException(status_code=500, detail="Error fetching companies from the database")
 
-@app.get("/change/{company_id}")
-def read_change(company_id: int):
-    company_details = get_change(company_id)
+    body = stream_ndjson(batches) if output == "ndjson" else stream_json_array(batches)
+    encoding = http_cache.negotiate(request.headers.get("accept-encoding"))
+    headers = http_cache.validator_headers(generation, response_cache.last_modified, encoding)
+    if encoding:
+        body = http_cache.compress_stream(body, encoding)
+        headers["Content-Encoding"] = encoding
+    media_type = "application/x-ndjson" if output == "ndjson" else "application/json"
+    return StreamingResponse(body, media_type=media_type, headers=headers)
+
+async def stream_export(encoder, batches):
+    yield encoder.header()
+    async for batch in fetch_batches(batches):
+        yield encoder.encode(batch)
+    yield encoder.finish()
+
+# Route to export the joined dataset, e.g. /export?format=csv&filter=investors_count:gt:0
+# Rows stream in company_id order. To resume, pass the last company_id received as after_id and
+# the X-Dataset-Version header as version; a version that is no longer current gets a 409.
+@app.get("/export", dependencies=read_auth)
+async def export_companies(
+    request: Request,
+    output: str = Query("csv", alias="format", pattern="^(csv|ndjson|parquet)$"),
+    min_id: Optional[int] = None,
+    max_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    filters: List[str] = Query([], alias="filter"),
+    version: Optional[int] = None
+):
+    try:
+        parsed = analytics.parse_filters(filters)
+        encoder = export.ENCODERS[output]()
+    except export.ExportUnavailable as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if min_id is not None:
+        after_id = min_id - 1 if after_id is None else max(after_id, min_id - 1)
+
+    opened = await db.run(open_export, parsed, after_id, max_id, limit, version)
+    if opened is None:
+        raise HTTPException(status_code=500, detail="Error exporting companies from the database")
+    current, batches = opened
+    if batches is None:
+        raise HTTPException(status_code=409, detail=f"Dataset version is now {current}; restart the export")
+
+    headers = {
+        "X-Dataset-Version": str(current),
+        "Content-Disposition": f'attachment; filename="companies-v{current}.{encoder.extension}"',
+    }
+    body = stream_export(encoder, batches)
+    encoding = http_cache.negotiate(request.headers.get("accept-encoding")) if encoder.compressible else None
+    if encoding:
+        body = http_cache.compress_stream(body, encoding)
+        headers["Content-Encoding"] = encoding
+        headers["Vary"] = "Accept-Encoding"
+    return StreamingResponse(body, media_type=encoder.media_type, headers=headers)
+
+# Route to filter, sort and page companies on their metrics, e.g.
+# /companies/query?filter=investors_count:gt:5&filter=people_count:lt:50&sort=-investors_count,people_count
+# Pass the returned next_cursor as cursor to get the following page.
+@app.get("/companies/query", response_model=schemas.CompanyQueryResult, dependencies=read_auth)
+async def read_company_query(
+    request: Request,
+    filters: List[str] = Query([], alias="filter"),
+    sort: str = "id",
+    limit: int = Query(50, ge=1, le=config.query_max_limit),
+    cursor: Optional[str] = None
+):
+    try:
+        filters = tuple(analytics.parse_filters(filters))
+        sort = company_query.parse_sort(sort)
+        return await cached_response(request, "query", (filters, sort, limit, cursor), query_companies, filters, sort, limit,
+                                     cursor, not_found="Query failed")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Route to show many company details in one request
+@app.post("/companies/batch", response_model=schemas.CompanyBatchResult, dependencies=read_auth)
+async def read_company_details_batch(batch: CompanyBatch):
+    company_ids = list(dict.fromkeys(batch.ids))
+    if len(company_ids) > config.batch_max_ids:
+        raise HTTPException(status_code=400, detail=f"At most {config.batch_max_ids} ids per batch")
+
+    current = snapshot_store.current
+    if current is not None:
+        rows = {company_id: current.get(company_id) for company_id in company_ids}
+        company_details = {company_id: company_profile.details_view(row) for company_id, row in rows.items() if row}
+    else:
+        company_details = await db.run(storage.get_company_details_batch, company_ids)
     if company_details is None:
-        raise HTTPException(status_code=404, detail="name not found")
-    return company_details
+        raise HTTPException(status_code=500, detail="Error fetching companies from the database")
 
-@app.get("/top_change/{toprank}/{mode}")
-def read_top_change(toprank: int,mode: int):
-    company_details = get_top_change(toprank,mode)
-    if company_details is None:
-        raise HTTPException(status_code=404, detail="name not found")
-    return company_details
+    return ORJSONResponse({
+        "companies": [company_details[company_id] for company_id in company_ids if company_id in company_details],
+        "not_found": [company_id for company_id in company_ids if company_id not in company_details]
+    })
 
-@app.get("/all_detail")
-def read_all_detail():
-    company_details = get_all_detail()
-    if company_details is None:
-        raise HTTPException(status_code=404, detail="name not found")
-    return company_details
+# Route to show company details
+@app.get("/companies/{company_id}", response_model=schemas.CompanyDetails, dependencies=read_auth)
+async def read_company_details(request: Request, company_id: int):
+    return await company_response(request, "company", company_id, storage.get_company_details,
+                                  company_profile.details_view, not_found="Company not found", indexed=False)
+
+# Route to find companies with similar metrics and descriptions
+@app.get("/companies/{company_id}/similar", response_model=schemas.SimilarCompanies, dependencies=read_auth)
+async def read_similar(
+    request: Request,
+    company_id: int,
+    k: int = Query(10, ge=1, le=config.similar_max_k),
+    metric_weight: float = Query(config.similar_metric_weight, ge=0, le=1)
+):
+    return await cached_response(request, "similar", (company_id, k, metric_weight), get_similar, company_id, k, metric_weight,
+                                 not_found="Company not found")
+
+@app.get("/more_detail/{company_id}", response_model=schemas.MoreDetailResponse, dependencies=read_auth)
+async def read_more_detail(request: Request, company_id: int):
+    return await company_response(request, "more_detail", company_id, storage.get_more_detail,
+                                  company_profile.more_detail_view, not_found="Company not found")
+
+@app.get("/people/{company_id}", response_model=schemas.PeopleResponse, dependencies=read_auth)
+async def read_people(request: Request, company_id: int):
+    return await company_response(request, "people", company_id, storage.get_people, company_profile.people_view)
+
+@app.get("/contact/{company_id}", response_model=schemas.ContactResponse, dependencies=read_auth)
+async def read_contact(request: Request, company_id: int):
+    return await company_response(request, "contact", company_id, storage.get_contact, company_profile.contact_view)
+
+@app.get("/investment/{company_id}", response_model=schemas.InvestmentResponse, dependencies=read_auth)
+async def read_investment(request: Request, company_id: int):
+    return await company_response(request, "investment", company_id, storage.get_investment, company_profile.investment_view)
+
+@app.get("/top_investment/{top}", response_model=List[schemas.TopInvestment], dependencies=read_auth)
+async def read_top_investment(request: Request, top: int, offset: int = Query(0, ge=0)):
+    return await cached_response(request, "top_investment", (top, offset), storage.get_top_investment, top, offset,
+                                 versioned=storage.versioned)
+
+@app.get("/top_client/{top}", response_model=List[schemas.TopClient], dependencies=read_auth)
+async def read_top_client(request: Request, top: int, offset: int = Query(0, ge=0)):
+    return await cached_response(request, "top_client", (top, offset), storage.get_top_client, top, offset,
+                                 versioned=storage.versioned)
+
+@app.get("/client/{company_id}", response_model=schemas.ClientResponse, dependencies=read_auth)
+async def read_client(request: Request, company_id: int):
+    return await company_response(request, "client", company_id, storage.get_client, company_profile.client_view)
+
+@app.get("/partner/{company_id}", response_model=schemas.PartnerResponse, dependencies=read_auth)
+async def read_partner(request: Request, company_id: int):
+    return await company_response(request, "partner", company_id, storage.get_partner, company_profile.partner_view)
+
+@app.get("/top_partner/{toprank}", response_model=List[schemas.TopPartner], dependencies=read_auth)
+async def read_top_partner(request: Request, toprank: int, offset: int = Query(0, ge=0)):
+    return await cached_response(request, "top_partner", (toprank, offset), storage.get_top_partner, toprank, offset,
+                                 versioned=storage.versioned)
+
+@app.get("/change/{company_id}", response_model=schemas.ChangeResponse, dependencies=read_auth)
+async def read_change(request: Request, company_id: int):
+    return await company_response(request, "change", company_id, storage.get_change, company_profile.change_view)
+
+@app.get("/top_change/{toprank}/{mode}", response_model=List[schemas.TopChange], dependencies=read_auth)
+async def read_top_change(request: Request, toprank: int,mode: int, offset: int = Query(0, ge=0)):
+    if mode not in TOP_CHANGE_MODES:
+        raise HTTPException(status_code=400, detail="mode must be 1, 2 or 3")
+    return await cached_response(request, "top_change", (toprank, mode, offset), storage.get_top_change, toprank, mode, offset,
+                                 versioned=storage.versioned)
+
+# Route to search companies by name, website and description
+@app.get("/search", response_model=schemas.SearchResponse, dependencies=read_auth)
+async def read_search(
+    request: Request,
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=config.search_max_limit),
+    offset: int = Query(0, ge=0),
+    prefix: bool = False
+):
+    return await cached_response(request, "search", (q, limit, offset, prefix), get_search, q, limit, offset, prefix,
+                                 not_found="Search failed")
+
+# Route to autocomplete company names
+@app.get("/search/suggest", response_model=List[schemas.Suggestion], dependencies=read_auth)
+async def read_suggestions(request: Request, q: str = Query(..., min_length=1), limit: int = Query(10, ge=1, le=config.search_max_limit)):
+    return await cached_response(request, "suggest", (q, limit), get_suggestions, q, limit, not_found="Search failed")
+
+# Route to show where a company ranks for one metric
+@app.get("/rank/{metric}/{company_id}", response_model=schemas.Rank, dependencies=read_auth)
+async def read_rank(request: Request, metric: str, company_id: int):
+    if metric not in leaderboard.METRICS:
+        raise HTTPException(status_code=400, detail=f"metric must be one of {', '.join(leaderboard.METRICS)}")
+    return await cached_response(request, "rank", (metric, company_id), get_rank, metric, company_id)
+
+@app.get("/all_detail", response_model=List[schemas.AllDetail], dependencies=read_auth)
+async def read_all_detail(request: Request):
+    return await cached_response(request, "all_detail", None, storage.get_all_detail, versioned=storage.versioned)
+
+def parse_stats_filters(filters: List[str]):
+    try:
+        return tuple(analytics.parse_filters(filters))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def check_stats_metric(metric: str):
+    if metric not in analytics.METRICS:
+        raise HTTPException(status_code=400, detail=f"metric must be one of {', '.join(analytics.METRICS)}")
+
+# Aggregates over every metric column. Filters are metric:op:value, e.g.
+# /stats?filter=investors_count:gt:5&filter=people_count:lt:50
+@app.get("/stats", response_model=schemas.Stats, dependencies=read_auth)
+async def read_stats(request: Request, filters: List[str] = Query([], alias="filter")):
+    filters = parse_stats_filters(filters)
+    return await cached_response(request, "stats", filters, get_stats, filters)
+
+# Number of companies matching the filters
+@app.get("/stats/count", response_model=schemas.StatsCount, dependencies=read_auth)
+async def read_stats_count(request: Request, filters: List[str] = Query([], alias="filter")):
+    filters = parse_stats_filters(filters)
+    return await cached_response(request, "stats_count", filters, get_stats_count, filters)
+
+# Aggregates and percentiles of one metric
+@app.get("/stats/{metric}", response_model=schemas.MetricStats, dependencies=read_auth)
+async def read_metric_stats(
+    request: Request,
+    metric: str,
+    filters: List[str] = Query([], alias="filter"),
+    percentiles: str = Query("50,90,95,99", pattern=r"^\d+(\.\d+)?(,\d+(\.\d+)?)*$")
+):
+    check_stats_metric(metric)
+    filters = parse_stats_filters(filters)
+    points = tuple(float(p) for p in percentiles.split(","))
+    if any(p > 100 for p in points):
+        raise HTTPException(status_code=400, detail="percentiles must be between 0 and 100")
+    return await cached_response(request, "stats_metric", (metric, filters, points), get_metric_stats, metric, filters, points)
+
+# Histogram of one metric, with linear or log-spaced bins
+@app.get("/stats/{metric}/histogram", response_model=schemas.Histogram, dependencies=read_auth)
+async def read_metric_histogram(
+    request: Request,
+    metric: str,
+    filters: List[str] = Query([], alias="filter"),
+    bins: int = Query(20, ge=1, le=config.stats_max_bins),
+    lower: Optional[float] = None,
+    upper: Optional[float] = None,
+    log: bool = False
+):
+    check_stats_metric(metric)
+    filters = parse_stats_filters(filters)
+    if lower is not None and upper is not None and upper <= lower:
+        raise HTTPException(status_code=400, detail="upper must be greater than lower")
+    try:
+        # One bound may still leave an empty range against the selected values
+        return await cached_response(request, "stats_histogram", (metric, filters, bins, lower, upper, log),
+                                     get_metric_histogram, metric, filters, bins, lower, upper, log)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,341 @@
+import bisect
+import re
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+
+import slow_queries
+
+# Prometheus text exposition without the prometheus_client dependency. Each process keeps its own
+# registry, so with several uvicorn workers every worker is scraped (or summed) separately.
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, self.labels, key, value) for key, value in self._values.items()]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels):
+        # Per label set: [count per bucket (the last one is +Inf), sum]
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+
+    def samples(self):
+        names = self.labels + ("le",)
+        result = []
+        with self._lock:
+            for key, (counts, total) in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    result.append((self.name + "_bucket", names, key + (format_value(bound),), cumulative))
+                result.append((self.name + "_sum", self.labels, key, total))
+                result.append((self.name + "_count", self.labels, key, cumulative))
+        return result
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def collector(self, func):
+        # func() returns an iterable of (name, type, help, [(labels dict, value)]), read at scrape time
+        self.collectors.append(func)
+        return func
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, label_names, label_values, value in metric.samples():
+                lines.append(f"{name}{format_labels(label_names, label_values)} {format_value(value)}")
+        for func in self.collectors:
+            for name, type, help, samples in func():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {type}")
+                for labels, value in samples:
+                    lines.append(f"{name}{format_labels(tuple(labels), tuple(labels.values()))} {format_value(value)}")
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def stats_collector(prefix: str, help: str, func, counters=(), labels: dict = None):
+    # Turns a flat stats dict (pool.stats, executor.health(), ...) into one metric per numeric key.
+    # Keys listed in counters are monotonic and get the _total suffix; everything else is a gauge.
+    def collect():
+        result = []
+        for key, value in func().items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            if key in counters:
+                result.append((f"{prefix}_{key}_total", "counter", f"{help}: {key}", [(labels or {}, value)]))
+            else:
+                result.append((f"{prefix}_{key}", "gauge", f"{help}: {key}", [(labels or {}, value)]))
+        return result
+    return collect
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "http_requests_total", "HTTP requests by route template, method and status", ("route", "method", "status")))
+HTTP_LATENCY = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency until the last body byte is sent", ("route", "method")))
+HTTP_IN_FLIGHT = REGISTRY.register(Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served"))
+DB_STATEMENT_LATENCY = REGISTRY.register(Histogram(
+    "db_statement_duration_seconds", "Time spent in cursor.execute per normalized SQL statement", ("statement",)))
+DB_STATEMENT_FETCH = REGISTRY.register(Counter(
+    "db_statement_fetch_seconds_total", "Time spent fetching result rows per normalized SQL statement", ("statement",)))
+DB_STATEMENT_ROWS = REGISTRY.register(Counter(
+    "db_statement_rows_total", "Rows fetched per normalized SQL statement", ("statement",)))
+DB_STATEMENT_ERRORS = REGISTRY.register(Counter(
+    "db_statement_errors_total", "sqlite3 errors raised by execute per normalized SQL statement", ("statement",)))
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=4096)
+def normalize_sql(sql: str):
+    # One label per statement shape: literals become ?, IN lists collapse, whitespace is squeezed
+    sql = STRING_LITERAL.sub("?", sql)
+    sql = NUMBER_LITERAL.sub("?", sql)
+    sql = PLACEHOLDER_LIST.sub("(...)", sql)
+    return WHITESPACE.sub(" ", sql).strip()
+
+
+class Execution:
+    # Timings of one statement until they reach the slow query log. The connection holds these
+    # rather than the cursors, so a cursor dropped before its rows ran out is freed and its
+    # statement reset straight away, as with plain sqlite3; an unfinished statement would
+    # otherwise make the next COMMIT fail.
+    __slots__ = ("statement", "sql", "params", "elapsed", "rows")
+
+    def __init__(self, statement, sql, params):
+        self.statement = statement
+        self.sql = sql
+        self.params = params
+        self.elapsed = 0.0
+        self.rows = 0
+
+    def record(self, conn):
+        log = slow_queries.slow_query_log
+        if log.threshold is not None and self.elapsed >= log.threshold:
+            log.record(conn, self.statement, self.sql, self.params, self.elapsed, self.rows)
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    # Times execute and counts fetched rows. Execute and fetch time are also added up per execution
+    # and passed to the slow query log once the rows run out, the cursor is reused or closed, or the
+    # connection goes back to the pool; always on the thread using the connection, since recording
+    # may run EXPLAIN QUERY PLAN on it. Rows read by iterating the cursor directly are not counted;
+    # the API code always uses fetchone/fetchmany/fetchall.
+    _statement = None
+    _execution = None
+
+    def _begin(self, sql, params):
+        self._finish()
+        self._statement = normalize_sql(sql)
+        self._execution = Execution(self._statement, sql, params)
+        self.connection._pending.add(self._execution)
+
+    def _drop(self):
+        self.connection._pending.discard(self._execution)
+        self._execution = None
+
+    def _finish(self):
+        if self._execution is None:
+            return
+        self._execution.record(self.connection)
+        self._drop()
+
+    def _executed(self, start):
+        elapsed = time.perf_counter() - start
+        if self._execution is not None:
+            self._execution.elapsed += elapsed
+        DB_STATEMENT_LATENCY.observe(elapsed, self._statement)
+
+    def execute(self, sql, parameters=()):
+        self._begin(sql, parameters)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        except sqlite3.Error:
+            DB_STATEMENT_ERRORS.inc(self._statement)
+            self._drop()
+            raise
+        finally:
+            self._executed(start)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._begin(sql, None)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        except sqlite3.Error:
+            DB_STATEMENT_ERRORS.inc(self._statement)
+            self._drop()
+            raise
+        finally:
+            self._executed(start)
+
+    def _fetched(self, start, rows, exhausted):
+        if self._statement is None:
+            return
+        elapsed = time.perf_counter() - start
+        DB_STATEMENT_FETCH.inc(self._statement, amount=elapsed)
+        DB_STATEMENT_ROWS.inc(self._statement, amount=rows)
+        if self._execution is not None:
+            self._execution.elapsed += elapsed
+            self._execution.rows += rows
+            if exhausted:
+                self._finish()
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(start, 0 if row is None else 1, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        start = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._fetched(start, len(rows), len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(start, len(rows), True)
+        return rows
+
+    def close(self):
+        self._finish()
+        super().close()
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    # Connection.execute() builds a plain sqlite3.Cursor in C, so the shortcuts are redirected here
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Executions that have not reached the slow query log yet
+        self._pending = set()
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def finish_statements(self):
+        # The pool's release hook: records what the request left unfinished, e.g. a fetchone() that
+        # did not read to the end, before another thread can take the connection
+        while self._pending:
+            self._pending.pop().record(self)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+class MetricsMiddleware:
+    # Plain ASGI middleware: no extra task per request and streaming bodies pass straight through.
+    # Requests are labelled with the matched route template (/companies/{company_id}), never the raw
+    # path, so label cardinality stays bounded.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUESTS.inc(route, scope["method"], str(status))
+            HTTP_LATENCY.observe(time.perf_counter() - start, route, scope["method"])
@@ -0,0 +1,257 @@
+import sqlite3
+
+# Satellite tables hold exactly one row per company
+SATELLITE_TABLES = ['People', 'Contacts', 'Investments', 'Clients', 'Partners', 'Changes']
+
+
+def _dedupe(table: str, key: str):
+    # Keep the most recently imported row per key so the unique index can be built on old
+    # databases; earlier rows are stale copies from previous imports
+    return f"DELETE FROM {table} WHERE rowid NOT IN (SELECT MAX(rowid) FROM {table} GROUP BY {key})"
+
+
+# Each migration is (version, description, statements). Versions are stored in PRAGMA user_version
+# and must only ever be appended to. The SQL is written out in full rather than taken from the
+# modules that use the tables, so an applied migration never changes; a schema change is a new
+# migration here.
+MIGRATIONS = [
+    (1, "base schema", [
+        """CREATE TABLE IF NOT EXISTS Company (
+            id INTEGER PRIMARY KEY,
+            url TEXT,
+            name TEXT,
+            website TEXT,
+            description_short TEXT
+        )""",
+        """CREATE TABLE IF NOT EXISTS People (
+            company_id INTEGER REFERENCES Company(id),
+            people_count INTEGER,
+            senior_people_count INTEGER
+        )""",
+        """CREATE TABLE IF NOT EXISTS Contacts (
+            company_id INTEGER REFERENCES Company(id),
+            emails_count INTEGER,
+            personal_emails_count INTEGER,
+            phones_count INTEGER,
+            addresses_count INTEGER
+        )""",
+        """CREATE TABLE IF NOT EXISTS Investments (
+            company_id INTEGER REFERENCES Company(id),
+            investors_count INTEGER
+        )""",
+        """CREATE TABLE IF NOT EXISTS Clients (
+            company_id INTEGER REFERENCES Company(id),
+            clients_count INTEGER
+        )""",
+        """CREATE TABLE IF NOT EXISTS Partners (
+            company_id INTEGER REFERENCES Company(id),
+            partners_count INTEGER
+        )""",
+        """CREATE TABLE IF NOT EXISTS Changes (
+            company_id INTEGER REFERENCES Company(id),
+            changes_count INTEGER,
+            people_changes_count INTEGER,
+            contact_changes_count INTEGER
+        )""",
+        """CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username VARCHAR(50) UNIQUE NOT NULL,
+            password_hash VARCHAR(255) NOT NULL
+        )""",
+    ]),
+    (2, "unique indexes on company id", [
+        _dedupe('Company', 'id'),
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_company_id ON Company(id)",
+    ] + [
+        statement
+        for table in SATELLITE_TABLES
+        for statement in (
+            _dedupe(table, 'company_id'),
+            f"CREATE UNIQUE INDEX IF NOT EXISTS ux_{table.lower()}_company_id ON {table}(company_id)",
+        )
+    ]),
+    (3, "covering indexes on ranking columns", [
+        "CREATE INDEX IF NOT EXISTS ix_investments_rank ON Investments(investors_count DESC, company_id)",
+        "CREATE INDEX IF NOT EXISTS ix_clients_rank ON Clients(clients_count DESC, company_id)",
+        "CREATE INDEX IF NOT EXISTS ix_partners_rank ON Partners(partners_count DESC, company_id)",
+        "CREATE INDEX IF NOT EXISTS ix_changes_rank ON Changes(changes_count DESC, company_id, people_changes_count, contact_changes_count)",
+        "CREATE INDEX IF NOT EXISTS ix_changes_people_rank ON Changes(people_changes_count DESC, company_id, changes_count, contact_changes_count)",
+        "CREATE INDEX IF NOT EXISTS ix_changes_contact_rank ON Changes(contact_changes_count DESC, company_id, changes_count, people_changes_count)",
+        "ANALYZE",
+    ]),
+    (4, "dataset version", [
+        """CREATE TABLE IF NOT EXISTS dataset_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL,
+            updated_at TEXT NOT NULL
+        )""",
+        "INSERT OR IGNORE INTO dataset_version (id, version, updated_at) VALUES (1, 1, CURRENT_TIMESTAMP)",
+    ]),
+    (5, "precomputed leaderboards", [
+        """CREATE TABLE IF NOT EXISTS Leaderboard (
+            metric TEXT NOT NULL,
+            rank INTEGER NOT NULL,
+            company_id INTEGER NOT NULL,
+            value INTEGER,
+            name TEXT,
+            PRIMARY KEY (metric, rank)
+        ) WITHOUT ROWID""",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_leaderboard_company ON Leaderboard(metric, company_id)",
+        "DELETE FROM Leaderboard",
+        """INSERT INTO Leaderboard (metric, rank, company_id, value, name)
+            SELECT 'investors_count', ROW_NUMBER() OVER (ORDER BY t.investors_count DESC, t.company_id), t.company_id, t.investors_count, cp.name
+            FROM Investments AS t
+            LEFT JOIN Company AS cp ON t.company_id = cp.id""",
+        """INSERT INTO Leaderboard (metric, rank, company_id, value, name)
+            SELECT 'clients_count', ROW_NUMBER() OVER (ORDER BY t.clients_count DESC, t.company_id), t.company_id, t.clients_count, cp.name
+            FROM Clients AS t
+            LEFT JOIN Company AS cp ON t.company_id = cp.id""",
+        """INSERT INTO Leaderboard (metric, rank, company_id, value, name)
+            SELECT 'partners_count', ROW_NUMBER() OVER (ORDER BY t.partners_count DESC, t.company_id), t.company_id, t.partners_count, cp.name
+            FROM Partners AS t
+            LEFT JOIN Company AS cp ON t.company_id = cp.id""",
+        """INSERT INTO Leaderboard (metric, rank, company_id, value, name)
+            SELECT 'changes_count', ROW_NUMBER() OVER (ORDER BY t.changes_count DESC, t.company_id), t.company_id, t.changes_count, cp.name
+            FROM Changes AS t
+            LEFT JOIN Company AS cp ON t.company_id = cp.id""",
+        """INSERT INTO Leaderboard (metric, rank, company_id, value, name)
+            SELECT 'people_changes_count', ROW_NUMBER() OVER (ORDER BY t.people_changes_count DESC, t.company_id), t.company_id, t.people_changes_count, cp.name
+            FROM Changes AS t
+            LEFT JOIN Company AS cp ON t.company_id = cp.id""",
+        """INSERT INTO Leaderboard (metric, rank, company_id, value, name)
+            SELECT 'contact_changes_count', ROW_NUMBER() OVER (ORDER BY t.contact_changes_count DESC, t.company_id), t.company_id, t.contact_changes_count, cp.name
+            FROM Changes AS t
+            LEFT JOIN Company AS cp ON t.company_id = cp.id""",
+    ]),
+    (6, "row hashes for incremental imports", [
+        """CREATE TABLE IF NOT EXISTS company_hash (
+            id INTEGER PRIMARY KEY,
+            row_hash BLOB NOT NULL
+        )""",
+    ]),
+    (7, "full-text search index", [
+        """CREATE VIRTUAL TABLE IF NOT EXISTS company_fts USING fts5(
+            name, website, description_short,
+            content='Company', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )""",
+        "INSERT INTO company_fts(company_fts) VALUES ('rebuild')",
+    ]),
+    (8, "sessions", [
+        """CREATE TABLE IF NOT EXISTS sessions (
+            id TEXT PRIMARY KEY,
+            username TEXT NOT NULL,
+            created_at INTEGER NOT NULL,
+            expires_at INTEGER NOT NULL,
+            revoked_at INTEGER
+        )""",
+        "CREATE INDEX IF NOT EXISTS ix_sessions_revoked ON sessions(expires_at) WHERE revoked_at IS NOT NULL",
+        "CREATE INDEX IF NOT EXISTS ix_sessions_expires ON sessions(expires_at)",
+        "CREATE INDEX IF NOT EXISTS ix_sessions_username ON sessions(username)",
+        """CREATE TABLE IF NOT EXISTS auth_secret (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            secret BLOB NOT NULL
+        )""",
+        "INSERT OR IGNORE INTO auth_secret (id, secret) VALUES (1, randomblob(32))",
+    ]),
+    (9, "denormalized company profile", [
+        """CREATE TABLE IF NOT EXISTS company_profile (
+            id INTEGER PRIMARY KEY,
+            url TEXT,
+            name TEXT,
+            website TEXT,
+            description_short TEXT,
+            has_people INTEGER NOT NULL,
+            people_count INTEGER,
+            senior_people_count INTEGER,
+            has_contacts INTEGER NOT NULL,
+            emails_count INTEGER,
+            personal_emails_count INTEGER,
+            phones_count INTEGER,
+            addresses_count INTEGER,
+            has_investments INTEGER NOT NULL,
+            investors_count INTEGER,
+            has_clients INTEGER NOT NULL,
+            clients_count INTEGER,
+            has_partners INTEGER NOT NULL,
+            partners_count INTEGER,
+            has_changes INTEGER NOT NULL,
+            changes_count INTEGER,
+            people_changes_count INTEGER,
+            contact_changes_count INTEGER
+        )""",
+        "DELETE FROM company_profile",
+        """INSERT INTO company_profile (id, url, name, website, description_short, has_people, people_count,
+                senior_people_count, has_contacts, emails_count, personal_emails_count, phones_count, addresses_count,
+                has_investments, investors_count, has_clients, clients_count, has_partners, partners_count,
+                has_changes, changes_count, people_changes_count, contact_changes_count)
+            SELECT c.id, c.url, c.name, c.website, c.description_short,
+                   p.company_id IS NOT NULL, p.people_count, p.senior_people_count,
+                   ct.company_id IS NOT NULL, ct.emails_count, ct.personal_emails_count, ct.phones_count, ct.addresses_count,
+                   i.company_id IS NOT NULL, i.investors_count,
+                   cl.company_id IS NOT NULL, cl.clients_count,
+                   pn.company_id IS NOT NULL, pn.partners_count,
+                   ch.company_id IS NOT NULL, ch.changes_count, ch.people_changes_count, ch.contact_changes_count
+            FROM Company AS c
+            LEFT JOIN People AS p ON c.id = p.company_id
+            LEFT JOIN Contacts AS ct ON c.id = ct.company_id
+            LEFT JOIN Investments AS i ON c.id = i.company_id
+            LEFT JOIN Clients AS cl ON c.id = cl.company_id
+            LEFT JOIN Partners AS pn ON c.id = pn.company_id
+            LEFT JOIN Changes AS ch ON c.id = ch.company_id""",
+    ]),
+    (10, "company_profile metric indexes", [
+        "CREATE INDEX IF NOT EXISTS ix_company_profile_people_count ON company_profile(people_count)",
+        "CREATE INDEX IF NOT EXISTS ix_company_profile_senior_people_count ON company_profile(senior_people_count)",
+        "CREATE INDEX IF NOT EXISTS ix_company_profile_emails_count ON company_profile(emails_count)",
+        "CREATE INDEX IF NOT EXISTS ix_company_profile_personal_emails_count ON company_profile(personal_emails_count)",
+        "CREATE INDEX IF NOT EXISTS ix_company_profile_phones_count ON company_profile(phones_count)",
+        "CREATE INDEX IF NOT EXISTS ix_company_profile_addresses_count ON company_profile(addresses_count)",
+        "CREATE INDEX IF NOT EXISTS ix_company_profile_investors_count ON company_profile(investors_count)",
+        "CREATE INDEX IF NOT EXISTS ix_company_profile_clients_count ON company_profile(clients_count)",
+        "CREATE INDEX IF NOT EXISTS ix_company_profile_partners_count ON company_profile(partners_count)",
+        "CREATE INDEX IF NOT EXISTS ix_company_profile_changes_count ON company_profile(changes_count)",
+        "CREATE INDEX IF NOT EXISTS ix_company_profile_people_changes_count ON company_profile(people_changes_count)",
+        "CREATE INDEX IF NOT EXISTS ix_company_profile_contact_changes_count ON company_profile(contact_changes_count)",
+        "ANALYZE company_profile",
+    ]),
+]
+
+
+def current_version(conn: sqlite3.Connection):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection):
+    # Apply every pending migration, each in its own transaction. Safe to call on every startup.
+    applied = []
+    for version, description, statements in MIGRATIONS:
+        if version <= current_version(conn):
+            continue
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # Another process may have migrated while we waited for the write lock
+            if version <= current_version(conn):
+                conn.rollback()
+                continue
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        applied.append((version, description))
+    return applied
+
+
+def scan_lines(plan):
+    # The EXPLAIN QUERY PLAN details that scan a table without using an index.
+    # Virtual tables such as json_each() only scan their own arguments.
+    return [line for line in plan if line.startswith("SCAN ") and " USING " not in line and "VIRTUAL TABLE" not in line]
+
+
+def full_scans(conn: sqlite3.Connection, sql: str, params=()):
+    plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    return scan_lines([row[3] for row in plan])
@@ -0,0 +1,37 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class RateLimiter:
+    # Token bucket per key: each key starts with `burst` tokens and regains `rate` tokens per second.
+    # Buckets of keys not seen for a while are dropped once `max_keys` is reached.
+    def __init__(self, rate: float, burst: int, max_keys: int = 100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"allowed": 0, "limited": 0}
+
+    def acquire(self, key):
+        # Take one token for `key`. Returns 0 when allowed, otherwise the seconds until a token is free.
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+                self.stats["allowed"] += 1
+            else:
+                wait = (1 - tokens) / self.rate
+                self.stats["limited"] += 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def snapshot(self):
+        with self._lock:
+            return {"rate": self.rate, "burst": self.burst, "keys": len(self._buckets), **self.stats}
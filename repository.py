@@ -0,0 +1,383 @@
+from bisect import bisect_right
+
+from sqlalchemy import BigInteger, Column, Integer, MetaData, Table, Text, case, create_engine, select
+from sqlalchemy.exc import SQLAlchemyError
+
+import company_profile
+import config
+
+# Storage backends for the company read routes, chosen with STORAGE_BACKEND. Each one provides the
+# methods in FUNCTIONS with the same arguments and return values as main.py's SQLite functions: dict
+# rows keyed like the SQL aliases there, and None for a missing company or a database error. Users,
+# sessions, search, stats, similar, query and export stay on the SQLite file.
+
+FUNCTIONS = [
+    'iter_companies', 'get_companies_page', 'get_company_details', 'get_company_details_batch',
+    'get_more_detail', 'get_people', 'get_contact', 'get_investment', 'get_client', 'get_partner', 'get_change',
+    'get_top_investment', 'get_top_client', 'get_top_partner', 'get_top_change', 'get_all_detail',
+]
+
+COMPANY_COLUMNS = ['id', 'url', 'name', 'website', 'description_short']
+# Satellite tables in company_profile.COLUMNS order, with their metric columns
+SATELLITES = {
+    'People': ['people_count', 'senior_people_count'],
+    'Contacts': ['emails_count', 'personal_emails_count', 'phones_count', 'addresses_count'],
+    'Investments': ['investors_count'],
+    'Clients': ['clients_count'],
+    'Partners': ['partners_count'],
+    'Changes': ['changes_count', 'people_changes_count', 'contact_changes_count'],
+}
+METRICS = [metric for metrics in SATELLITES.values() for metric in metrics]
+TOP_CHANGE_MODES = {1: 'changes_count', 2: 'people_changes_count', 3: 'contact_changes_count'}
+
+# Response keys of the single-satellite routes, in the order main.py's queries return them
+SATELLITE_ROUTES = {
+    'people': ('People', ['company_id', 'company_name', 'people_count', 'senior_people_count']),
+    'contact': ('Contacts', ['company_id', 'addresses_count', 'emails_count', 'personal_emails_count',
+                             'phones_count', 'company_name']),
+    'investment': ('Investments', ['company_id', 'investors_count', 'company_name']),
+    'client': ('Clients', ['company_id', 'clients_count', 'company_name']),
+    'partner': ('Partners', ['company_id', 'partners_count', 'company_name']),
+    'change': ('Changes', ['company_id', 'changes_count', 'people_changes_count', 'contact_changes_count', 'name']),
+}
+
+metadata = MetaData()
+company = Table('Company', metadata, Column('id', BigInteger, primary_key=True),
+                *(Column(column, Text) for column in COMPANY_COLUMNS[1:]))
+satellites = {
+    name: Table(name, metadata, Column('company_id', BigInteger), *(Column(metric, Integer) for metric in metrics))
+    for name, metrics in SATELLITES.items()
+}
+
+
+def profile_select():
+    # company_profile.COLUMNS computed from the seven-table join, as main.COMPANY_DETAILS_QUERY does
+    columns = [company.c[column] for column in COMPANY_COLUMNS]
+    joined = company
+    for name, metrics in SATELLITES.items():
+        table = satellites[name]
+        columns.append(case((table.c.company_id.is_not(None), 1), else_=0))
+        columns += [table.c[metric] for metric in metrics]
+        joined = joined.outerjoin(table, table.c.company_id == company.c.id)
+    return select(*columns).select_from(joined)
+
+
+def detail_select(keys):
+    # Flat rows of the /all_detail and /more_detail columns from the same join
+    profile = profile_select()
+    by_name = dict(zip(company_profile.COLUMNS, profile.selected_columns))
+    return profile.with_only_columns(
+        *(company.c.id.label('company_id') if key == 'company_id' else by_name[key] for key in keys)
+    )
+
+
+def satellite_select(route: str):
+    name, keys = SATELLITE_ROUTES[route]
+    table = satellites[name]
+    columns = [company.c.name.label(key) if key in ('company_name', 'name') else table.c[key] for key in keys]
+    return select(*columns).select_from(table.outerjoin(company, table.c.company_id == company.c.id))
+
+
+def ranking_select(metric: str, columns):
+    table = next(satellites[name] for name, metrics in SATELLITES.items() if metric in metrics)
+    return (select(*(company.c.name if column == 'name' else table.c[column] for column in columns))
+            .select_from(table.outerjoin(company, table.c.company_id == company.c.id))
+            .order_by(table.c[metric].desc(), table.c.company_id))
+
+
+def top_columns(metric: str):
+    return ['company_id', metric, 'name']
+
+
+MORE_DETAIL_COLUMNS = ['company_id'] + METRICS
+ALL_DETAIL_COLUMNS = ['company_id'] + COMPANY_COLUMNS[1:] + METRICS
+CHANGE_COLUMNS = ['company_id', 'changes_count', 'people_changes_count', 'contact_changes_count', 'name']
+
+
+def result_keys(result):
+    # Column names come back as quoted_name, a str subclass orjson will not take as a key
+    return [str(key) for key in result.keys()]
+
+
+class SqliteRepository:
+    # main.py's functions on the SQLite pool, which main.py also closes. Its rows only change with an
+    # import, which bumps the dataset version, so responses may be cached and validated by it.
+    name = 'sqlite'
+    versioned = True
+
+    def __init__(self, functions: dict):
+        for name in FUNCTIONS:
+            setattr(self, name, functions[name])
+
+    def health(self):
+        return {"backend": self.name}
+
+    def close(self):
+        pass
+
+
+class SqlAlchemyRepository:
+    # Any database SQLAlchemy can reach, e.g. mssql+pyodbc://... for SQL Server or a sqlite:/// file
+    # as a local stand-in. Statements are built with SQLAlchemy Core so each dialect gets its own
+    # paging syntax, and share the SQLite pool's size, timeout and statement cache settings. Rows can
+    # change without the SQLite dataset version moving, so its responses are neither cached nor validated.
+    name = 'sqlalchemy'
+    versioned = False
+
+    def __init__(self, url: str, pool_size: int = config.pool_size, pool_timeout: float = config.pool_timeout,
+                 statement_cache: int = config.pool_statement_cache):
+        self.engine = create_engine(url, pool_size=pool_size, max_overflow=0, pool_timeout=pool_timeout,
+                                    pool_pre_ping=True, query_cache_size=statement_cache)
+        self._profile = profile_select()
+        self._more_detail = detail_select(MORE_DETAIL_COLUMNS)
+        self._all_detail = detail_select(ALL_DETAIL_COLUMNS)
+        self._satellites = {route: satellite_select(route) for route in SATELLITE_ROUTES}
+
+    def _fetch(self, statement, first: bool = False):
+        try:
+            with self.engine.connect() as conn:
+                result = conn.execute(statement)
+                keys = result_keys(result)
+                if first:
+                    row = result.first()
+                    return dict(zip(keys, row)) if row else None
+                return [dict(zip(keys, row)) for row in result]
+        except SQLAlchemyError as e:
+            print("Error accessing database:", e)
+            return None
+
+    def _profile_rows(self, where):
+        try:
+            with self.engine.connect() as conn:
+                return conn.execute(self._profile.where(where)).all()
+        except SQLAlchemyError as e:
+            print("Error accessing database:", e)
+            return None
+
+    def iter_companies(self, after_id: int = None, limit: int = None):
+        statement = select(*(company.c[column] for column in COMPANY_COLUMNS)).order_by(company.c.id)
+        if after_id is not None:
+            statement = statement.where(company.c.id > after_id)
+        if limit is not None:
+            statement = statement.limit(limit)
+        try:
+            conn = self.engine.connect()
+        except SQLAlchemyError as e:
+            print("Error accessing database:", e)
+            return None
+        try:
+            result = conn.execute(statement)
+            keys = result_keys(result)
+        except SQLAlchemyError as e:
+            conn.close()
+            print("Error accessing database:", e)
+            return None
+
+        def batches():
+            try:
+                while True:
+                    batch = result.fetchmany(config.stream_batch_size)
+                    if not batch:
+                        break
+                    yield [dict(zip(keys, row)) for row in batch]
+            except SQLAlchemyError as e:
+                print("Error accessing database:", e)
+            finally:
+                result.close()
+                conn.close()
+
+        return batches()
+
+    def get_companies_page(self, after_id: int, limit: int):
+        batches = self.iter_companies(after_id, limit)
+        if batches is None:
+            return None
+        return [company for batch in batches for company in batch]
+
+    def get_company_details(self, company_id: int):
+        rows = self._profile_rows(company.c.id == company_id)
+        return company_profile.details_view(rows[0]) if rows else None
+
+    def get_company_details_batch(self, company_ids):
+        rows = self._profile_rows(company.c.id.in_(company_ids))
+        return None if rows is None else {row[0]: company_profile.details_view(row) for row in rows}
+
+    def get_more_detail(self, company_id: int):
+        detail = self._fetch(self._more_detail.where(company.c.id == company_id), first=True)
+        return {"more_detail": detail} if detail else None
+
+    def _satellite(self, route: str, company_id: int):
+        table = satellites[SATELLITE_ROUTES[route][0]]
+        row = self._fetch(self._satellites[route].where(table.c.company_id == company_id), first=True)
+        return {route: row} if row else None
+
+    def get_people(self, company_id: int):
+        return self._satellite('people', company_id)
+
+    def get_contact(self, company_id: int):
+        return self._satellite('contact', company_id)
+
+    def get_investment(self, company_id: int):
+        return self._satellite('investment', company_id)
+
+    def get_client(self, company_id: int):
+        return self._satellite('client', company_id)
+
+    def get_partner(self, company_id: int):
+        return self._satellite('partner', company_id)
+
+    def get_change(self, company_id: int):
+        return self._satellite('change', company_id)
+
+    def _top(self, metric: str, top: int, offset: int, columns):
+        return self._fetch(ranking_select(metric, columns).limit(top).offset(offset))
+
+    def get_top_investment(self, top: int, offset: int = 0):
+        return self._top('investors_count', top, offset, top_columns('investors_count')) or None
+
+    def get_top_client(self, top: int, offset: int = 0):
+        return self._top('clients_count', top, offset, top_columns('clients_count'))
+
+    def get_top_partner(self, top: int, offset: int = 0):
+        return self._top('partners_count', top, offset, top_columns('partners_count'))
+
+    def get_top_change(self, top: int, mode: int, offset: int = 0):
+        return self._top(TOP_CHANGE_MODES[mode], top, offset, CHANGE_COLUMNS)
+
+    def get_all_detail(self):
+        return self._fetch(self._all_detail.order_by(company.c.id).limit(5))
+
+    def health(self):
+        return {"backend": self.name, "dialect": self.engine.dialect.name, "pool": self.engine.pool.status()}
+
+    def close(self):
+        self.engine.dispose()
+
+
+class MemoryRepository:
+    # Profile rows held in a dict, for tests and for running the API without a database. Built from
+    # the tables' rows, or from an aihitdata CSV the same way the importer splits it. The CSV is not
+    # tied to the SQLite dataset version, so like sqlalchemy its responses are not cached or validated.
+    name = 'memory'
+    versioned = False
+
+    def __init__(self, tables: dict):
+        satellite_rows = {name: {row[0]: row[1:] for row in tables.get(name, ())} for name in SATELLITES}
+        self.rows = {}
+        for row in tables.get('Company', ()):
+            values = list(row)
+            for name, metrics in SATELLITES.items():
+                metric_values = satellite_rows[name].get(row[0])
+                values.append(int(metric_values is not None))
+                values += metric_values if metric_values is not None else [None] * len(metrics)
+            self.rows[row[0]] = tuple(values)
+        self.ids = sorted(self.rows)
+        self._rankings = {}
+
+    @classmethod
+    def from_csv(cls, csv_path: str, chunk_size: int = 100000):
+        # The importer needs pandas, which only this backend requires
+        import import_data
+
+        tables = {name: [] for name in import_data.TABLES}
+        for chunk in import_data.read_chunks(csv_path, chunk_size):
+            for name in tables:
+                tables[name].extend(import_data.table_rows(chunk, name))
+        return cls(tables)
+
+    def iter_companies(self, after_id: int = None, limit: int = None):
+        start = 0 if after_id is None else bisect_right(self.ids, after_id)
+        ids = self.ids[start:] if limit is None else self.ids[start:start + limit]
+
+        def batches():
+            for first in range(0, len(ids), config.stream_batch_size):
+                yield [dict(zip(COMPANY_COLUMNS, self.rows[company_id][:5]))
+                       for company_id in ids[first:first + config.stream_batch_size]]
+
+        return batches()
+
+    def get_companies_page(self, after_id: int, limit: int):
+        return [company for batch in self.iter_companies(after_id, limit) for company in batch]
+
+    def get_company_details(self, company_id: int):
+        row = self.rows.get(company_id)
+        return company_profile.details_view(row) if row else None
+
+    def get_company_details_batch(self, company_ids):
+        return {company_id: company_profile.details_view(self.rows[company_id])
+                for company_id in company_ids if company_id in self.rows}
+
+    def _view(self, view, company_id: int):
+        row = self.rows.get(company_id)
+        return view(row) if row else None
+
+    def get_more_detail(self, company_id: int):
+        return self._view(company_profile.more_detail_view, company_id)
+
+    def get_people(self, company_id: int):
+        return self._view(company_profile.people_view, company_id)
+
+    def get_contact(self, company_id: int):
+        return self._view(company_profile.contact_view, company_id)
+
+    def get_investment(self, company_id: int):
+        return self._view(company_profile.investment_view, company_id)
+
+    def get_client(self, company_id: int):
+        return self._view(company_profile.client_view, company_id)
+
+    def get_partner(self, company_id: int):
+        return self._view(company_profile.partner_view, company_id)
+
+    def get_change(self, company_id: int):
+        return self._view(company_profile.change_view, company_id)
+
+    def _ranking(self, metric: str):
+        # Ids of the companies with a row in the metric's table, highest value first and NULLs last
+        ranking = self._rankings.get(metric)
+        if ranking is None:
+            flag = company_profile.P['has_' + next(name for name, metrics in SATELLITES.items() if metric in metrics).lower()]
+            position = company_profile.P[metric]
+            ranked = [row for row in self.rows.values() if row[flag]]
+            ranked.sort(key=lambda row: (row[position] is None, -(row[position] or 0), row[0]))
+            ranking = self._rankings[metric] = [row[0] for row in ranked]
+        return ranking
+
+    def _top(self, metric: str, top: int, offset: int, columns):
+        rows = (self.rows[company_id] for company_id in self._ranking(metric)[offset:offset + top])
+        return [{column: row[0] if column == 'company_id' else row[company_profile.P[column]] for column in columns}
+                for row in rows]
+
+    def get_top_investment(self, top: int, offset: int = 0):
+        return self._top('investors_count', top, offset, top_columns('investors_count')) or None
+
+    def get_top_client(self, top: int, offset: int = 0):
+        return self._top('clients_count', top, offset, top_columns('clients_count'))
+
+    def get_top_partner(self, top: int, offset: int = 0):
+        return self._top('partners_count', top, offset, top_columns('partners_count'))
+
+    def get_top_change(self, top: int, mode: int, offset: int = 0):
+        return self._top(TOP_CHANGE_MODES[mode], top, offset, CHANGE_COLUMNS)
+
+    def get_all_detail(self):
+        return [{key: self.rows[company_id][0 if key == 'company_id' else company_profile.P[key]] for key in ALL_DETAIL_COLUMNS}
+                for company_id in self.ids[:5]]
+
+    def health(self):
+        return {"backend": self.name, "companies": len(self.rows)}
+
+    def close(self):
+        pass
+
+
+def create(backend: str, sqlite_functions: dict):
+    if backend == 'sqlite':
+        return SqliteRepository(sqlite_functions)
+    if backend == 'sqlalchemy':
+        if not config.database_url:
+            raise ValueError("STORAGE_BACKEND=sqlalchemy needs DATABASE_URL")
+        return SqlAlchemyRepository(config.database_url)
+    if backend == 'memory':
+        return MemoryRepository.from_csv(config.memory_source_csv)
+    raise ValueError(f"Unknown STORAGE_BACKEND {backend!r}, expected sqlite, sqlalchemy or memory")
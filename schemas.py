@@ -0,0 +1,262 @@
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+
+# Response models. Routes return pre-encoded responses, so these document the API and are not used
+# to validate every response at runtime.
+
+
+class Company(BaseModel):
+    id: int
+    url: Optional[str] = None
+    name: Optional[str] = None
+    website: Optional[str] = None
+    description_short: Optional[str] = None
+
+
+class PeopleCounts(BaseModel):
+    people_count: Optional[int] = None
+    senior_people_count: Optional[int] = None
+
+
+class ContactCounts(BaseModel):
+    emails_count: Optional[int] = None
+    personal_emails_count: Optional[int] = None
+    phones_count: Optional[int] = None
+    addresses_count: Optional[int] = None
+
+
+class InvestmentCounts(BaseModel):
+    investors_count: Optional[int] = None
+
+
+class ClientCounts(BaseModel):
+    clients_count: Optional[int] = None
+
+
+class PartnerCounts(BaseModel):
+    partners_count: Optional[int] = None
+
+
+class ChangeCounts(BaseModel):
+    changes_count: Optional[int] = None
+    people_changes_count: Optional[int] = None
+    contact_changes_count: Optional[int] = None
+
+
+class CompanyDetails(BaseModel):
+    company: Company
+    people: Optional[PeopleCounts] = None
+    contacts: Optional[ContactCounts] = None
+    investments: Optional[InvestmentCounts] = None
+    clients: Optional[ClientCounts] = None
+    partners: Optional[PartnerCounts] = None
+    changes: Optional[ChangeCounts] = None
+
+
+class CompanyBatchResult(BaseModel):
+    companies: List[CompanyDetails]
+    not_found: List[int]
+
+
+class MoreDetail(PeopleCounts, ContactCounts, InvestmentCounts, ClientCounts, PartnerCounts, ChangeCounts):
+    company_id: int
+
+
+class MoreDetailResponse(BaseModel):
+    more_detail: MoreDetail
+
+
+class People(PeopleCounts):
+    company_id: int
+    company_name: Optional[str] = None
+
+
+class PeopleResponse(BaseModel):
+    people: People
+
+
+class Contact(ContactCounts):
+    company_id: int
+    company_name: Optional[str] = None
+
+
+class ContactResponse(BaseModel):
+    contact: Contact
+
+
+class Investment(InvestmentCounts):
+    company_id: int
+    company_name: Optional[str] = None
+
+
+class InvestmentResponse(BaseModel):
+    investment: Investment
+
+
+class Client(ClientCounts):
+    company_id: int
+    company_name: Optional[str] = None
+
+
+class ClientResponse(BaseModel):
+    client: Client
+
+
+class Partner(PartnerCounts):
+    company_id: int
+    company_name: Optional[str] = None
+
+
+class PartnerResponse(BaseModel):
+    partner: Partner
+
+
+class Change(ChangeCounts):
+    company_id: int
+    name: Optional[str] = None
+
+
+class ChangeResponse(BaseModel):
+    change: Change
+
+
+class TopInvestment(InvestmentCounts):
+    company_id: int
+    name: Optional[str] = None
+
+
+class TopClient(ClientCounts):
+    company_id: int
+    name: Optional[str] = None
+
+
+class TopPartner(PartnerCounts):
+    company_id: int
+    name: Optional[str] = None
+
+
+class TopChange(ChangeCounts):
+    company_id: int
+    name: Optional[str] = None
+
+
+class AllDetail(MoreDetail):
+    url: Optional[str] = None
+    name: Optional[str] = None
+    website: Optional[str] = None
+    description_short: Optional[str] = None
+
+
+class Rank(BaseModel):
+    company_id: int
+    company_name: Optional[str] = None
+    metric: str
+    rank: int
+    value: Optional[int] = None
+    out_of: int
+
+
+class SearchResult(BaseModel):
+    company_id: int
+    name: Optional[str] = None
+    website: Optional[str] = None
+    snippet: Optional[str] = None
+    score: float
+
+
+class SearchResponse(BaseModel):
+    query: str
+    limit: int
+    offset: int
+    results: List[SearchResult]
+
+
+class Suggestion(BaseModel):
+    company_id: int
+    name: Optional[str] = None
+
+
+class LoginResponse(BaseModel):
+    message: str
+    access_token: str
+    token_type: str
+    expires_in: int
+
+
+class Me(BaseModel):
+    username: str
+    expires_at: int
+
+
+class MetricAggregate(BaseModel):
+    count: int
+    sum: int
+    mean: Optional[float] = None
+    std: Optional[float] = None
+    min: Optional[int] = None
+    max: Optional[int] = None
+
+
+class Stats(BaseModel):
+    version: int
+    rows: int
+    metrics: Dict[str, MetricAggregate]
+
+
+class StatsCount(BaseModel):
+    version: int
+    count: int
+    total: int
+
+
+class MetricStats(MetricAggregate):
+    version: int
+    metric: str
+    rows: int
+    percentiles: Dict[str, Optional[float]]
+
+
+class Histogram(BaseModel):
+    version: int
+    metric: str
+    count: int
+    edges: List[float]
+    counts: List[int]
+
+
+class CompanyQueryRow(BaseModel):
+    id: int
+    name: Optional[str] = None
+    website: Optional[str] = None
+    people_count: Optional[int] = None
+    senior_people_count: Optional[int] = None
+    emails_count: Optional[int] = None
+    personal_emails_count: Optional[int] = None
+    phones_count: Optional[int] = None
+    addresses_count: Optional[int] = None
+    investors_count: Optional[int] = None
+    clients_count: Optional[int] = None
+    partners_count: Optional[int] = None
+    changes_count: Optional[int] = None
+    people_changes_count: Optional[int] = None
+    contact_changes_count: Optional[int] = None
+
+
+class CompanyQueryResult(BaseModel):
+    results: List[CompanyQueryRow]
+    next_cursor: Optional[str] = None
+
+
+class SimilarCompany(BaseModel):
+    company_id: int
+    name: Optional[str] = None
+    score: float
+    metric_score: float
+    text_score: float
+
+
+class SimilarCompanies(BaseModel):
+    company_id: int
+    version: int
+    results: List[SimilarCompany]
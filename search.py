@@ -0,0 +1,78 @@
+import re
+import sqlite3
+
+# Full-text index over Company, created by migrations.py. It is an external-content table, so the
+# text itself is only stored once in Company and the importer keeps the index in step with it.
+REBUILD_STATEMENTS = [
+    "INSERT INTO company_fts(company_fts) VALUES ('rebuild')",
+]
+
+# bm25() weights for name, website and description_short
+WEIGHTS = (10.0, 5.0, 1.0)
+
+TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def remove(conn: sqlite3.Connection, ids_sql: str):
+    # Must run while Company still holds the old values of the rows being removed
+    conn.execute(f"""
+        INSERT INTO company_fts(company_fts, rowid, name, website, description_short)
+        SELECT 'delete', id, name, website, description_short FROM Company WHERE id IN ({ids_sql})
+    """)
+
+
+def add(conn: sqlite3.Connection, ids_sql: str):
+    conn.execute(f"""
+        INSERT INTO company_fts(rowid, name, website, description_short)
+        SELECT id, name, website, description_short FROM Company WHERE id IN ({ids_sql})
+    """)
+
+
+def match_query(text: str, prefix: bool = False, column: str = None):
+    # Turn free text into an FTS5 query: every word must match, words are quoted so user input can
+    # never be parsed as FTS syntax, and with prefix=True the last word matches as a prefix
+    tokens = TOKEN.findall(text)
+    if not tokens:
+        return None
+    terms = [f'"{token}"' for token in tokens]
+    if prefix:
+        terms[-1] += "*"
+    query = " AND ".join(terms)
+    return f"{column} : ({query})" if column else query
+
+
+def search(conn: sqlite3.Connection, text: str, limit: int, offset: int = 0, prefix: bool = False, row_factory=None):
+    query = match_query(text, prefix)
+    if query is None:
+        return []
+    cursor = conn.cursor()
+    cursor.row_factory = row_factory
+    # Column -1 lets FTS5 take the snippet from whichever column matched best, so companies that
+    # match only on name or website still get one
+    return cursor.execute(f"""
+        SELECT c.id AS company_id, c.name, c.website,
+               snippet(company_fts, -1, '<b>', '</b>', '...', 16) AS snippet,
+               bm25(company_fts, {', '.join(map(str, WEIGHTS))}) AS score
+        FROM company_fts
+        JOIN Company AS c ON c.id = company_fts.rowid
+        WHERE company_fts MATCH ?
+        ORDER BY score
+        LIMIT ? OFFSET ?
+    """, (query, limit, offset)).fetchall()
+
+
+def suggest(conn: sqlite3.Connection, text: str, limit: int, row_factory=None):
+    # Autocomplete on company names only
+    query = match_query(text, prefix=True, column="name")
+    if query is None:
+        return []
+    cursor = conn.cursor()
+    cursor.row_factory = row_factory
+    return cursor.execute(f"""
+        SELECT c.id AS company_id, c.name
+        FROM company_fts
+        JOIN Company AS c ON c.id = company_fts.rowid
+        WHERE company_fts MATCH ?
+        ORDER BY bm25(company_fts, {', '.join(map(str, WEIGHTS))})
+        LIMIT ?
+    """, (query, limit)).fetchall()
@@ -0,0 +1,28 @@
+import orjson
+from fastapi.responses import JSONResponse
+
+# Column names of the last cursor seen by dict_row. Cursors keep the same description tuple for
+# every row of a result, so the names are only rebuilt when a new query starts.
+_last_columns = (None, None)
+
+
+def dict_row(cursor, row):
+    # sqlite3 row factory that builds the response dict straight from the row; queries alias their
+    # columns to the response keys
+    global _last_columns
+    description, columns = _last_columns
+    if description is not cursor.description:
+        description = cursor.description
+        columns = [column[0] for column in description]
+        _last_columns = (description, columns)
+    return dict(zip(columns, row))
+
+
+def encode_json(content):
+    return orjson.dumps(content)
+
+
+class ORJSONResponse(JSONResponse):
+    # Encodes with orjson; routes return this directly so FastAPI skips jsonable_encoder
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
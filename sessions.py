@@ -0,0 +1,69 @@
+import secrets
+import sqlite3
+import threading
+import time
+
+
+def get_secret(conn: sqlite3.Connection):
+    return conn.execute("SELECT secret FROM auth_secret WHERE id = 1").fetchone()[0]
+
+
+class SessionStore:
+    # Sessions live in SQLite so every worker sees them. Token checks only consult an in-memory copy
+    # of the revoked session ids, which each worker refreshes from the table in the background.
+    def __init__(self):
+        self._revoked = {}
+        self._lock = threading.Lock()
+
+    def create(self, conn: sqlite3.Connection, username: str, ttl: int):
+        session_id = secrets.token_urlsafe(16)
+        now = int(time.time())
+        conn.execute(
+            "INSERT INTO sessions (id, username, created_at, expires_at) VALUES (?, ?, ?, ?)",
+            (session_id, username, now, now + ttl)
+        )
+        conn.commit()
+        return session_id, now, now + ttl
+
+    def revoke(self, conn: sqlite3.Connection, session_id: str):
+        cursor = conn.execute(
+            "UPDATE sessions SET revoked_at = ? WHERE id = ? AND revoked_at IS NULL RETURNING expires_at",
+            (int(time.time()), session_id)
+        )
+        row = cursor.fetchone()
+        conn.commit()
+        if row:
+            with self._lock:
+                self._revoked[session_id] = row[0]
+        return row is not None
+
+    def revoke_user(self, conn: sqlite3.Connection, username: str):
+        rows = conn.execute(
+            "UPDATE sessions SET revoked_at = ? WHERE username = ? AND revoked_at IS NULL RETURNING id, expires_at",
+            (int(time.time()), username)
+        ).fetchall()
+        conn.commit()
+        with self._lock:
+            self._revoked.update(rows)
+        return len(rows)
+
+    def refresh(self, conn: sqlite3.Connection):
+        # Pick up sessions revoked by other workers and forget the ones that have expired anyway.
+        # Revocations are never undone, so local entries are kept even if they raced this read.
+        now = int(time.time())
+        revoked = dict(conn.execute(
+            "SELECT id, expires_at FROM sessions WHERE revoked_at IS NOT NULL AND expires_at > ?", (now,)
+        ).fetchall())
+        with self._lock:
+            revoked.update((key, expires_at) for key, expires_at in self._revoked.items() if expires_at > now)
+            self._revoked = revoked
+        # Only take the write lock when there is something to delete
+        if conn.execute("SELECT 1 FROM sessions WHERE expires_at <= ? LIMIT 1", (now,)).fetchone():
+            conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+            conn.commit()
+
+    def is_revoked(self, session_id: str):
+        return session_id in self._revoked
+
+    def snapshot(self):
+        return {"revoked": len(self._revoked)}
@@ -0,0 +1,206 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+
+import numpy as np
+
+# "Companies like X": cosine similarity over two feature sets, blended per query.
+#   - metric vectors: the twelve metric columns, log-scaled, standardized and L2-normalized
+#   - text vectors: TF-IDF of description_short, L2-normalized
+# The TF-IDF matrix is kept as plain CSR (company -> terms) and CSC (term -> companies) index
+# arrays, so scoring one company only touches the postings of its own terms.
+
+METRICS = [
+    'people_count', 'senior_people_count', 'emails_count', 'personal_emails_count', 'phones_count',
+    'addresses_count', 'investors_count', 'clients_count', 'partners_count', 'changes_count',
+    'people_changes_count', 'contact_changes_count',
+]
+
+TOKEN = re.compile(r"[^\W\d_]{3,}", re.UNICODE)
+STOP_WORDS = frozenset("""
+    and the for with our are you your from that this have has all can will their they was were been
+    its also more than into over such other which who what when where how not but any each most
+    only very just about out off one two new may way get use used using well
+""".split())
+
+# Terms in more than this share of companies say little about similarity and have huge postings
+MAX_DOCUMENT_FREQUENCY = 0.1
+MAX_TERMS_PER_COMPANY = 24
+BATCH_SIZE = 16
+
+
+def tokenize(text: str):
+    return [token for token in TOKEN.findall((text or "").lower()) if token not in STOP_WORDS]
+
+
+def metric_vectors(values):
+    # values: (rows, metrics) float array with NaN for NULL
+    scaled = np.log1p(np.nan_to_num(np.asarray(values, dtype=np.float64), nan=0.0).clip(min=0))
+    std = scaled.std(axis=0)
+    scaled = (scaled - scaled.mean(axis=0)) / np.where(std > 0, std, 1.0)
+    norms = np.linalg.norm(scaled, axis=1, keepdims=True)
+    return (scaled / np.where(norms > 0, norms, 1.0)).astype(np.float32)
+
+
+def tfidf(descriptions):
+    # Returns CSR arrays (indptr, terms, weights) over a vocabulary of terms that occur in at least
+    # two companies and in no more than MAX_DOCUMENT_FREQUENCY of them
+    documents = [Counter(tokenize(text)) for text in descriptions]
+    frequency = Counter(term for document in documents for term in document)
+    limit = max(2, int(len(documents) * MAX_DOCUMENT_FREQUENCY))
+    vocabulary = {term: i for i, term in enumerate(sorted(t for t, df in frequency.items() if 2 <= df <= limit))}
+    idf = {term: math.log((1 + len(documents)) / (1 + frequency[term])) + 1 for term in vocabulary}
+
+    indptr = np.zeros(len(documents) + 1, dtype=np.int64)
+    terms = []
+    weights = []
+    for row, document in enumerate(documents):
+        scored = sorted(
+            ((vocabulary[term], (1 + math.log(count)) * idf[term]) for term, count in document.items() if term in vocabulary),
+            key=lambda item: -item[1]
+        )[:MAX_TERMS_PER_COMPANY]
+        norm = math.sqrt(sum(weight * weight for _, weight in scored)) or 1.0
+        for term, weight in sorted(scored):
+            terms.append(term)
+            weights.append(weight / norm)
+        indptr[row + 1] = len(terms)
+    return indptr, np.array(terms, dtype=np.int32), np.array(weights, dtype=np.float32), len(vocabulary)
+
+
+def transpose(indptr, terms, weights, vocabulary_size: int):
+    # CSR -> CSC: for every term, the companies that contain it and their weights
+    rows = np.repeat(np.arange(len(indptr) - 1, dtype=np.int32), np.diff(indptr))
+    order = np.argsort(terms, kind="stable")
+    term_indptr = np.zeros(vocabulary_size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(terms, minlength=vocabulary_size), out=term_indptr[1:])
+    return term_indptr, rows[order], weights[order]
+
+
+class SimilarityIndex:
+    ARRAYS = ['ids', 'metrics', 'indptr', 'terms', 'weights', 'term_indptr', 'term_rows', 'term_weights']
+
+    def __init__(self, version: int, **arrays):
+        self.version = version
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+        self.rows = len(self.ids)
+
+    @classmethod
+    def from_rows(cls, version: int, ids, values, descriptions):
+        # ids must be sorted ascending; values and descriptions follow the same order
+        indptr, terms, weights, vocabulary_size = tfidf(descriptions)
+        term_indptr, term_rows, term_weights = transpose(indptr, terms, weights, vocabulary_size)
+        return cls(version, ids=np.asarray(ids, dtype=np.int64), metrics=metric_vectors(values), indptr=indptr,
+                   terms=terms, weights=weights, term_indptr=term_indptr, term_rows=term_rows,
+                   term_weights=term_weights)
+
+    @classmethod
+    def build(cls, conn: sqlite3.Connection, version: int):
+        ids = []
+        values = []
+        descriptions = []
+        for row in conn.execute(f"SELECT id, description_short, {', '.join(METRICS)} FROM company_profile ORDER BY id"):
+            ids.append(row[0])
+            descriptions.append(row[1])
+            values.append(row[2:])
+        return cls.from_rows(version, ids, np.array(values, dtype=np.float64).reshape(len(ids), len(METRICS)),
+                             descriptions)
+
+    def save(self, path: str):
+        # Written next to the final path and renamed, so readers only ever see a complete file
+        temporary = path + ".tmp"
+        with open(temporary, "wb") as file:
+            np.savez(file, version=np.int64(self.version), **{name: getattr(self, name) for name in self.ARRAYS})
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path) as data:
+            return cls(int(data["version"]), **{name: data[name] for name in cls.ARRAYS})
+
+    def text_similarity(self, row: int, others):
+        # Exact TF-IDF cosine between one row and a few others; each row's terms are sorted
+        terms = self.terms[self.indptr[row]:self.indptr[row + 1]]
+        weights = self.weights[self.indptr[row]:self.indptr[row + 1]]
+        result = []
+        for other in others:
+            start, end = self.indptr[other], self.indptr[other + 1]
+            _, mine, theirs = np.intersect1d(terms, self.terms[start:end], assume_unique=True, return_indices=True)
+            result.append(float(np.dot(weights[mine], self.weights[start:end][theirs])))
+        return result
+
+    def similar_rows(self, rows, k: int, metric_weight: float):
+        # Top-k neighbours of each row, scored metric_weight * metric cosine + (1 - metric_weight) *
+        # text cosine. Metric cosines for a batch of rows come from one matrix product; the text part
+        # is added in place from the postings of the row's own terms, so each query makes only a few
+        # passes over float32 arrays of all companies.
+        results = []
+        count = min(k, self.rows - 1)
+        for batch_start in range(0, len(rows), BATCH_SIZE):
+            batch = np.asarray(rows[batch_start:batch_start + BATCH_SIZE])
+            batch_scores = self.metrics[batch] @ self.metrics.T
+            batch_scores *= np.float32(metric_weight)
+            for row, scores in zip(batch, batch_scores):
+                for term, weight in zip(self.terms[self.indptr[row]:self.indptr[row + 1]],
+                                        self.weights[self.indptr[row]:self.indptr[row + 1]]):
+                    start, end = self.term_indptr[term], self.term_indptr[term + 1]
+                    np.add.at(scores, self.term_rows[start:end],
+                              self.term_weights[start:end] * np.float32((1 - metric_weight) * weight))
+                scores[row] = -np.inf
+                if count <= 0:
+                    results.append([])
+                    continue
+                top = np.argpartition(scores, self.rows - count)[self.rows - count:]
+                top = top[np.argsort(-scores[top], kind="stable")]
+                metric_score = self.metrics[top] @ self.metrics[row]
+                text_score = self.text_similarity(row, top)
+                results.append([
+                    (int(self.ids[j]), float(scores[j]), float(metric_score[i]), text_score[i])
+                    for i, j in enumerate(top)
+                ])
+        return results
+
+    def row_of(self, company_id: int):
+        row = int(np.searchsorted(self.ids, company_id))
+        return row if row < self.rows and self.ids[row] == company_id else None
+
+    def nbytes(self):
+        return int(sum(getattr(self, name).nbytes for name in self.ARRAYS))
+
+
+def index_path(database_path: str):
+    return database_path + ".similar.npz"
+
+
+class SimilarityStore:
+    # Current index for the API. Loads the file the importer wrote for this dataset version, or
+    # builds the index from the database when the file is missing or belongs to another version.
+    def __init__(self, path: str):
+        self.path = path
+        self.index = None
+        self._lock = threading.Lock()
+
+    @property
+    def version(self):
+        return self.index.version if self.index else None
+
+    def load(self, conn: sqlite3.Connection, version: int):
+        with self._lock:
+            if self.version == version:
+                return False
+            index = None
+            if os.path.exists(self.path):
+                index = SimilarityIndex.load(self.path)
+                if index.version != version:
+                    index = None
+            self.index = index or SimilarityIndex.build(conn, version)
+            return True
+
+    def snapshot(self):
+        index = self.index
+        if index is None:
+            return {"loaded": False}
+        return {"loaded": True, "version": index.version, "rows": index.rows, "bytes": index.nbytes()}
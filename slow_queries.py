@@ -0,0 +1,103 @@
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+
+import config
+import migrations
+
+# Statements on these tables carry password hashes and session ids; their parameters are never kept
+REDACTED_TABLES = re.compile(r"\b(Users|sessions|auth_secret)\b", re.IGNORECASE)
+MAX_PARAMS = 20
+MAX_PARAM_LENGTH = 100
+
+
+def explain(conn: sqlite3.Connection, sql: str, params):
+    # A plain cursor, so the EXPLAIN itself is neither timed nor logged
+    try:
+        cursor = conn.cursor(sqlite3.Cursor)
+        cursor.row_factory = None
+        return [row[3] for row in cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+    except sqlite3.Error as e:
+        return [f"EXPLAIN failed: {e}"]
+
+
+def format_params(sql: str, params):
+    if REDACTED_TABLES.search(sql):
+        return "<redacted>"
+    if isinstance(params, dict):
+        params = list(params.values())
+    result = []
+    for value in list(params)[:MAX_PARAMS]:
+        text = repr(value)
+        result.append(text if len(text) <= MAX_PARAM_LENGTH else text[:MAX_PARAM_LENGTH] + "...")
+    if len(params) > MAX_PARAMS:
+        result.append(f"... {len(params) - MAX_PARAMS} more")
+    return result
+
+
+class SlowQueryLog:
+    # Statements whose execute plus fetch time reached threshold_ms. Each one is printed with its
+    # parameters and query plan, kept in a short list of recent entries, and aggregated per normalized
+    # statement so the worst offenders can be listed. threshold_ms <= 0 disables the log.
+    def __init__(self, threshold_ms: float = config.slow_query_ms, max_statements: int = config.slow_query_max_statements,
+                 recent: int = config.slow_query_recent):
+        self.threshold = threshold_ms / 1000 if threshold_ms > 0 else None
+        self.threshold_ms = threshold_ms
+        self.max_statements = max_statements
+        self.recent = deque(maxlen=recent)
+        self.statements = {}
+        self._lock = threading.Lock()
+
+    def record(self, conn: sqlite3.Connection, statement: str, sql: str, params, seconds: float, rows: int):
+        plan = explain(conn, sql, params) if params is not None else []
+        entry = {
+            "at": time.time(),
+            "duration_ms": round(seconds * 1000, 3),
+            "rows": rows,
+            "statement": statement,
+            "params": format_params(sql, params) if params is not None else "<executemany>",
+            "plan": plan,
+            "full_scans": migrations.scan_lines(plan),
+        }
+        print(f"Slow query ({entry['duration_ms']} ms, {rows} rows): {statement} params={entry['params']} "
+              f"plan={' | '.join(plan)}")
+        with self._lock:
+            self.recent.append(entry)
+            stats = self.statements.get(statement)
+            if stats is None:
+                if len(self.statements) >= self.max_statements:
+                    # Make room by dropping the statement with the least total time
+                    del self.statements[min(self.statements, key=lambda key: self.statements[key]["total_ms"])]
+                stats = self.statements[statement] = {"statement": statement, "count": 0, "total_ms": 0.0,
+                                                      "max_ms": 0.0, "rows": 0}
+            stats["count"] += 1
+            stats["total_ms"] += entry["duration_ms"]
+            stats["rows"] += rows
+            stats["last_at"] = entry["at"]
+            stats["full_scans"] = entry["full_scans"]
+            if entry["duration_ms"] >= stats["max_ms"]:
+                stats["max_ms"] = entry["duration_ms"]
+                stats["worst"] = entry
+
+    def worst(self, order: str = "total_ms", limit: int = 20):
+        with self._lock:
+            statements = [dict(stats, mean_ms=round(stats["total_ms"] / stats["count"], 3)) for stats in self.statements.values()]
+            recent = list(self.recent)
+        statements.sort(key=lambda stats: -stats[order])
+        for stats in statements:
+            stats["total_ms"] = round(stats["total_ms"], 3)
+        return {
+            "threshold_ms": self.threshold_ms,
+            "statements": statements[:limit],
+            "recent": recent[-limit:][::-1],
+        }
+
+    def reset(self):
+        with self._lock:
+            self.recent.clear()
+            self.statements.clear()
+
+
+slow_query_log = SlowQueryLog()
@@ -0,0 +1,242 @@
+import mmap
+import os
+import shutil
+import sqlite3
+import struct
+import threading
+
+import numpy as np
+
+from company_profile import COLUMNS, FLAG_COLUMNS, METRIC_COLUMNS, P, TEXT_COLUMNS
+
+# Read-only company store written by the importer next to the database and memory-mapped by every
+# API worker, so all workers share one copy of the pages through the OS page cache.
+#
+# Layout (little endian, every section starts on a 64-byte boundary):
+#   header   magic, dataset version, rows, metric item size, heap size
+#   ids      int64[rows], ascending
+#   metrics  int32 or int64[rows, 12], NULL stored as the type's minimum
+#   flags    uint16[rows], bit i = has_* column i, bit 8 + j = text column j is NULL
+#   offsets  uint64[rows * 4 + 1], start of each text value in the heap
+#   heap     UTF-8 text of url, name, website and description_short for every row in turn
+
+MAGIC = b"CSNAP001"
+HEADER = struct.Struct("<8sqqqq")
+ALIGN = 64
+TEXT_NULL_BIT = 8
+BATCH_SIZE = 50000
+
+
+def snapshot_path(database_path: str, version: int):
+    # One file per dataset version. A new snapshot never replaces a file a worker may have mapped,
+    # which Windows refuses to do.
+    return f"{database_path}.snapshot.{version}"
+
+
+def snapshot_files(database_path: str):
+    # (version, path) of every snapshot written for the database, oldest first
+    directory, prefix = os.path.split(os.path.abspath(database_path + ".snapshot."))
+    files = []
+    for name in os.listdir(directory):
+        suffix = name[len(prefix):]
+        if name.startswith(prefix) and suffix.isdigit():
+            files.append((int(suffix), os.path.join(directory, name)))
+    return sorted(files)
+
+
+def remove_older(database_path: str, version: int):
+    # Deletes the snapshots of versions before `version`. A file some worker still maps cannot be
+    # deleted on Windows; it is left for a later call. Returns how many were left.
+    left = 0
+    for file_version, path in snapshot_files(database_path):
+        if file_version >= version:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            left += 1
+    return left
+
+
+def _align(position: int):
+    return -(-position // ALIGN) * ALIGN
+
+
+def layout(rows: int, metric_itemsize: int, heap_bytes: int):
+    # section -> (offset, dtype, shape)
+    metric_dtype = np.dtype(np.int32 if metric_itemsize == 4 else np.int64)
+    sections = {}
+    position = _align(HEADER.size)
+    for name, dtype, shape in (
+        ('ids', np.dtype(np.int64), (rows,)),
+        ('metrics', metric_dtype, (rows, len(METRIC_COLUMNS))),
+        ('flags', np.dtype(np.uint16), (rows,)),
+        ('offsets', np.dtype(np.uint64), (rows * len(TEXT_COLUMNS) + 1,)),
+        ('heap', np.dtype(np.uint8), (heap_bytes,)),
+    ):
+        sections[name] = (position, dtype, shape)
+        position = _align(position + dtype.itemsize * int(np.prod(shape)))
+    return sections
+
+
+def write(conn: sqlite3.Connection, version: int, path: str):
+    # Built from company_profile in id order. Text goes to a spool file first, so memory use is
+    # the fixed-width arrays only. The finished file is renamed into place, so workers only ever
+    # map a complete snapshot.
+    rows = conn.execute("SELECT COUNT(*) FROM company_profile").fetchone()[0]
+    bounds = conn.execute(
+        "SELECT " + ", ".join(f"MIN({column}), MAX({column})" for column in METRIC_COLUMNS) + " FROM company_profile"
+    ).fetchone()
+    int32 = np.iinfo(np.int32)
+    metric_dtype = np.int32 if all(value is None or int32.min < value <= int32.max for value in bounds) else np.int64
+    null = np.iinfo(metric_dtype).min
+
+    ids = np.empty(rows, dtype=np.int64)
+    metrics = np.empty((rows, len(METRIC_COLUMNS)), dtype=metric_dtype)
+    flags = np.zeros(rows, dtype=np.uint16)
+    offsets = np.zeros(rows * len(TEXT_COLUMNS) + 1, dtype=np.uint64)
+
+    metric_positions = [P[column] for column in METRIC_COLUMNS]
+    flag_positions = [P[column] for column in FLAG_COLUMNS]
+    text_positions = [P[column] for column in TEXT_COLUMNS]
+    heap_path = path + ".heap.tmp"
+    temporary = path + ".tmp"
+    try:
+        heap_bytes = 0
+        with open(heap_path, "wb") as heap:
+            cursor = conn.execute(f"SELECT {', '.join(COLUMNS)} FROM company_profile ORDER BY id")
+            start = 0
+            while True:
+                batch = cursor.fetchmany(BATCH_SIZE)
+                if not batch:
+                    break
+                end = start + len(batch)
+                ids[start:end] = [row[0] for row in batch]
+                metrics[start:end] = [[null if row[i] is None else row[i] for i in metric_positions] for row in batch]
+                row_flags = np.zeros(len(batch), dtype=np.uint16)
+                for bit, i in enumerate(flag_positions):
+                    row_flags |= np.array([bool(row[i]) for row in batch], dtype=np.uint16) << bit
+                for bit, i in enumerate(text_positions):
+                    row_flags |= np.array([row[i] is None for row in batch], dtype=np.uint16) << (TEXT_NULL_BIT + bit)
+                encoded = [(row[i] or "").encode("utf-8") for row in batch for i in text_positions]
+                flags[start:end] = row_flags
+                lengths = np.fromiter((len(text) for text in encoded), dtype=np.uint64, count=len(encoded))
+                first = start * len(TEXT_COLUMNS)
+                offsets[first + 1:first + 1 + len(encoded)] = heap_bytes + np.cumsum(lengths)
+                heap.write(b"".join(encoded))
+                heap_bytes += int(lengths.sum())
+                start = end
+        if start != rows:
+            raise sqlite3.DatabaseError(f"company_profile changed while writing the snapshot ({start} of {rows} rows)")
+
+        sections = layout(rows, np.dtype(metric_dtype).itemsize, heap_bytes)
+        with open(temporary, "wb") as file:
+            file.write(HEADER.pack(MAGIC, version, rows, np.dtype(metric_dtype).itemsize, heap_bytes))
+            for name, array in (('ids', ids), ('metrics', metrics), ('flags', flags), ('offsets', offsets)):
+                file.seek(sections[name][0])
+                file.write(array.tobytes())
+            file.seek(sections['heap'][0])
+            with open(heap_path, "rb") as heap:
+                shutil.copyfileobj(heap, file, 16 * 1024 * 1024)
+            file.truncate()
+        os.replace(temporary, path)
+    finally:
+        for leftover in (heap_path, temporary):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    return rows
+
+
+def read_version(path: str):
+    with open(path, "rb") as file:
+        magic, version, *_ = HEADER.unpack(file.read(HEADER.size))
+    return version if magic == MAGIC else None
+
+
+class Snapshot:
+    def __init__(self, path: str):
+        with open(path, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.version, self.rows, metric_itemsize, heap_bytes = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a company snapshot")
+        for name, (offset, dtype, shape) in layout(self.rows, metric_itemsize, heap_bytes).items():
+            count = int(np.prod(shape))
+            setattr(self, name, np.frombuffer(self._mmap, dtype=dtype, count=count, offset=offset).reshape(shape))
+        self.null = np.iinfo(self.metrics.dtype).min
+        self.nbytes = len(self._mmap)
+
+    def row_of(self, company_id: int):
+        row = int(np.searchsorted(self.ids, company_id))
+        return row if row < self.rows and self.ids[row] == company_id else None
+
+    def record(self, row: int):
+        # One profile row in COLUMNS order, the same tuple SQLite returns for company_profile
+        flags = int(self.flags[row])
+        first = row * len(TEXT_COLUMNS)
+        bounds = self.offsets[first:first + len(TEXT_COLUMNS) + 1].tolist()
+        values = [None] * len(COLUMNS)
+        values[0] = int(self.ids[row])
+        for j, column in enumerate(TEXT_COLUMNS):
+            if not flags >> (TEXT_NULL_BIT + j) & 1:
+                values[P[column]] = self.heap[bounds[j]:bounds[j + 1]].tobytes().decode("utf-8")
+        for i, column in enumerate(FLAG_COLUMNS):
+            values[P[column]] = flags >> i & 1
+        for column, value in zip(METRIC_COLUMNS, self.metrics[row].tolist()):
+            values[P[column]] = None if value == self.null else value
+        return tuple(values)
+
+    def get(self, company_id: int):
+        row = self.row_of(company_id)
+        return None if row is None else self.record(row)
+
+
+class SnapshotStore:
+    # Current snapshot for the API. A new file is mapped and swapped in when the dataset version
+    # changes; requests already holding the old snapshot keep reading it until they finish, and the
+    # old mapping is released with the last reference. Without a snapshot for the current dataset
+    # version, current is None and the routes read SQLite.
+    def __init__(self, database_path: str):
+        self.database_path = database_path
+        self.current = None
+        self.checked_version = None
+        self.stale = False
+        self._lock = threading.Lock()
+
+    @property
+    def version(self):
+        return self.current.version if self.current else None
+
+    def load(self, version: int):
+        with self._lock:
+            if self.checked_version == version:
+                return False
+            current = None
+            # The newest file not ahead of the dataset: the importer writes the next version's
+            # file before committing it
+            files = [path for file_version, path in snapshot_files(self.database_path) if file_version <= version]
+            try:
+                if files and read_version(files[-1]) == version:
+                    current = Snapshot(files[-1])
+            except FileNotFoundError:
+                # Removed by a newer import since the dataset version was read
+                pass
+            self.current = current
+            self.checked_version = version
+            self.stale = True
+            return current is not None
+
+    def remove_stale(self):
+        # Once this worker maps the current version, older files are deleted. Other workers may
+        # still map them, and on Windows the delete then fails, so it is retried until it succeeds.
+        with self._lock:
+            if self.stale:
+                self.stale = remove_older(self.database_path, self.checked_version) > 0
+
+    def snapshot(self):
+        current = self.current
+        if current is None:
+            return {"loaded": False}
+        return {"loaded": True, "version": current.version, "rows": current.rows, "bytes": current.nbytes}